@@ -0,0 +1,221 @@
+"""
+Esecuzione headless di un portafoglio di siti (nessuna dipendenza da Streamlit o Plotly).
+
+Esempio:
+    python batch_cli.py siti.parquet risultati.parquet --chunk-size 200000 --jobs 8
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+from functools import lru_cache
+from typing import Any, Iterator, List, Optional
+
+import pandas as pd
+from joblib import Parallel, delayed
+
+from catalog import ChargerCatalog, load_catalog
+from performance import _chiavi_parametri, calculate_charging_point_performance_batch
+from result_store import ResultStore, scenario_keys
+
+DIMENSIONE_BLOCCO = 100_000
+
+
+def _leggi_blocchi(percorso: str, dimensione_blocco: int) -> Iterator[pd.DataFrame]:
+    """Legge il portafoglio a blocchi di righe, senza caricarlo tutto in memoria."""
+    if percorso.lower().endswith('.parquet'):
+        import pyarrow.parquet as pq # Dipendenza opzionale, solo per Parquet
+        for batch in pq.ParquetFile(percorso, memory_map=True).iter_batches(batch_size=dimensione_blocco):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(percorso, chunksize=dimensione_blocco)
+
+
+class _ScrittoreRisultati:
+    """Scrive i risultati in modo incrementale su CSV o Parquet."""
+
+    def __init__(self, percorso: str):
+        self.percorso = percorso
+        self.parquet = percorso.lower().endswith('.parquet')
+        self._writer = None
+        self._primo = True
+
+    def scrivi(self, df: pd.DataFrame) -> None:
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            tabella = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.percorso, tabella.schema)
+            self._writer.write_table(tabella)
+        else:
+            df.to_csv(self.percorso, mode='w' if self._primo else 'a', header=self._primo, index=False)
+        self._primo = False
+
+    def chiudi(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+@lru_cache(maxsize=None)
+def _archivio(percorso: str) -> ResultStore:
+    """Una connessione all'archivio per processo worker."""
+    return ResultStore(percorso)
+
+
+def _impronta_file(percorso: Optional[str]) -> Optional[str]:
+    if percorso is None:
+        return None
+    h = hashlib.sha256()
+    with open(percorso, 'rb') as f:
+        for parte in iter(lambda: f.read(2**20), b''):
+            h.update(parte)
+    return h.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _catalogo(percorso: Optional[str]) -> Optional[ChargerCatalog]:
+    """Catalogo letto una sola volta per processo worker (None = catalogo di default)."""
+    return None if percorso is None else load_catalog(percorso)
+
+
+def _calcola(blocco: pd.DataFrame, profilo_domanda: Optional[str], profilo_prezzi: Optional[str], catalogo: Optional[str] = None) -> pd.DataFrame:
+    if profilo_domanda is not None:
+        from hourly import calculate_charging_point_performance_hourly_batch
+        return calculate_charging_point_performance_hourly_batch(blocco, profilo_domanda, profilo_prezzi, catalogo=_catalogo(catalogo))
+    return calculate_charging_point_performance_batch(blocco, _catalogo(catalogo))
+
+
+def _calcola_con_archivio(
+    blocco: pd.DataFrame,
+    profilo_domanda: Optional[str],
+    profilo_prezzi: Optional[str],
+    archivio: str,
+    motore: str,
+    opzioni: Any,
+    catalogo: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Legge dall'archivio le righe già calcolate e calcola (e salva) solo le mancanti.
+    Lettura e scrittura sono colonnari (record binari decodificati in blocco).
+    """
+    store = _archivio(archivio)
+    chiavi = scenario_keys(blocco, motore, opzioni, _catalogo(catalogo))
+    trovate, risultati = store.get_frame(chiavi)
+    if trovate.all():
+        risultati.index = blocco.index
+        return risultati
+    nuovi = _calcola(blocco[~trovate], profilo_domanda, profilo_prezzi, catalogo)
+    store.put_frame([k for k, t in zip(chiavi, trovate) if not t], nuovi)
+    if not trovate.any():
+        return nuovi
+    risultati.index = blocco.index[trovate]
+    return pd.concat([risultati[nuovi.columns], nuovi.set_axis(blocco.index[~trovate])]).loc[blocco.index]
+
+
+def _elabora_blocco(
+    blocco: pd.DataFrame,
+    colonne_passanti: Optional[List[str]],
+    profilo_domanda: Optional[str],
+    profilo_prezzi: Optional[str],
+    archivio: Optional[str] = None,
+    opzioni: Any = None,
+    catalogo: Optional[str] = None,
+) -> pd.DataFrame:
+    """Calcola un blocco nel processo worker e affianca le colonne identificative."""
+    if archivio is not None and profilo_domanda is not None:
+        # Solo la modalità oraria passa dall'archivio: il motore analitico vettoriale
+        # costa meno di un microsecondo per riga, meno della lettura di una voce SQLite.
+        # Il motore ha un nome proprio perché il formato (colonne energia_mese_XX)
+        # differisce da quello dell'interfaccia.
+        risultati = _calcola_con_archivio(blocco, profilo_domanda, profilo_prezzi, archivio, 'orario_batch', opzioni, catalogo)
+    else:
+        risultati = _calcola(blocco, profilo_domanda, profilo_prezzi, catalogo)
+    if colonne_passanti is None:
+        parametri = _chiavi_parametri(_catalogo(catalogo))
+        colonne_passanti = [c for c in blocco.columns if c not in parametri]
+    return pd.concat([blocco[colonne_passanti], risultati], axis=1)
+
+
+def run_portfolio(
+    input_path: str,
+    output_path: str,
+    dimensione_blocco: int = DIMENSIONE_BLOCCO,
+    n_jobs: int = -1,
+    colonne_passanti: Optional[List[str]] = None,
+    profilo_domanda: Optional[str] = None,
+    profilo_prezzi: Optional[str] = None,
+    verbose: bool = True,
+    archivio: Optional[str] = None,
+    catalogo: Optional[str] = None,
+) -> int:
+    """
+    Elabora il portafoglio a blocchi di dimensione fissa su un pool di processi
+    e scrive i risultati man mano, nell'ordine di input. La memoria resta
+    limitata: joblib distribuisce al massimo `2 * n_jobs` blocchi alla volta.
+    Con `archivio` (database di `result_store`) e la modalità oraria, i siti già
+    calcolati in altre esecuzioni non vengono ricalcolati; il motore analitico
+    ricalcola sempre, perché è più veloce di una lettura dall'archivio. `catalogo` è
+    il percorso di un catalogo di colonnine (vedi `catalog.py`) al posto di
+    quello di default: il portafoglio deve avere una colonna per ogni suo tipo.
+    Restituisce il numero di righe elaborate.
+    """
+    opzioni = None
+    if archivio is not None and profilo_domanda is not None:
+        ResultStore(archivio) # Crea lo schema prima di avviare i worker
+        # Le chiavi dipendono dal contenuto dei profili, non dal loro percorso
+        opzioni = {"domanda": _impronta_file(profilo_domanda), "prezzi": _impronta_file(profilo_prezzi)}
+    scrittore = _ScrittoreRisultati(output_path)
+    inizio = time.perf_counter()
+    righe = 0
+    try:
+        risultati = Parallel(n_jobs=n_jobs, return_as='generator', pre_dispatch='2*n_jobs')(
+            delayed(_elabora_blocco)(blocco, colonne_passanti, profilo_domanda, profilo_prezzi, archivio, opzioni, catalogo)
+            for blocco in _leggi_blocchi(input_path, dimensione_blocco)
+        )
+        for df in risultati:
+            scrittore.scrivi(df)
+            righe += len(df)
+            if verbose:
+                trascorso = time.perf_counter() - inizio
+                print(f"{righe:,} righe | {righe / trascorso:,.0f} righe/s", file=sys.stderr)
+    finally:
+        scrittore.chiudi()
+
+    if verbose:
+        trascorso = time.perf_counter() - inizio
+        print(f"Completato: {righe:,} righe in {trascorso:.1f} s ({righe / max(trascorso, 1e-9):,.0f} righe/s) -> {output_path}", file=sys.stderr)
+    return righe
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Calcolo batch del rendimento per un portafoglio di siti di ricarica.")
+    parser.add_argument('input', help="Portafoglio di siti (.csv o .parquet), una riga per sito con le chiavi di `params`.")
+    parser.add_argument('output', help="File dei risultati (.csv o .parquet).")
+    parser.add_argument('--chunk-size', type=int, default=DIMENSIONE_BLOCCO, help="Righe per blocco (default: %(default)s).")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help="Processi worker (default: numero di CPU).")
+    parser.add_argument('--keep-columns', nargs='*', default=None,
+                        help="Colonne di input da riportare nell'output (default: tutte quelle che non sono parametri).")
+    parser.add_argument('--demand-profile', default=None, help="Profilo orario della domanda (8760 righe): attiva la modalità oraria.")
+    parser.add_argument('--price-profile', default=None, help="Profilo orario del prezzo di acquisto (€/kWh), solo in modalità oraria.")
+    parser.add_argument('--catalog', default=None, help="Catalogo JSON delle colonnine (default: catalogs/default.json o AIJOSA_CATALOGO).")
+    parser.add_argument('--store', default=None,
+                        help="Archivio SQLite dei risultati (vedi result_store.py): in modalità oraria riusa i siti già calcolati e salva i nuovi.")
+    parser.add_argument('--quiet', action='store_true', help="Non stampare l'avanzamento.")
+    args = parser.parse_args(argv)
+
+    if args.price_profile and not args.demand_profile:
+        parser.error("--price-profile richiede --demand-profile")
+
+    run_portfolio(
+        args.input, args.output, args.chunk_size, args.jobs, args.keep_columns,
+        args.demand_profile, args.price_profile, verbose=not args.quiet, archivio=args.store, catalogo=args.catalog,
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    # I worker joblib devono trovare le funzioni (e le cache per processo) in `batch_cli`, non in `__main__`
+    import batch_cli
+    sys.exit(batch_cli.main())
@@ -0,0 +1,284 @@
+"""
+Suite di benchmark del motore di calcolo e dell'interfaccia Streamlit.
+
+Esempi:
+    python benchmarks/run_benchmarks.py run --output benchmarks/risultati.json
+    python benchmarks/run_benchmarks.py run --sizes 1 1000 --only batch scalare
+    python benchmarks/run_benchmarks.py compare benchmarks/baseline.json benchmarks/risultati.json --threshold 0.2
+
+`compare` termina con codice 1 se almeno un benchmark è più lento della
+baseline oltre la soglia relativa, così può bloccare un deploy in CI.
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+RADICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RADICE)
+
+from performance import PARAM_KEYS, TIPI_COLONNINE, calculate_charging_point_performance, calculate_charging_point_performance_batch  # noqa: E402
+
+SEED = 20240601
+DIMENSIONI = (1, 100, 10_000, 100_000, 1_000_000)
+MAX_RIGHE_SCALARE = 10_000 # Oltre, il ciclo scalare è solo lento e non informativo
+SOGLIA_REGRESSIONE = 0.20
+
+PARAMS_BASE = {
+    'num_auto_giorno': 50, 'kwh_per_auto': 30, 'tempo_ricarica_media': 2.0, 'tempo_turnover': 0.25,
+    'ore_disponibili': 8, 'giorni_attivi': 260, 'prezzo_vendita': 0.25, 'costo_acquisto_energia_kwh': 0.15,
+    'utilizzo_percentuale': 85, 'budget': 20000,
+    'ac_22': 2, 'dc_20': 0, 'dc_30': 0, 'dc_40': 0, 'dc_60': 0, 'dc_90': 0,
+    'costo_manutenzione_annuale': 500, 'costo_software_annuale': 1000, 'costo_assicurazione_annuale': 200,
+    'costo_terreno_annuale': 0, 'vita_utile_anni': 10,
+}
+
+
+def generate_scenarios(n: int, seed: int = SEED) -> pd.DataFrame:
+    """Scenari riproducibili negli intervalli dei widget dell'interfaccia."""
+    rng = np.random.default_rng([seed, n])
+    df = pd.DataFrame({
+        'num_auto_giorno': rng.integers(1, 1001, n),
+        'kwh_per_auto': rng.integers(1, 21, n) * 5,
+        'tempo_ricarica_media': rng.uniform(0.5, 12.0, n).round(1),
+        'tempo_turnover': rng.uniform(0.0, 1.0, n).round(2),
+        'ore_disponibili': rng.integers(1, 25, n),
+        'giorni_attivi': rng.integers(1, 366, n),
+        'prezzo_vendita': rng.uniform(0.10, 1.00, n).round(2),
+        'costo_acquisto_energia_kwh': rng.uniform(0.05, 0.50, n).round(2),
+        'utilizzo_percentuale': rng.integers(2, 21, n) * 5,
+        'budget': rng.integers(0, 501, n) * 1000,
+        'costo_manutenzione_annuale': rng.integers(0, 501, n) * 100,
+        'costo_software_annuale': rng.integers(0, 201, n) * 100,
+        'costo_assicurazione_annuale': rng.integers(0, 201, n) * 50,
+        'costo_terreno_annuale': rng.integers(0, 501, n) * 100,
+        'vita_utile_anni': rng.integers(1, 31, n),
+    })
+    for tipo in TIPI_COLONNINE:
+        df[tipo] = rng.integers(0, 51 if tipo == 'ac_22' else 21, n) * (rng.random(n) < 0.4)
+    return df[list(PARAM_KEYS)]
+
+
+def _misura(funzione: Callable[[], Any], ripetizioni: int, righe: int) -> Dict[str, Any]:
+    """Tempo (best/mediana su `ripetizioni`), throughput, picco di memoria e blocchi allocati."""
+    funzione() # Riscaldamento (import, cache dei profili, JIT di NumPy)
+    tempi = []
+    for _ in range(ripetizioni):
+        gc.collect()
+        inizio = time.perf_counter()
+        funzione()
+        tempi.append(time.perf_counter() - inizio)
+
+    # Memoria in un passaggio separato: tracemalloc rallenta l'esecuzione
+    gc.collect()
+    tracemalloc.start()
+    prima = tracemalloc.take_snapshot()
+    funzione()
+    dopo = tracemalloc.take_snapshot()
+    _, picco = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    differenze = dopo.compare_to(prima, 'filename')
+
+    mediana = statistics.median(tempi)
+    return {
+        'righe': righe,
+        'ripetizioni': ripetizioni,
+        'tempo_min_s': min(tempi),
+        'tempo_mediana_s': mediana,
+        'righe_al_s': righe / mediana if mediana > 0 else None,
+        'picco_memoria_mb': picco / 2**20,
+        'blocchi_allocati_netti': sum(d.count_diff for d in differenze),
+    }
+
+
+def _benchmark_motore(dimensioni: List[int], ripetizioni: int, selezionati: Optional[List[str]]) -> Dict[str, Dict[str, Any]]:
+    risultati: Dict[str, Dict[str, Any]] = {}
+
+    def attivo(nome: str) -> bool:
+        return not selezionati or nome in selezionati
+
+    for n in dimensioni:
+        scenari = generate_scenarios(n)
+        if attivo('scalare') and n <= MAX_RIGHE_SCALARE:
+            righe = scenari.to_dict(orient='records')
+            risultati[f"scalare/{n}"] = _misura(lambda: [calculate_charging_point_performance(r) for r in righe], ripetizioni, n)
+        if attivo('batch'):
+            risultati[f"batch/{n}"] = _misura(lambda: calculate_charging_point_performance_batch(scenari), ripetizioni, n)
+        if attivo('flussi_cassa') and n <= 100_000:
+            from cashflow import evaluate_cash_flows
+            risultati[f"flussi_cassa/{n}"] = _misura(lambda: evaluate_cash_flows(scenari, orizzonte_anni=20), ripetizioni, n)
+        if attivo('sensitivita') and n <= 100_000:
+            from sensitivity import sensitivity_analysis_batch
+            risultati[f"sensitivita/{n}"] = _misura(lambda: sensitivity_analysis_batch(scenari), ripetizioni, n)
+
+    if attivo('ottimizzatore'):
+        from optimizer import optimize_charger_mix
+        params = dict(PARAMS_BASE, budget=200_000, num_auto_giorno=300)
+        risultati['ottimizzatore/budget_200k'] = _misura(lambda: optimize_charger_mix(params, 'ROI', 10), ripetizioni, 1)
+    if attivo('pareto'):
+        from pareto import HARDWARE_CACHE, pareto_frontier
+        params = dict(PARAMS_BASE, budget=200_000, num_auto_giorno=300)
+        def frontiera_a_freddo():
+            HARDWARE_CACHE.clear()
+            return pareto_frontier(params)
+        risultati['pareto/budget_200k_freddo'] = _misura(frontiera_a_freddo, ripetizioni, 1)
+        # Solo un parametro finanziario cambia: lo spazio hardware resta in cache
+        prezzi = iter(np.linspace(0.2, 0.4, 10_000))
+        risultati['pareto/budget_200k_cambio_prezzo'] = _misura(lambda: pareto_frontier(dict(params, prezzo_vendita=next(prezzi))), ripetizioni, 1)
+    if attivo('monte_carlo'):
+        from montecarlo import run_monte_carlo
+        distribuzioni = {'num_auto_giorno': ('normal', 50, 10), 'prezzo_vendita': ('triangular', 0.2, 0.25, 0.35)}
+        risultati['monte_carlo/1M_seriale'] = _misura(lambda: run_monte_carlo(PARAMS_BASE, distribuzioni, 1_000_000, seed=1, n_jobs=1), ripetizioni, 1_000_000)
+        risultati['monte_carlo/1M_parallelo'] = _misura(lambda: run_monte_carlo(PARAMS_BASE, distribuzioni, 1_000_000, seed=1, n_jobs=-1), ripetizioni, 1_000_000)
+    if attivo('simulazione_coda'):
+        from queue_simulation import simulate_plug_queue, simulate_plug_queue_batch
+        risultati['simulazione_coda/365_giorni'] = _misura(lambda: simulate_plug_queue(PARAMS_BASE, giorni=365, seed=1), ripetizioni, 365)
+        siti = generate_scenarios(16).assign(num_auto_giorno=50, ac_22=2)
+        risultati['simulazione_coda/16_siti_parallelo'] = _misura(lambda: simulate_plug_queue_batch(siti, giorni=365, seed=1, n_jobs=-1), ripetizioni, 16)
+    if attivo('orario'):
+        from hourly import calculate_charging_point_performance_hourly_batch
+        ore = np.arange(8760) % 24
+        domanda = np.where((ore >= 8) & (ore < 22), 1.0, 0.0)
+        prezzi = np.where((ore >= 8) & (ore < 20), 0.22, 0.10)
+        siti = generate_scenarios(1000)
+        risultati['orario/1000_siti'] = _misura(lambda: calculate_charging_point_performance_hourly_batch(siti, domanda, prezzi), ripetizioni, 1000)
+    if attivo('rete'):
+        from grid_sharing import calculate_charging_point_performance_grid_batch, grid_cap_sweep
+        siti = generate_scenarios(5000)
+        risultati['rete/5000_siti'] = _misura(lambda: calculate_charging_point_performance_grid_batch(siti, 100.0), ripetizioni, 5000)
+        mix = pd.DataFrame([{'ac_22': a, 'dc_60': d} for a in range(11) for d in range(5)])
+        params = dict(PARAMS_BASE, num_auto_giorno=60, ore_disponibili=12)
+        risultati['rete/sweep_20_limiti_x_55_mix'] = _misura(lambda: grid_cap_sweep(params, np.arange(20, 420, 20), mix), ripetizioni, 1100)
+    if attivo('i18n'):
+        import i18n
+        from i18n import LINGUE, get_catalog
+        chiavi = list(i18n._leggi_catalogo(i18n.LINGUA_DEFAULT))
+        def carica():
+            i18n._CATALOGHI.clear()
+            for lingua in LINGUE:
+                get_catalog(lingua)
+        risultati['i18n/caricamento_cataloghi'] = _misura(carica, ripetizioni, len(LINGUE))
+        get_text = get_catalog('en').get
+        risultati['i18n/ricerche_100k'] = _misura(lambda: [get_text(k) for _ in range(100_000 // len(chiavi)) for k in chiavi], ripetizioni, 100_000 // len(chiavi) * len(chiavi))
+    if attivo('portafoglio'):
+        import tempfile
+        from batch_cli import run_portfolio
+        with tempfile.TemporaryDirectory() as cartella:
+            ingresso, uscita = os.path.join(cartella, 'siti.csv'), os.path.join(cartella, 'risultati.csv')
+            generate_scenarios(max(dimensioni)).to_csv(ingresso, index=False)
+            risultati[f"portafoglio_csv/{max(dimensioni)}"] = _misura(
+                lambda: run_portfolio(ingresso, uscita, n_jobs=-1, verbose=False), ripetizioni, max(dimensioni)
+            )
+    return risultati
+
+
+def _benchmark_streamlit(ripetizioni: int) -> Dict[str, Dict[str, Any]]:
+    """Rerun completo di main.py con AppTest, senza e con risultati in `st.session_state`."""
+    from streamlit.testing.v1 import AppTest
+    from ui_cache import canonical_hash
+
+    script = os.path.join(RADICE, 'main.py')
+    risultati_base = calculate_charging_point_performance(PARAMS_BASE)
+
+    def rerun_vuoto():
+        AppTest.from_file(script, default_timeout=120).run()
+
+    def rerun_con_risultati():
+        at = AppTest.from_file(script, default_timeout=120)
+        at.session_state['risultati_tab3'] = risultati_base
+        at.session_state['chiave_risultati_tab3'] = canonical_hash({'benchmark': PARAMS_BASE})
+        at.session_state['params_risultati_tab3'] = dict(PARAMS_BASE)
+        at.run()
+
+    return {
+        'streamlit/rerun_senza_risultati': _misura(rerun_vuoto, ripetizioni, 1),
+        'streamlit/rerun_con_risultati': _misura(rerun_con_risultati, ripetizioni, 1),
+    }
+
+
+def run(args: argparse.Namespace) -> int:
+    risultati = _benchmark_motore(args.sizes, args.repeat, args.only)
+    if not args.skip_streamlit and (not args.only or 'streamlit' in args.only):
+        risultati.update(_benchmark_streamlit(args.repeat))
+
+    rapporto = {
+        'meta': {
+            'data': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'piattaforma': platform.platform(),
+            'cpu': os.cpu_count(),
+            'seed': SEED,
+        },
+        'risultati': risultati,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(rapporto, f, indent=2)
+
+    for nome, r in risultati.items():
+        throughput = f"{r['righe_al_s']:>14,.0f} righe/s" if r['righe'] > 1 and r['righe_al_s'] else ''
+        print(f"{nome:<36} {r['tempo_mediana_s'] * 1000:>10.2f} ms {throughput}  picco {r['picco_memoria_mb']:.1f} MB")
+    print(f"Risultati salvati in {args.output}")
+    return 0
+
+
+def compare(args: argparse.Namespace) -> int:
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)['risultati']
+    with open(args.current, encoding='utf-8') as f:
+        attuale = json.load(f)['risultati']
+
+    regressioni = 0
+    for nome in sorted(set(baseline) & set(attuale)):
+        prima, dopo = baseline[nome]['tempo_mediana_s'], attuale[nome]['tempo_mediana_s']
+        variazione = (dopo - prima) / prima if prima > 0 else 0.0
+        regressione = variazione > args.threshold
+        regressioni += regressione
+        stato = 'REGRESSIONE' if regressione else 'ok'
+        print(f"{nome:<36} {prima * 1000:>10.2f} ms -> {dopo * 1000:>10.2f} ms  {variazione:+7.1%}  {stato}")
+    for nome in sorted(set(baseline) ^ set(attuale)):
+        print(f"{nome:<36} presente solo in {'baseline' if nome in baseline else 'risultati attuali'}")
+
+    if regressioni:
+        print(f"{regressioni} regressioni oltre la soglia del {args.threshold:.0%}")
+        return 1
+    print("Nessuna regressione.")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark del calcolatore di performance dei punti di ricarica.")
+    sotto = parser.add_subparsers(dest='comando', required=True)
+
+    p_run = sotto.add_parser('run', help="Esegue i benchmark e salva i risultati in JSON.")
+    p_run.add_argument('--output', default=os.path.join(RADICE, 'benchmarks', 'risultati.json'))
+    p_run.add_argument('--sizes', type=int, nargs='+', default=list(DIMENSIONI), help="Numero di scenari per i benchmark vettoriali.")
+    p_run.add_argument('--repeat', type=int, default=5, help="Ripetizioni cronometrate per benchmark (default: %(default)s).")
+    p_run.add_argument('--only', nargs='+', default=None,
+                       help="Sottoinsieme: scalare batch flussi_cassa sensitivita ottimizzatore pareto monte_carlo simulazione_coda orario rete i18n portafoglio streamlit.")
+    p_run.add_argument('--skip-streamlit', action='store_true', help="Salta i rerun con AppTest.")
+    p_run.set_defaults(funzione=run)
+
+    p_cmp = sotto.add_parser('compare', help="Confronta due file di risultati e segnala le regressioni.")
+    p_cmp.add_argument('baseline')
+    p_cmp.add_argument('current')
+    p_cmp.add_argument('--threshold', type=float, default=SOGLIA_REGRESSIONE, help="Rallentamento relativo tollerato (default: %(default)s).")
+    p_cmp.set_defaults(funzione=compare)
+
+    args = parser.parse_args(argv)
+    return args.funzione(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+from typing import Dict, Any, Union, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from performance import _colonne_scenari, capacity_limits
+
+# ==============================================================================
+# FLUSSI DI CASSA PLURIENNALI: VAN, TIR, PAYBACK ATTUALIZZATO
+#    Anno 0 = investimento; anni 1..N = flussi operativi (senza ammortamento,
+#    che non è un'uscita di cassa) con crescita della domanda, indicizzazione
+#    di prezzi e costi, degrado della potenza e sostituzione a fine vita.
+#    Tutto è vettorizzato su matrici (scenari x anni).
+# ==============================================================================
+
+TASSO_SCONTO = 0.07
+CRESCITA_DOMANDA = 0.0
+INDICIZZAZIONE_PREZZO = 0.0
+INDICIZZAZIONE_COSTO_ENERGIA = 0.0
+INDICIZZAZIONE_OPEX = 0.0
+DEGRADO_ANNUO = 0.0 # Perdita annua di potenza utile, azzerata alla sostituzione
+
+Ipotesi = Union[float, np.ndarray]
+
+
+def cash_flow_schedule(
+    colonne: Mapping[str, np.ndarray],
+    orizzonte_anni: Optional[int] = None,
+    crescita_domanda: Ipotesi = CRESCITA_DOMANDA,
+    indicizzazione_prezzo: Ipotesi = INDICIZZAZIONE_PREZZO,
+    indicizzazione_costo_energia: Ipotesi = INDICIZZAZIONE_COSTO_ENERGIA,
+    indicizzazione_opex: Ipotesi = INDICIZZAZIONE_OPEX,
+    degrado_annuo: Ipotesi = DEGRADO_ANNUO,
+) -> Dict[str, np.ndarray]:
+    """
+    Piano dei flussi anno per anno, matrici di forma (scenari, orizzonte + 1).
+
+    Senza `orizzonte_anni` ogni scenario si ferma alla propria `vita_utile_anni`
+    (gli anni successivi valgono zero). Con un orizzonte fisso, le colonnine
+    sono sostituite al CapEx iniziale alla fine di ogni vita utile che cade
+    prima dell'ultimo anno. Le ipotesi possono essere scalari o array per scenario.
+    """
+    c = capacity_limits(colonne)
+    p = colonne
+    vita = np.maximum(np.asarray(p['vita_utile_anni'], dtype=np.int64), 1)
+    orizzonte = int(vita.max()) if orizzonte_anni is None else int(orizzonte_anni)
+
+    anni = np.arange(orizzonte + 1)
+    t = anni[None, :] - 1 # Esponente di crescita: 0 nel primo anno operativo
+    def colonna(x: Ipotesi) -> np.ndarray:
+        return np.asarray(x, dtype=float).reshape(-1, 1) if np.ndim(x) else np.asarray(x, dtype=float)
+
+    attivo = anni[None, :] >= 1
+    if orizzonte_anni is None:
+        attivo = attivo & (anni[None, :] <= vita[:, None])
+    eta = np.where(attivo, (anni[None, :] - 1) % vita[:, None], 0) # Anni dall'ultima sostituzione
+
+    domanda = colonna(c['energia_richiesta_totale_giorno']) * (1 + colonna(crescita_domanda)) ** t
+    capacita_energia = colonna(c['energia_massima_capacita']) * (1 - colonna(degrado_annuo)) ** eta
+    energia_annua = np.minimum(np.minimum(domanda, capacita_energia), colonna(c['energia_massima_sessioni'])) * colonna(p['giorni_attivi'])
+    energia_annua = np.where(attivo, energia_annua, 0.0)
+
+    ricavi = energia_annua * colonna(p['prezzo_vendita']) * (1 + colonna(indicizzazione_prezzo)) ** t
+    costo_energia = energia_annua * colonna(p['costo_acquisto_energia_kwh']) * (1 + colonna(indicizzazione_costo_energia)) ** t
+    costi_fissi = colonna(
+        np.asarray(p['costo_manutenzione_annuale']) + p['costo_software_annuale'] +
+        p['costo_assicurazione_annuale'] + p['costo_terreno_annuale']
+    ) * (1 + colonna(indicizzazione_opex)) ** t
+    costi_fissi = np.where(attivo, costi_fissi, 0.0)
+
+    capex = colonna(c['costo_totale_investimento'])
+    sostituzione = (anni[None, :] % vita[:, None] == 0) & (anni[None, :] >= 1) & (anni[None, :] < orizzonte)
+    if orizzonte_anni is None:
+        sostituzione = np.zeros_like(sostituzione)
+    investimenti = np.where(anni[None, :] == 0, capex, 0.0) + np.where(sostituzione, capex, 0.0)
+
+    return {
+        'anni': anni,
+        'energia_annua': energia_annua,
+        'ricavi': ricavi,
+        'costo_energia': costo_energia,
+        'costi_fissi': costi_fissi,
+        'investimenti': investimenti,
+        'flussi': ricavi - costo_energia - costi_fissi - investimenti,
+    }
+
+
+def npv(flussi: np.ndarray, tasso: Ipotesi) -> np.ndarray:
+    """Valore attuale netto di ogni riga di `flussi` (anno 0 in colonna 0)."""
+    fattori = (1 + np.asarray(tasso, dtype=float).reshape(-1, 1)) ** -np.arange(flussi.shape[1])
+    return (flussi * fattori).sum(axis=1)
+
+
+def _van_horner(flussi: np.ndarray, r: np.ndarray):
+    """VAN e derivata dVAN/dr con lo schema di Horner in x = 1/(1+r): solo prodotti e somme."""
+    x = 1 / (1 + r)
+    van = np.zeros(flussi.shape[0])
+    derivata_x = np.zeros(flussi.shape[0])
+    for j in range(flussi.shape[1] - 1, -1, -1):
+        derivata_x = derivata_x * x + van
+        van = van * x + flussi[:, j]
+    return van, -derivata_x * x * x
+
+
+def irr(flussi: np.ndarray, tolleranza: float = 1e-9, max_iter: int = 50, iter_bisezione: int = 100) -> np.ndarray:
+    """
+    Tasso interno di rendimento vettorizzato sulle righe di `flussi`.
+
+    Newton-Raphson su tutte le righe insieme (partenza 10%); le righe che non
+    convergono o escono dall'intervallo [-99%, 1000%] passano a una bisezione
+    vettorizzata su quello stesso intervallo. NaN se i flussi non cambiano
+    segno o il VAN non cambia segno agli estremi.
+    """
+    flussi = np.asarray(flussi, dtype=float)
+    n = flussi.shape[0]
+    minimo, massimo = -0.99, 10.0
+
+    risultato = np.full(n, np.nan)
+    valido = (flussi > 0).any(axis=1) & (flussi < 0).any(axis=1)
+
+    # 1. Newton sulle sole righe ancora attive
+    indici = np.flatnonzero(valido)
+    r = np.full(indici.size, 0.1)
+    for _ in range(max_iter):
+        if not indici.size:
+            break
+        van, derivata = _van_horner(flussi[indici], r)
+        passo = np.divide(van, derivata, out=np.full_like(van, np.nan), where=derivata != 0)
+        nuovo = r - passo
+        fuori = ~np.isfinite(nuovo) | (nuovo <= minimo) | (nuovo >= massimo)
+        fatto = ~fuori & (np.abs(passo) <= tolleranza * np.maximum(1, np.abs(nuovo)))
+        risultato[indici[fatto]] = nuovo[fatto]
+        continua = ~(fuori | fatto)
+        indici, r = indici[continua], nuovo[continua]
+
+    # 2. Bisezione per le righe che Newton non ha risolto
+    residui = np.flatnonzero(valido & np.isnan(risultato))
+    if residui.size:
+        f = flussi[residui]
+        basso = np.full(residui.size, minimo)
+        alto = np.full(residui.size, massimo)
+        segno_basso = np.sign(_van_horner(f, basso)[0])
+        bracket = segno_basso != np.sign(_van_horner(f, alto)[0])
+        for _ in range(iter_bisezione):
+            medio = (basso + alto) / 2
+            stesso_segno = np.sign(_van_horner(f, medio)[0]) == segno_basso
+            basso = np.where(stesso_segno, medio, basso)
+            alto = np.where(stesso_segno, alto, medio)
+            if np.all(alto - basso < tolleranza):
+                break
+        risultato[residui] = np.where(bracket, (basso + alto) / 2, np.nan)
+    return risultato
+
+
+def discounted_payback(flussi: np.ndarray, tasso: Ipotesi) -> np.ndarray:
+    """
+    Anni necessari perché il flusso cumulato attualizzato torni non negativo,
+    con interpolazione lineare nell'anno di recupero; infinito se non accade.
+    """
+    fattori = (1 + np.asarray(tasso, dtype=float).reshape(-1, 1)) ** -np.arange(flussi.shape[1])
+    attualizzati = flussi * fattori
+    cumulato = np.cumsum(attualizzati, axis=1)
+    recuperato = cumulato >= 0
+    trovato = recuperato.any(axis=1)
+    anno = np.argmax(recuperato, axis=1)
+
+    righe = np.arange(flussi.shape[0])
+    precedente = cumulato[righe, np.maximum(anno - 1, 0)]
+    flusso_anno = attualizzati[righe, anno]
+    frazione = np.divide(-precedente, flusso_anno, out=np.zeros(flussi.shape[0]), where=(anno > 0) & (flusso_anno != 0))
+    return np.where(trovato, np.where(anno > 0, anno - 1 + frazione, 0.0), np.inf)
+
+
+def evaluate_cash_flows(
+    scenari: Union[pd.DataFrame, Mapping[str, Any]],
+    tasso_sconto: Ipotesi = TASSO_SCONTO,
+    orizzonte_anni: Optional[int] = None,
+    **ipotesi: Ipotesi,
+) -> Dict[str, np.ndarray]:
+    """
+    VAN, TIR e payback attualizzato per molti scenari in un unico passaggio.
+    `ipotesi` sono inoltrate a `cash_flow_schedule` (crescita_domanda,
+    indicizzazione_prezzo, indicizzazione_costo_energia, indicizzazione_opex,
+    degrado_annuo). Restituisce anche il piano completo dei flussi.
+    """
+    piano = cash_flow_schedule(_colonne_scenari(scenari), orizzonte_anni, **ipotesi)
+    flussi = piano['flussi']
+    return {
+        'VAN': npv(flussi, tasso_sconto),
+        'TIR': irr(flussi),
+        'payback_attualizzato': discounted_payback(flussi, tasso_sconto),
+        'piano': piano,
+    }
+
+
+def calculate_cash_flows(
+    params: Mapping[str, Union[int, float]],
+    tasso_sconto: float = TASSO_SCONTO,
+    orizzonte_anni: Optional[int] = None,
+    **ipotesi: float,
+) -> Dict[str, Any]:
+    """Versione per singolo scenario: indicatori scalari e piano dei flussi come DataFrame."""
+    risultati = evaluate_cash_flows(params, tasso_sconto, orizzonte_anni, **ipotesi)
+    piano = risultati['piano']
+    flussi = piano['flussi'][0]
+    fattori = (1 + tasso_sconto) ** -piano['anni']
+    return {
+        'VAN': float(risultati['VAN'][0]),
+        'TIR': float(risultati['TIR'][0]),
+        'payback_attualizzato': float(risultati['payback_attualizzato'][0]),
+        'piano': pd.DataFrame({
+            'anno': piano['anni'],
+            'energia_kwh': piano['energia_annua'][0],
+            'ricavi': piano['ricavi'][0],
+            'costo_energia': piano['costo_energia'][0],
+            'costi_fissi': piano['costi_fissi'][0],
+            'investimenti': piano['investimenti'][0],
+            'flusso_netto': flussi,
+            'flusso_attualizzato': flussi * fattori,
+            'flusso_cumulato_attualizzato': np.cumsum(flussi * fattori),
+        }),
+    }
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+# ==============================================================================
+# CATALOGO DELLE COLONNINE
+#    Un file JSON per catalogo in `catalogs/`, caricato in un array NumPy
+#    strutturato (una riga per tipo). CapEx, potenza e capacità si calcolano
+#    come prodotti scalari tra il vettore dei conteggi e le colonne del
+#    catalogo, quindi un tipo nuovo si aggiunge modificando solo il file.
+# ==============================================================================
+
+CARTELLA_CATALOGHI = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalogs')
+PERCORSO_DEFAULT = os.path.join(CARTELLA_CATALOGHI, 'default.json')
+INSTALLAZIONE_EUR_KW_DEFAULT = 150 # Stima 150€/kW, se il catalogo non la specifica
+
+# Curva di potenza: frazione della potenza di targa su una griglia regolare della
+# frazione di energia della sessione già erogata (0 = inizio, 1 = fine)
+PUNTI_CURVA = 11
+GRIGLIA_CURVA = np.linspace(0.0, 1.0, PUNTI_CURVA)
+
+DTYPE_CATALOGO = np.dtype([
+    ('tipo', 'U24'),
+    ('nome', 'U48'),
+    ('potenza_kw', 'f8'),
+    ('prezzo_eur', 'f8'),
+    ('installazione_eur_kw', 'f8'),
+    ('curva', 'f8', (PUNTI_CURVA,)),
+    ('fattore_potenza', 'f8'), # Potenza media della sessione / potenza di targa
+])
+
+_TIPO_VALIDO = re.compile(r'^[a-z][a-z0-9_]*$')
+
+
+def _fattore_medio(curva: np.ndarray) -> float:
+    """
+    Potenza media di una sessione in frazione della targa: media armonica della
+    curva lungo l'energia erogata (il tempo per kWh è 1 / potenza).
+    """
+    if (curva == 1.0).all():
+        return 1.0
+    punti = (np.arange(1000) + 0.5) / 1000
+    return float(1.0 / np.mean(1.0 / np.interp(punti, GRIGLIA_CURVA, curva)))
+
+
+class ChargerCatalog:
+    """
+    Catalogo di tipi di colonnina su array strutturato (`DTYPE_CATALOGO`).
+
+    Le colonne sono esposte come array allineati a `tipi`; `conteggi` costruisce
+    la matrice (scenari, tipi) da cui si ottengono CapEx e potenze con `@`.
+    """
+
+    def __init__(self, voci: np.ndarray):
+        voci = np.asarray(voci, dtype=DTYPE_CATALOGO)
+        self.voci = voci
+        self.tipi: Tuple[str, ...] = tuple(str(t) for t in voci['tipo'])
+        self.nomi: Dict[str, str] = dict(zip(self.tipi, (str(n) for n in voci['nome'])))
+        self.potenza_kw = voci['potenza_kw']
+        self.prezzo_eur = voci['prezzo_eur']
+        self.costo_installazione_eur = voci['potenza_kw'] * voci['installazione_eur_kw']
+        self.capex_unitario = self.prezzo_eur + self.costo_installazione_eur
+        self.potenza_effettiva_kw = voci['potenza_kw'] * voci['fattore_potenza']
+        self.con_curva = (voci['curva'] != 1.0).any(axis=1)
+        # Colonne per unità di ciascun tipo, in un'unica matrice (tipi, 4): un solo prodotto per scenario
+        self.per_unita = np.column_stack([self.potenza_kw, self.prezzo_eur, self.costo_installazione_eur, self.potenza_effettiva_kw])
+        # Stesse colonne in numeri Python (int se interi, come nel modello originale) per il calcolo scalare
+        self.per_unita_scalari: Tuple[Tuple[Any, ...], ...] = tuple(
+            tuple(int(x) if x.is_integer() else x for x in riga) for riga in self.per_unita.tolist()
+        )
+        self.con_curva_scalari: Tuple[bool, ...] = tuple(self.con_curva.tolist())
+        self.firma = hashlib.sha256(voci.dtype.str.encode() + voci.tobytes()).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.tipi)
+
+    def __contains__(self, tipo: str) -> bool:
+        return tipo in self.nomi
+
+    def conteggi(self, colonne: Mapping[str, Any]) -> np.ndarray:
+        """Matrice float dei conteggi (scenari, tipi) dalle colonne omonime dei tipi, nell'ordine del catalogo."""
+        if not self.tipi:
+            raise ValueError("Il catalogo non contiene colonnine.")
+        valori = [np.asarray(colonne[t]) for t in self.tipi]
+        matrice = np.empty(np.broadcast_shapes(*(v.shape for v in valori)) + (len(self.tipi),))
+        for i, v in enumerate(valori):
+            matrice[..., i] = v
+        return matrice
+
+
+def catalog_from_records(colonnine: Sequence[Mapping[str, Any]], installazione_eur_kw: float = INSTALLAZIONE_EUR_KW_DEFAULT) -> ChargerCatalog:
+    """
+    Costruisce un catalogo da una lista di dizionari con `tipo`, `potenza_kw`,
+    `prezzo_eur` e facoltativi `nome`, `installazione_eur_kw` (default del
+    catalogo) e `curva`: coppie [frazione di energia, frazione di potenza],
+    interpolate linearmente sulla griglia `GRIGLIA_CURVA`.
+    """
+    voci = np.zeros(len(colonnine), dtype=DTYPE_CATALOGO)
+    visti = set()
+    for i, c in enumerate(colonnine):
+        tipo = c['tipo']
+        if not _TIPO_VALIDO.match(tipo) or len(tipo) > DTYPE_CATALOGO['tipo'].itemsize // 4:
+            raise ValueError(f"Tipo di colonnina non valido: {tipo!r} (minuscole, cifre e '_')")
+        if tipo in visti:
+            raise ValueError(f"Tipo di colonnina duplicato: {tipo}")
+        visti.add(tipo)
+        if c['potenza_kw'] <= 0 or c['prezzo_eur'] < 0:
+            raise ValueError(f"Potenza e prezzo di {tipo} devono essere positivi.")
+
+        curva = np.ones(PUNTI_CURVA)
+        if c.get('curva'):
+            x, y = np.asarray(c['curva'], dtype=float).T
+            if (np.diff(x) <= 0).any() or x[0] < 0 or x[-1] > 1 or (y <= 0).any() or (y > 1).any():
+                raise ValueError(f"Curva di {tipo} non valida: frazioni di energia crescenti in [0, 1], potenze in (0, 1].")
+            curva = np.interp(GRIGLIA_CURVA, x, y)
+
+        voci[i] = (
+            tipo, c.get('nome', tipo), c['potenza_kw'], c['prezzo_eur'],
+            c.get('installazione_eur_kw', installazione_eur_kw), curva, _fattore_medio(curva),
+        )
+    return ChargerCatalog(voci)
+
+
+def load_catalog(percorso: str) -> ChargerCatalog:
+    """Legge un catalogo JSON: {"installazione_eur_kw": ..., "colonnine": [...]} (vedi `catalog_from_records`)."""
+    with open(percorso, encoding='utf-8') as f:
+        dati = json.load(f)
+    return catalog_from_records(dati['colonnine'], dati.get('installazione_eur_kw', INSTALLAZIONE_EUR_KW_DEFAULT))
+
+
+@lru_cache(maxsize=None)
+def default_catalog() -> ChargerCatalog:
+    """Catalogo del processo: `AIJOSA_CATALOGO` se impostata, altrimenti `catalogs/default.json`."""
+    return load_catalog(os.environ.get('AIJOSA_CATALOGO') or PERCORSO_DEFAULT)
+
+
+def resolve_catalog(catalogo: Optional[ChargerCatalog]) -> ChargerCatalog:
+    return default_catalog() if catalogo is None else catalogo
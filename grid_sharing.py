@@ -0,0 +1,342 @@
+import math
+from typing import Dict, Any, Union, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from catalog import ChargerCatalog, resolve_catalog
+from performance import (
+    RESULT_KEYS, _chiavi_parametri, _colonne_scenari, _dividi, capacity_limits, compute_performance_arrays,
+)
+from queue_simulation import horeca_profile
+
+# ==============================================================================
+# CONNESSIONE DI RETE LIMITATA E GESTIONE DINAMICA DEI CARICHI
+#    La potenza di targa delle colonnine supera spesso la potenza contrattuale
+#    del locale: ad ogni passo temporale la potenza disponibile è ripartita tra
+#    le sessioni attive (quota uguale o priorità per tipo di colonnina).
+#    Simulazione fluida a passi fissi su una giornata tipo, vettorizzata sugli
+#    scenari: le auto che arrivano nello stesso passo formano una coorte.
+# ==============================================================================
+
+PASSO_ORE = 0.25 # 15 minuti
+POLITICHE = ('equa', 'priorita')
+PROFILI_ARRIVO = ('uniforme', 'horeca')
+
+DIMENSIONE_BLOCCO = 2048 # Scenari per blocco: stato (passi, scenari, tipi) di pochi MB
+EPS = 1e-9
+
+RETE_KEYS = (
+    'potenza_connessione_kw', 'potenza_picco_kw', 'potenza_richiesta_picco_kw',
+    'auto_rifiutate', 'energia_non_erogata_giorno', 'utilizzo_connessione',
+)
+
+
+def _ordine_piu_veloci(catalogo: ChargerCatalog) -> list:
+    """Indici dei tipi del catalogo dal più veloce (potenza di targa) al più lento."""
+    return sorted(range(len(catalogo)), key=lambda i: -catalogo.potenza_kw[i])
+
+
+def _ripartizione_equa(attive: np.ndarray, potenza_max: np.ndarray, limite: np.ndarray, ordine: np.ndarray) -> np.ndarray:
+    """
+    Potenza per auto (scenari, tipi) con quota uguale (water-filling): ogni
+    sessione riceve min(potenza_max, livello), con il livello scelto in modo che
+    il totale sia pari al limite. I punti di rottura sono le potenze dei tipi,
+    nello stesso ordine (`ordine`, potenza crescente) per tutti gli scenari.
+    """
+    b = potenza_max[:, ordine]
+    n = attive[:, ordine]
+    # Totale erogato se il livello fosse pari a ciascun punto di rottura
+    sopra = np.cumsum(n[:, ::-1], axis=1)[:, ::-1] # Auto con potenza_max >= punto
+    totale_ai_punti = np.cumsum(n * b, axis=1) - n * b + b * sopra
+    richiesta = totale_ai_punti[:, -1]
+
+    indice = np.argmax(totale_ai_punti >= limite[:, None], axis=1)
+    righe = np.arange(b.shape[0])
+    b_prec = np.where(indice > 0, b[righe, np.maximum(indice - 1, 0)], 0.0)
+    totale_prec = np.where(indice > 0, totale_ai_punti[righe, np.maximum(indice - 1, 0)], 0.0)
+    livello = b_prec + _dividi(limite - totale_prec, sopra[righe, indice], sopra[righe, indice] > 0)
+    livello = np.where(richiesta <= limite, np.inf, livello)
+    return np.minimum(potenza_max, livello[:, None])
+
+
+def _ripartizione_priorita(attive: np.ndarray, potenza_max: np.ndarray, limite: np.ndarray, priorita: Sequence[int]) -> np.ndarray:
+    """Potenza per auto servendo i tipi (indici) nell'ordine di `priorita`; quota uguale all'interno del tipo."""
+    residuo = limite.astype(float).copy()
+    potenza = np.zeros_like(potenza_max)
+    for i in priorita:
+        richiesta = attive[:, i] * potenza_max[:, i]
+        assegnata = np.minimum(richiesta, residuo)
+        potenza[:, i] = _dividi(assegnata, attive[:, i], attive[:, i] > EPS)
+        residuo -= assegnata
+    return potenza
+
+
+def _arrivi_per_passo(colonne: Mapping[str, np.ndarray], passi: int, passo_ore: float, profilo_arrivi: str) -> np.ndarray:
+    """Auto in arrivo per passo (scenari, passi), distribuite sulla finestra operativa di ogni scenario."""
+    ore = np.asarray(colonne['ore_disponibili'], dtype=float)
+    inizio_passo = np.arange(passi) * passo_ore
+    aperto = inizio_passo[None, :] < ore[:, None] - EPS
+    if profilo_arrivi == 'uniforme':
+        pesi = aperto.astype(float)
+    else:
+        # Un profilo orario per ogni durata di apertura distinta (al massimo 24)
+        pesi = np.zeros((ore.shape[0], passi))
+        ora_passo = np.floor(inizio_passo + EPS).astype(np.int64)
+        for durata in np.unique(np.ceil(ore - EPS)).astype(np.int64):
+            if durata <= 0:
+                continue
+            righe = np.ceil(ore - EPS).astype(np.int64) == durata
+            profilo = horeca_profile(int(durata))
+            pesi[righe] = np.where(ora_passo < durata, profilo[np.minimum(ora_passo, durata - 1)], 0.0)[None, :] * aperto[righe]
+    pesi_totali = pesi.sum(axis=1, keepdims=True)
+    return _dividi(pesi * np.asarray(colonne['num_auto_giorno'], dtype=float)[:, None], pesi_totali, pesi_totali > 0)
+
+
+def simulate_grid_sharing(
+    colonne: Mapping[str, np.ndarray],
+    potenza_connessione_kw: Union[float, np.ndarray] = math.inf,
+    politica: str = 'equa',
+    priorita: Optional[Sequence[str]] = None,
+    profilo_arrivi: str = 'uniforme',
+    passo_ore: float = PASSO_ORE,
+    catalogo: Optional[ChargerCatalog] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Simula una giornata tipo con la potenza di rete limitata a
+    `potenza_connessione_kw` (scalare o array per scenario; `inf` = nessun limite).
+
+    Le auto occupano il posto libero più veloce (senza coda: se non ce n'è uno
+    libero l'auto è rifiutata), assorbono al massimo potenza di targa x
+    `utilizzo_percentuale` fino a ricevere `kwh_per_auto`, restano almeno
+    `tempo_ricarica_media` e liberano il posto dopo `tempo_turnover`. Alla
+    chiusura le sessioni incomplete si interrompono. Con la politica
+    `priorita` i tipi sono serviti nell'ordine di `priorita` (default: dal più
+    veloce). Restituisce array per
+    scenario (energia erogata, auto servite, picchi di potenza) e i profili
+    di potenza erogata e richiesta, di forma (scenari, passi).
+    """
+    if politica not in POLITICHE:
+        raise ValueError(f"Politica non supportata: {politica}. Ammesse: {', '.join(POLITICHE)}")
+    if profilo_arrivi not in PROFILI_ARRIVO:
+        raise ValueError(f"Profilo non supportato: {profilo_arrivi}. Ammessi: {', '.join(PROFILI_ARRIVO)}")
+
+    catalogo = resolve_catalog(catalogo)
+    p = {k: np.asarray(colonne[k], dtype=float) for k in _chiavi_parametri(catalogo)}
+    n_scenari = p['ore_disponibili'].shape[0]
+    limite = np.broadcast_to(np.asarray(potenza_connessione_kw, dtype=float), (n_scenari,)).copy()
+    passi = int(math.ceil(p['ore_disponibili'].max() / passo_ore - EPS)) if n_scenari else 0
+    istanti = np.arange(passi) * passo_ore
+    aperto = istanti[None, :] < p['ore_disponibili'][:, None] - EPS
+
+    potenza_max = catalogo.potenza_effettiva_kw[None, :] * (p['utilizzo_percentuale'][:, None] / 100)
+    posti = catalogo.conteggi(p)
+    arrivi = _arrivi_per_passo(p, passi, passo_ore, profilo_arrivi)
+    ordine_assegnazione = _ordine_piu_veloci(catalogo) # Posto libero più veloce
+    ordine_potenza = np.argsort(catalogo.potenza_effettiva_kw)
+    if priorita is None:
+        ordine_priorita = ordine_assegnazione
+    else:
+        sconosciuti = [t for t in priorita if t not in catalogo]
+        if sconosciuti:
+            raise ValueError(f"Tipi di colonnina non presenti nel catalogo: {', '.join(sconosciuti)}")
+        ordine_priorita = [catalogo.tipi.index(t) for t in priorita]
+
+    # Stato per tipo. Tutte le auto di un tipo ricevono la stessa potenza, quindi le
+    # coorti (auto arrivate nello stesso passo) terminano in ordine di arrivo: basta
+    # l'energia cumulata per auto del tipo e l'indice della coorte più vecchia in carica.
+    n_tipi = len(catalogo)
+    righe = np.arange(n_scenari)[:, None]
+    colonne_tipo = np.arange(n_tipi)[None, :]
+    kwh = p['kwh_per_auto'][:, None]
+    auto = np.zeros((passi, n_scenari, n_tipi))                  # Auto per coorte (passo di arrivo)
+    auto_cumulate = np.zeros((passi + 1, n_scenari, n_tipi))     # Somme prefisse di `auto`
+    energia_cumulata = np.zeros((passi + 1, n_scenari, n_tipi))  # Energia erogata per auto del tipo fino al passo
+    rilasci = np.zeros((passi + 1, n_scenari, n_tipi))           # Auto che liberano il posto a inizio passo
+    testa = np.zeros((n_scenari, n_tipi), dtype=np.int64)        # Coorte più vecchia ancora in carica
+    occupati = np.zeros((n_scenari, n_tipi))
+
+    rifiutate = np.zeros(n_scenari)
+    profilo_potenza = np.zeros((n_scenari, passi))
+    profilo_richiesta = np.zeros((n_scenari, passi))
+
+    for k in range(passi):
+        adesso = istanti[k]
+
+        # 1. Arrivi: posto libero più veloce, altrimenti rifiutate
+        occupati -= rilasci[k]
+        liberi = np.maximum(posti - occupati, 0.0)
+        in_arrivo = arrivi[:, k].copy()
+        for i in ordine_assegnazione:
+            assegnate = np.minimum(in_arrivo, liberi[:, i])
+            auto[k, :, i] = assegnate
+            in_arrivo -= assegnate
+        rifiutate += in_arrivo
+        occupati += auto[k]
+        auto_cumulate[k + 1] = auto_cumulate[k] + auto[k]
+
+        # 2. Ripartizione della potenza tra le sessioni attive (nessuna a locale chiuso)
+        attive = (auto_cumulate[k + 1] - auto_cumulate[testa, righe, colonne_tipo]) * aperto[:, k:k + 1]
+        profilo_richiesta[:, k] = (attive * potenza_max).sum(axis=1)
+        if politica == 'equa':
+            potenza_auto = _ripartizione_equa(attive, potenza_max, limite, ordine_potenza)
+        else:
+            potenza_auto = _ripartizione_priorita(attive, potenza_max, limite, ordine_priorita)
+        potenza_auto *= aperto[:, k:k + 1]
+        passo_auto = potenza_auto * passo_ore
+        energia_cumulata[k + 1] = energia_cumulata[k] + passo_auto
+
+        # 3. Coorti che completano la ricarica nel passo: ricevono solo l'energia residua.
+        #    Dopo il primo controllo si ricontrollano solo le coppie (scenario, tipo) avanzate.
+        energia_passo = passo_auto * attive
+        completa = (testa <= k) & (energia_cumulata[k + 1] - energia_cumulata[testa, righe, colonne_tipo] >= kwh - EPS)
+        r, t = np.nonzero(completa)
+        while r.size:
+            c = testa[r, t]
+            residua = np.maximum(kwh[r, 0] - (energia_cumulata[k, r, t] - energia_cumulata[c, r, t]), 0.0)
+            auto_coorte = auto[c, r, t]
+            energia_passo[r, t] -= auto_coorte * (passo_auto[r, t] - residua)
+            fine_carica = adesso + _dividi(residua, potenza_auto[r, t], potenza_auto[r, t] > 0)
+            rilascio = np.maximum(istanti[c] + p['tempo_ricarica_media'][r], fine_carica) + p['tempo_turnover'][r]
+            passo_rilascio = np.maximum(np.ceil((rilascio - EPS) / passo_ore).astype(np.int64), k + 1)
+            dentro = passo_rilascio <= passi
+            np.add.at(rilasci, (passo_rilascio[dentro], r[dentro], t[dentro]), auto_coorte[dentro])
+            testa[r, t] = c + 1
+            ancora = (c + 1 <= k) & (energia_cumulata[k + 1, r, t] - energia_cumulata[np.minimum(c + 1, k), r, t] >= kwh[r, 0] - EPS)
+            r, t = r[ancora], t[ancora]
+        profilo_potenza[:, k] = energia_passo.sum(axis=1) / passo_ore
+
+    energia_erogata = profilo_potenza.sum(axis=1) * passo_ore
+    servite = auto_cumulate[testa, righe, colonne_tipo].sum(axis=1)
+    # Energia mancante alle coorti ancora in carica alla chiusura
+    in_carica = np.arange(passi)[:, None, None] >= testa[None, :, :]
+    ricevuta = energia_cumulata[passi] - energia_cumulata[:passi]
+    non_erogata = np.where(in_carica, auto * np.maximum(kwh[None, :, :] - ricevuta, 0.0), 0.0).sum(axis=(0, 2))
+    ore_aperte = np.minimum(p['ore_disponibili'], passi * passo_ore)
+    # Energia massima erogabile: la minore tra connessione e potenza utile installata, per le ore di apertura
+    capacita_connessione = np.minimum(limite, (posti * potenza_max).sum(axis=1)) * ore_aperte
+    return {
+        'energia_erogata_giorno': energia_erogata,
+        'auto_servite': servite,
+        'auto_rifiutate': rifiutate,
+        'energia_non_erogata_giorno': non_erogata,
+        'potenza_picco_kw': profilo_potenza.max(axis=1, initial=0.0),
+        'potenza_richiesta_picco_kw': profilo_richiesta.max(axis=1, initial=0.0),
+        'utilizzo_connessione': _dividi(energia_erogata, capacita_connessione, capacita_connessione > 0) * 100,
+        'profilo_potenza_kw': profilo_potenza,
+        'profilo_richiesta_kw': profilo_richiesta,
+    }
+
+
+def _risultati_rete(colonne: Mapping[str, np.ndarray], sim: Mapping[str, np.ndarray], limite: np.ndarray,
+                    catalogo: Optional[ChargerCatalog] = None) -> Dict[str, np.ndarray]:
+    """Risultati del modello con energia e auto servite dalla simulazione, più le metriche di rete."""
+    risultati = compute_performance_arrays(colonne, sim['energia_erogata_giorno'], catalogo)
+    sessioni_massime_giorno = capacity_limits(colonne, catalogo)['sessioni_massime_giorno']
+    auto_servite = np.floor(sim['auto_servite'] + EPS).astype(np.int64)
+    risultati['auto_servite'] = auto_servite
+    risultati['auto_non_servite'] = np.maximum(0, colonne['num_auto_giorno'] - auto_servite)
+    risultati['tasso_utilizzo_plug'] = _dividi(auto_servite, sessioni_massime_giorno, sessioni_massime_giorno > 0) * 100
+    risultati.update({
+        'potenza_connessione_kw': limite,
+        'potenza_picco_kw': sim['potenza_picco_kw'],
+        'potenza_richiesta_picco_kw': sim['potenza_richiesta_picco_kw'],
+        'auto_rifiutate': sim['auto_rifiutate'],
+        'energia_non_erogata_giorno': sim['energia_non_erogata_giorno'],
+        'utilizzo_connessione': sim['utilizzo_connessione'],
+    })
+    return risultati
+
+
+def calculate_charging_point_performance_grid(
+    params: Mapping[str, Union[int, float]],
+    potenza_connessione_kw: float = math.inf,
+    politica: str = 'equa',
+    priorita: Optional[Sequence[str]] = None,
+    profilo_arrivi: str = 'uniforme',
+    passo_ore: float = PASSO_ORE,
+    catalogo: Optional[ChargerCatalog] = None,
+) -> Dict[str, Any]:
+    """
+    Come `calculate_charging_point_performance`, ma energia erogata e auto
+    servite provengono dalla ripartizione della potenza di rete. Le chiavi
+    `rete_*` riportano picchi e profili di potenza della giornata tipo.
+    """
+    colonne = _colonne_scenari(params, catalogo)
+    sim = simulate_grid_sharing(colonne, potenza_connessione_kw, politica, priorita, profilo_arrivi, passo_ore, catalogo)
+    limite = np.atleast_1d(np.asarray(potenza_connessione_kw, dtype=float))
+    risultati = {k: v[0].item() for k, v in _risultati_rete(colonne, sim, limite, catalogo).items() if k in RESULT_KEYS}
+    risultati.update({
+        'rete_potenza_connessione_kw': float(potenza_connessione_kw),
+        'rete_potenza_picco_kw': float(sim['potenza_picco_kw'][0]),
+        'rete_potenza_richiesta_picco_kw': float(sim['potenza_richiesta_picco_kw'][0]),
+        'rete_auto_rifiutate': float(sim['auto_rifiutate'][0]),
+        'rete_energia_non_erogata_giorno': float(sim['energia_non_erogata_giorno'][0]),
+        'rete_utilizzo_connessione': float(sim['utilizzo_connessione'][0]),
+        'rete_ore': (np.arange(sim['profilo_potenza_kw'].shape[1]) * passo_ore).tolist(),
+        'rete_profilo_potenza_kw': sim['profilo_potenza_kw'][0].tolist(),
+        'rete_profilo_richiesta_kw': sim['profilo_richiesta_kw'][0].tolist(),
+    })
+    return risultati
+
+
+def calculate_charging_point_performance_grid_batch(
+    scenari: pd.DataFrame,
+    potenza_connessione_kw: Union[float, np.ndarray, None] = None,
+    politica: str = 'equa',
+    priorita: Optional[Sequence[str]] = None,
+    profilo_arrivi: str = 'uniforme',
+    passo_ore: float = PASSO_ORE,
+    dimensione_blocco: int = DIMENSIONE_BLOCCO,
+    catalogo: Optional[ChargerCatalog] = None,
+) -> pd.DataFrame:
+    """
+    Versione batch: una riga per scenario. Il limite di rete è preso dalla
+    colonna `potenza_connessione_kw` di `scenari` se presente, altrimenti
+    dall'argomento (scalare o array; assente = nessun limite). Gli scenari
+    sono simulati a blocchi per limitare la memoria.
+    """
+    colonne = _colonne_scenari(scenari, catalogo)
+    if 'potenza_connessione_kw' in scenari:
+        potenza_connessione_kw = scenari['potenza_connessione_kw'].to_numpy(dtype=float)
+    elif potenza_connessione_kw is None:
+        potenza_connessione_kw = math.inf
+    limite = np.broadcast_to(np.asarray(potenza_connessione_kw, dtype=float), (len(scenari),))
+
+    blocchi = []
+    for inizio in range(0, len(scenari), dimensione_blocco):
+        fine = inizio + dimensione_blocco
+        blocco = {k: v[inizio:fine] for k, v in colonne.items()}
+        sim = simulate_grid_sharing(blocco, limite[inizio:fine], politica, priorita, profilo_arrivi, passo_ore, catalogo)
+        blocchi.append(pd.DataFrame(_risultati_rete(blocco, sim, limite[inizio:fine], catalogo), columns=list(RESULT_KEYS + RETE_KEYS)))
+    if not blocchi:
+        return pd.DataFrame(columns=list(RESULT_KEYS + RETE_KEYS), index=scenari.index)
+    risultati = pd.concat(blocchi, ignore_index=True)
+    risultati.index = scenari.index
+    return risultati
+
+
+def grid_cap_sweep(
+    params: Mapping[str, Union[int, float]],
+    potenze_connessione_kw: Sequence[float],
+    mix: Optional[pd.DataFrame] = None,
+    catalogo: Optional[ChargerCatalog] = None,
+    **opzioni: Any,
+) -> pd.DataFrame:
+    """
+    Valuta tutte le combinazioni limite di rete x mix di colonnine per un sito
+    in un'unica simulazione vettoriale. `mix` ha una colonna per tipo di
+    colonnina (default: il solo mix di `params`); `opzioni` sono inoltrate a
+    `calculate_charging_point_performance_grid_batch`.
+    """
+    tipi = list(resolve_catalog(catalogo).tipi)
+    if mix is None:
+        mix = pd.DataFrame([{t: params[t] for t in tipi}])
+    mix = mix.reindex(columns=tipi, fill_value=0).reset_index(drop=True)
+    potenze = np.asarray(potenze_connessione_kw, dtype=float)
+    scenari = pd.DataFrame({k: params[k] for k in _chiavi_parametri(catalogo) if k not in tipi}, index=range(len(mix) * len(potenze)))
+    for t in tipi:
+        scenari[t] = np.repeat(mix[t].to_numpy(), len(potenze))
+    scenari['potenza_connessione_kw'] = np.tile(potenze, len(mix))
+    risultati = calculate_charging_point_performance_grid_batch(scenari, catalogo=catalogo, **opzioni)
+    return pd.concat([scenari[tipi + ['potenza_connessione_kw']], risultati.drop(columns='potenza_connessione_kw')], axis=1)
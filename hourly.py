@@ -0,0 +1,202 @@
+import functools
+import io
+import os
+from typing import Dict, Any, Union, Mapping, Optional, BinaryIO
+
+import numpy as np
+import pandas as pd
+
+from catalog import ChargerCatalog
+from performance import RESULT_KEYS, compute_performance_arrays, hardware_arrays, _colonne_scenari
+
+# ==============================================================================
+# MODALITÀ ORARIA 8760 (TARIFFE A FASCE / TIME-OF-USE)
+#    Domanda e prezzi di acquisto ora per ora su un anno di 365 giorni.
+#    I profili su file sono caricati una sola volta per processo (NPY in
+#    memory-map, sola lettura) e condivisi tra tutti i siti di un batch.
+# ==============================================================================
+
+ORE_ANNO = 8760
+GIORNI_MESE = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+INIZIO_MESE_ORE = np.cumsum((0,) + GIORNI_MESE[:-1]) * 24 # Indice della prima ora di ogni mese
+
+DIMENSIONE_BLOCCO = 256 # Siti per blocco: 256 x 8760 float64 ~ 18 MB per matrice
+
+Profilo = Union[str, os.PathLike, np.ndarray, BinaryIO]
+
+
+def _leggi_tabella(sorgente: Union[str, BinaryIO], estensione: str, colonna: Optional[str]) -> np.ndarray:
+    if estensione == '.parquet':
+        df = pd.read_parquet(sorgente, columns=[colonna] if colonna else None, memory_map=isinstance(sorgente, str))
+    else:
+        df = pd.read_csv(sorgente, usecols=[colonna] if colonna else None)
+    serie = df[colonna] if colonna else df.select_dtypes('number').iloc[:, -1]
+    return serie.to_numpy(dtype=float)
+
+
+@functools.lru_cache(maxsize=16)
+def _carica_da_file(percorso: str, colonna: Optional[str], _mtime_ns: int, _dimensione: int) -> np.ndarray:
+    """Carica un profilo da disco; la chiave include mtime e dimensione per invalidare i file modificati."""
+    estensione = os.path.splitext(percorso)[1].lower()
+    if estensione == '.npy':
+        valori = np.load(percorso, mmap_mode='r')
+    else:
+        valori = _leggi_tabella(percorso, estensione, colonna)
+        valori.flags.writeable = False
+    return valori
+
+
+def load_hourly_profile(sorgente: Profilo, colonna: Optional[str] = None) -> np.ndarray:
+    """
+    Restituisce un profilo orario di 8760 valori in sola lettura.
+
+    `sorgente` può essere un percorso (.csv, .npy, .parquet), un file caricato
+    (oggetto con attributo `name`, es. `st.file_uploader`) o un array già pronto.
+    I file NPY sono aperti in memory-map; ogni percorso è letto una sola volta
+    per processo finché il file non cambia. Per CSV/Parquet si usa `colonna`,
+    o in sua assenza l'ultima colonna numerica (es. `timestamp,valore`).
+    """
+    if isinstance(sorgente, np.ndarray):
+        valori = sorgente
+    elif isinstance(sorgente, (str, os.PathLike)):
+        percorso = os.path.abspath(os.fspath(sorgente))
+        stat = os.stat(percorso)
+        valori = _carica_da_file(percorso, colonna, stat.st_mtime_ns, stat.st_size)
+    else:
+        sorgente.seek(0) # Gli upload di Streamlit sopravvivono ai rerun: si rilegge dall'inizio
+        estensione = os.path.splitext(getattr(sorgente, 'name', ''))[1].lower()
+        if estensione == '.npy':
+            valori = np.load(io.BytesIO(sorgente.read()))
+        else:
+            valori = _leggi_tabella(sorgente, estensione, colonna)
+
+    valori = np.asarray(valori).ravel()
+    if valori.shape[0] != ORE_ANNO:
+        raise ValueError(f"Il profilo orario deve avere {ORE_ANNO} valori (trovati {valori.shape[0]}).")
+    return valori
+
+
+def _calcola_orario(
+    colonne: Mapping[str, np.ndarray],
+    forma_domanda: np.ndarray,
+    prezzi_acquisto: Optional[np.ndarray],
+    catalogo: Optional[ChargerCatalog] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Calcolo orario vettoriale per un blocco di siti (righe) su 8760 ore (colonne).
+
+    La domanda annua del sito (`num_auto_giorno * kwh_per_auto * giorni_attivi`)
+    è ripartita secondo la forma del profilo; in ogni ora l'energia erogata è il
+    minimo tra domanda e capacità oraria (potenza utile e sessioni per ora).
+    La domanda non servita in un'ora è persa.
+    """
+    p = colonne
+    hardware = hardware_arrays(p, catalogo)
+    potenza_totale_kw = hardware['potenza_effettiva_kw']
+    num_totale_colonnine = hardware['colonnine_equivalenti']
+    tempo_totale_slot = p['tempo_ricarica_media'] + p['tempo_turnover']
+
+    capacita_energia_ora = potenza_totale_kw * (p['utilizzo_percentuale'] / 100)
+    sessioni_ora = np.divide(
+        num_totale_colonnine, tempo_totale_slot,
+        out=np.zeros(tempo_totale_slot.shape), where=(tempo_totale_slot > 0) & (num_totale_colonnine > 0)
+    )
+    capacita_ora = np.minimum(capacita_energia_ora, sessioni_ora * p['kwh_per_auto'])
+
+    domanda_annua = p['num_auto_giorno'] * p['kwh_per_auto'] * p['giorni_attivi']
+    # (siti x ore): unica matrice temporanea, i profili sono solo letti
+    energia_oraria = np.minimum(np.multiply.outer(domanda_annua, forma_domanda), capacita_ora[:, None])
+
+    energia_annua = energia_oraria.sum(axis=1)
+    if prezzi_acquisto is None:
+        costo_energia_annuo = energia_annua * p['costo_acquisto_energia_kwh']
+    else:
+        costo_energia_annuo = energia_oraria @ prezzi_acquisto
+
+    return {
+        'energia_annua': energia_annua,
+        'costo_energia_annuo': costo_energia_annuo,
+        'energia_mensile': np.add.reduceat(energia_oraria, INIZIO_MESE_ORE, axis=1),
+    }
+
+
+def _risultati_orari(
+    colonne: Mapping[str, np.ndarray],
+    forma_domanda: np.ndarray,
+    prezzi_acquisto: Optional[np.ndarray],
+    catalogo: Optional[ChargerCatalog] = None,
+) -> Dict[str, np.ndarray]:
+    orario = _calcola_orario(colonne, forma_domanda, prezzi_acquisto, catalogo)
+    # Il costo orario diventa un costo medio ponderato, così il conto economico resta unico
+    colonne = dict(colonne)
+    colonne['costo_acquisto_energia_kwh'] = np.divide(
+        orario['costo_energia_annuo'], orario['energia_annua'],
+        out=np.asarray(colonne['costo_acquisto_energia_kwh'], dtype=float).copy(), where=orario['energia_annua'] > 0
+    )
+    giorni = np.asarray(colonne['giorni_attivi'], dtype=float)
+    energia_giorno = np.divide(orario['energia_annua'], giorni, out=np.zeros_like(giorni), where=giorni > 0)
+    risultati = compute_performance_arrays(colonne, energia_giorno, catalogo)
+    risultati['costo_acquisto_medio_kwh'] = colonne['costo_acquisto_energia_kwh']
+    risultati['energia_mensile'] = orario['energia_mensile']
+    return risultati
+
+
+def _forma(profilo_domanda: Profilo) -> np.ndarray:
+    domanda = load_hourly_profile(profilo_domanda)
+    totale = float(domanda.sum())
+    if totale <= 0:
+        raise ValueError("Il profilo di domanda deve avere somma positiva.")
+    return domanda / totale
+
+
+def calculate_charging_point_performance_hourly(
+    params: Dict[str, Union[int, float]],
+    profilo_domanda: Profilo,
+    profilo_prezzi: Optional[Profilo] = None,
+    catalogo: Optional[ChargerCatalog] = None,
+) -> Dict[str, Any]:
+    """
+    Come `calculate_charging_point_performance`, ma con energia erogata e costo
+    dell'energia calcolati ora per ora. Senza `profilo_prezzi` si usa il costo
+    fisso `costo_acquisto_energia_kwh`. `energia_mensile` contiene i 12 totali
+    mensili reali (kWh) per il grafico mensile.
+    """
+    prezzi = None if profilo_prezzi is None else load_hourly_profile(profilo_prezzi)
+    risultati = _risultati_orari(_colonne_scenari(params, catalogo), _forma(profilo_domanda), prezzi, catalogo)
+    energia_mensile = risultati.pop('energia_mensile')[0]
+    out = {k: v[0].item() for k, v in risultati.items()}
+    out['energia_mensile'] = energia_mensile.tolist()
+    return out
+
+
+def calculate_charging_point_performance_hourly_batch(
+    scenari: pd.DataFrame,
+    profilo_domanda: Profilo,
+    profilo_prezzi: Optional[Profilo] = None,
+    dimensione_blocco: int = DIMENSIONE_BLOCCO,
+    catalogo: Optional[ChargerCatalog] = None,
+) -> pd.DataFrame:
+    """
+    Versione batch: tutti i siti di `scenari` condividono gli stessi profili,
+    caricati una sola volta. I siti sono elaborati a blocchi di
+    `dimensione_blocco` righe per limitare la matrice oraria in memoria.
+    Le colonne `energia_mese_01`..`energia_mese_12` riportano i totali mensili.
+    """
+    forma_domanda = _forma(profilo_domanda)
+    prezzi = None if profilo_prezzi is None else load_hourly_profile(profilo_prezzi)
+    colonne = _colonne_scenari(scenari, catalogo)
+    n = len(scenari)
+
+    parti = []
+    for inizio in range(0, n, dimensione_blocco):
+        blocco = {k: v[inizio:inizio + dimensione_blocco] for k, v in colonne.items()}
+        risultati = _risultati_orari(blocco, forma_domanda, prezzi, catalogo)
+        energia_mensile = risultati.pop('energia_mensile')
+        df = pd.DataFrame(risultati, columns=list(RESULT_KEYS) + ['costo_acquisto_medio_kwh'])
+        for m in range(12):
+            df[f"energia_mese_{m + 1:02d}"] = energia_mensile[:, m]
+        parti.append(df)
+
+    risultato = pd.concat(parti, ignore_index=True) if parti else pd.DataFrame(columns=list(RESULT_KEYS))
+    risultato.index = scenari.index
+    return risultato
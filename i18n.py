@@ -0,0 +1,87 @@
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+
+# ==============================================================================
+# CATALOGHI DELLE TRADUZIONI
+#    Un file JSON piatto (chiave -> testo) per lingua in `locales/`, letto una
+#    sola volta per processo e solo quando la lingua viene richiesta. La
+#    ricerca è un accesso a dizionario: nessuna allocazione per chiamata.
+# ==============================================================================
+
+CARTELLA_LOCALI = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'locales')
+LINGUA_DEFAULT = 'it'
+
+# Codice lingua -> nome mostrato nel selettore
+LINGUE = {'it': 'Italiano', 'en': 'English'}
+
+logger = logging.getLogger(__name__)
+
+
+class Catalog:
+    """
+    Testi di una lingua. Le chiavi assenti ripiegano sulla lingua di default e,
+    se mancano anche lì, su `_chiave_`; in entrambi i casi la chiave è segnalata
+    una sola volta nel log e il ripiego memorizzato, così le ricerche successive
+    costano quanto una chiave presente.
+    """
+
+    def __init__(self, lingua: str, testi: Dict[str, str], ripiego: Optional['Catalog'] = None):
+        self.lingua = lingua
+        self._testi = dict(testi)
+        self._ripiego = ripiego
+        self._lock = threading.Lock()
+        self.mancanti: Dict[str, str] = {} # Chiave -> testo usato al suo posto
+
+    def __len__(self) -> int:
+        return len(self._testi)
+
+    def __contains__(self, chiave: str) -> bool:
+        return chiave in self._testi and chiave not in self.mancanti
+
+    def get(self, chiave: str) -> str:
+        testo = self._testi.get(chiave)
+        if testo is None:
+            return self._mancante(chiave)
+        return testo
+
+    __getitem__ = get
+
+    def _mancante(self, chiave: str) -> str:
+        with self._lock:
+            if chiave not in self._testi:
+                testo = self._ripiego.get(chiave) if self._ripiego is not None else f"_{chiave}_"
+                self.mancanti[chiave] = testo
+                self._testi[chiave] = testo
+                logger.warning("Chiave di traduzione mancante per '%s': %s", self.lingua, chiave)
+            return self._testi[chiave]
+
+
+def _leggi_catalogo(lingua: str) -> Dict[str, str]:
+    with open(os.path.join(CARTELLA_LOCALI, f"{lingua}.json"), encoding='utf-8') as f:
+        return json.load(f)
+
+
+_CATALOGHI: Dict[str, Catalog] = {}
+_LOCK_CATALOGHI = threading.Lock()
+
+
+def get_catalog(lingua: str = LINGUA_DEFAULT) -> Catalog:
+    """Catalogo della lingua richiesta, caricato alla prima richiesta e poi condiviso dal processo."""
+    catalogo = _CATALOGHI.get(lingua)
+    if catalogo is None:
+        if lingua not in LINGUE:
+            raise ValueError(f"Lingua non supportata: {lingua}. Ammesse: {', '.join(LINGUE)}")
+        ripiego = None if lingua == LINGUA_DEFAULT else get_catalog(LINGUA_DEFAULT)
+        with _LOCK_CATALOGHI:
+            catalogo = _CATALOGHI.get(lingua)
+            if catalogo is None:
+                catalogo = _CATALOGHI[lingua] = Catalog(lingua, _leggi_catalogo(lingua), ripiego)
+    return catalogo
+
+
+def missing_keys() -> Dict[str, List[str]]:
+    """Chiavi mancanti incontrate finora, per ciascuna lingua già caricata."""
+    return {lingua: sorted(catalogo.mancanti) for lingua, catalogo in _CATALOGHI.items()}
@@ -0,0 +1,171 @@
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+# ==============================================================================
+# ESECUZIONE IN BACKGROUND DELLE ANALISI (CONDIVISA TRA SESSIONI STREAMLIT)
+#    Come le cache di ui_cache.py, il runner è un'istanza di modulo: un pool
+#    di thread per processo server con un numero massimo di job in esecuzione,
+#    così un'analisi pesante di un utente non blocca il thread della sessione
+#    né occupa tutto il server. Il calcolo è NumPy (che rilascia il GIL) o
+#    già distribuito su processi da joblib, quindi i thread bastano.
+# ==============================================================================
+
+MAX_JOB_CONCORRENTI = int(os.environ.get('AIJOSA_MAX_JOB') or 2) # Job in esecuzione per server
+MAX_JOB_IN_ATTESA = 16 # Job in coda oltre a quelli in esecuzione: oltre, le richieste sono rifiutate
+MAX_JOB_PER_SESSIONE = 2 # Job attivi (in coda o in esecuzione) per proprietario
+MAX_JOB_CONSERVATI = 256 # Job terminati tenuti in memoria per la lettura del risultato
+# Processi joblib per job: con tutti i job in esecuzione si occupano al più le CPU del server
+PROCESSI_PER_JOB = max(1, (os.cpu_count() or 1) // MAX_JOB_CONCORRENTI)
+
+IN_CODA = 'in_coda'
+IN_CORSO = 'in_corso'
+COMPLETATO = 'completato'
+ANNULLATO = 'annullato'
+ERRORE = 'errore'
+STATI_FINALI = (COMPLETATO, ANNULLATO, ERRORE)
+
+# Un job è una funzione senza argomenti che restituisce un iterabile di passi
+# (avanzamento in [0, 1], risultato parziale): l'ultimo parziale è il risultato.
+Passi = Callable[[], Iterable[Tuple[float, Any]]]
+
+
+class JobQueueFull(RuntimeError):
+    """Troppi job attivi sul server o per la sessione: la richiesta va ripetuta più tardi."""
+
+
+class Job:
+    """
+    Stato di un job, letto dalla sessione a ogni rerun mentre il thread del pool
+    lo aggiorna. Gli attributi sono sostituiti (mai modificati sul posto), quindi
+    la lettura non richiede lock.
+    """
+
+    def __init__(self, id_job: int, proprietario: Hashable, nome: str):
+        self.id = id_job
+        self.proprietario = proprietario
+        self.nome = nome
+        self.stato = IN_CODA
+        self.avanzamento = 0.0
+        self.parziale: Any = None
+        self.errore: Optional[BaseException] = None
+        self.inviato = time.time()
+        self.inizio: Optional[float] = None
+        self.fine: Optional[float] = None
+        self._annulla = threading.Event()
+
+    @property
+    def attivo(self) -> bool:
+        return self.stato not in STATI_FINALI
+
+    @property
+    def risultato(self) -> Any:
+        """Risultato finale, `None` finché il job non è completato."""
+        return self.parziale if self.stato == COMPLETATO else None
+
+    def cancel(self) -> None:
+        """
+        Richiede l'annullamento: il job si ferma al passo successivo (un job in
+        coda non parte). Un calcolo a passo unico termina comunque, ma il suo
+        risultato è scartato.
+        """
+        self._annulla.set()
+
+    @property
+    def annullato(self) -> bool:
+        return self._annulla.is_set()
+
+
+class JobRunner:
+    """
+    Pool di thread con limite di job concorrenti, di job in attesa e di job
+    attivi per proprietario (la sessione). Per ogni (proprietario, nome) è
+    tenuto solo l'ultimo job: un nuovo invio annulla il precedente.
+    """
+
+    def __init__(self, max_concorrenti: int = MAX_JOB_CONCORRENTI, max_in_attesa: int = MAX_JOB_IN_ATTESA,
+                 max_per_sessione: int = MAX_JOB_PER_SESSIONE, max_conservati: int = MAX_JOB_CONSERVATI):
+        self.max_concorrenti = max(1, max_concorrenti)
+        self.max_in_attesa = max_in_attesa
+        self.max_per_sessione = max_per_sessione
+        self.max_conservati = max_conservati
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concorrenti, thread_name_prefix='aijosa-job')
+        self._job: 'OrderedDict[Tuple[Hashable, str], Job]' = OrderedDict()
+        self._contatore = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, proprietario: Hashable, nome: str, passi: Passi) -> Job:
+        """Accoda un job; il job precedente con lo stesso nome e proprietario viene annullato."""
+        with self._lock:
+            # Quote verificate prima di toccare il precedente: se la richiesta è rifiutata resta attivo.
+            # Il precedente non si conta, perché il nuovo job lo sostituisce.
+            precedente = self._job.get((proprietario, nome))
+            attivi = [j for j in self._job.values() if j.attivo and j is not precedente]
+            if sum(j.proprietario == proprietario for j in attivi) >= self.max_per_sessione:
+                raise JobQueueFull(f"Massimo {self.max_per_sessione} analisi in corso per sessione.")
+            if len(attivi) >= self.max_concorrenti + self.max_in_attesa:
+                raise JobQueueFull("Server occupato: troppe analisi in attesa.")
+
+            if precedente is not None:
+                del self._job[(proprietario, nome)]
+                precedente.cancel()
+            job = Job(next(self._contatore), proprietario, nome)
+            self._job[(proprietario, nome)] = job
+            self._pota()
+        self._pool.submit(self._esegui, job, passi)
+        return job
+
+    def get(self, proprietario: Hashable, nome: str) -> Optional[Job]:
+        with self._lock:
+            return self._job.get((proprietario, nome))
+
+    def cancel(self, proprietario: Hashable, nome: str) -> None:
+        job = self.get(proprietario, nome)
+        if job is not None:
+            job.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stati = [j.stato for j in self._job.values()]
+        return {stato: stati.count(stato) for stato in (IN_CODA, IN_CORSO, *STATI_FINALI)}
+
+    def _pota(self) -> None:
+        """Scarta i job terminati più vecchi oltre `max_conservati` (chiamata con il lock)."""
+        terminati = [chiave for chiave, j in self._job.items() if not j.attivo]
+        for chiave in terminati[:max(0, len(self._job) - self.max_conservati)]:
+            del self._job[chiave]
+
+    @staticmethod
+    def _esegui(job: Job, passi: Passi) -> None:
+        if job.annullato:
+            job.stato, job.fine = ANNULLATO, time.time()
+            return
+        job.stato, job.inizio = IN_CORSO, time.time()
+        iteratore = None
+        try:
+            iteratore = iter(passi())
+            for avanzamento, parziale in iteratore:
+                if job.annullato:
+                    break
+                job.parziale, job.avanzamento = parziale, float(avanzamento)
+            job.stato = ANNULLATO if job.annullato else COMPLETATO
+        except Exception as e:
+            job.errore, job.stato = e, ERRORE
+        finally:
+            # Chiude i generatori a metà (es. i blocchi joblib ancora da eseguire)
+            chiudi = getattr(iteratore, 'close', None)
+            if chiudi is not None:
+                chiudi()
+            job.fine = time.time()
+
+
+def single_step(calcola: Callable[[], Any]) -> Passi:
+    """Adatta un calcolo senza risultati intermedi al protocollo dei job (un solo passo)."""
+    return lambda: iter([(1.0, calcola())])
+
+
+JOB_RUNNER = JobRunner()
@@ -1,240 +1,118 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
+import plotly.io as pio
 import math 
-from typing import Dict, Any, Union
+import hashlib
+import uuid
+
+from performance import CATALOGO_DEFAULT, TIPI_COLONNINE, calculate_charging_point_performance
+from optimizer import LIMITE_DEFAULT, LIMITI_COLONNINE, optimize_charger_mix
+from pareto import OBIETTIVI_PARETO_DEFAULT, pareto_frontier
+from montecarlo import iter_monte_carlo
+from queue_simulation import calculate_charging_point_performance_simulated, horeca_profile
+from hourly import calculate_charging_point_performance_hourly
+from grid_sharing import calculate_charging_point_performance_grid
+from ui_cache import FIGURE_CACHE, RESULTS_CACHE, canonical_hash
+from jobs import ANNULLATO, COMPLETATO, ERRORE, JOB_RUNNER, PROCESSI_PER_JOB, JobQueueFull, single_step
+from result_store import default_result_store, scenario_key
+from sensitivity import sensitivity_analysis
+from cashflow import calculate_cash_flows
+from i18n import LINGUA_DEFAULT, LINGUE, get_catalog
+from profiling import checkpoint, finish_rerun, rerun_latency_quantiles, stage, start_rerun
 
 # ==============================================================================
-# 0. FUNZIONE DI TRADUZIONE MOCK (DA SOSTITUIRE CON LA TUA VERA IMPLEMENTAZIONE)
-#    Ho mantenuto il dizionario per rendere il codice immediatamente eseguibile.
+# 0. TRADUZIONI
+#    I testi sono in locales/<lingua>.json, caricati una volta per processo da
+#    i18n.py: get_text è la ricerca nel catalogo della lingua della sessione.
 # ==============================================================================
 
-def get_text(key: str) -> str:
-    """Funzione Mock per la traduzione dei testi. SOSTITUISCI CON LA TUA IMPLEMENTAZIONE."""
-    texts = {
-        # -- TITOLI PRINCIPALI --
-        "performance_eval_header": "Valutazione del Rendimento del Punto di Ricarica 🔋",
-        "performance_eval_intro": "Analizza la fattibilità economica e la capacità operativa della tua infrastruttura di ricarica.",
-        "calculate_performance_spinner": "Analisi delle performance in corso...",
-        "performance_analysis_complete": "Analisi delle performance completata!",
-        "configure_and_calculate_point": "Configura i parametri e premi 'Calcola Performance' per avviare l'analisi.",
-        "optimization_recommendations": "💡 Raccomandazioni e Ottimizzazione",
-        
-        # -- INPUT SEZIONE A: PREVISIONE DOMANDA --
-        "demand_forecast_header": "A. Previsione della Domanda e Uso (Base)",
-        "expected_daily_cars": "Auto Previste al Giorno (Media)",
-        "avg_energy_per_car": "Energia Media Richiesta per Auto (kWh)",
-        "avg_charge_time": "Tempo Medio di Ricarica (h)",
-        "turnover_time": "Tempo di Turnover/Setup (h)", # NEW: Tempo per parcheggio/spostamento
-        
-        # -- INPUT SEZIONE B: CONFIGURAZIONE OPERATIVA --
-        "operational_config_header": "B. Configurazione Operativa e Disponibilità",
-        "daily_op_hours": "Ore Operative Giornaliere (h)",
-        "annual_op_days": "Giorni Attivi Annuali",
-        "infra_utilization_prob": "Affidabilità/Efficienza Impianto (%)",
-
-        # -- INPUT SEZIONE C: CONFIGURAZIONE HARDWARE (CAPEX) --
-        "charger_point_config": "C. Configurazione Hardware (Colonnine e Potenza)",
-        "select_quantify_chargers": "Seleziona e Quantifica i Caricatori",
-        "ac22_chargers_eval": "Colonnine AC 22 kW", "dc20_chargers_eval": "Colonnine DC 20 kW",
-        "dc30_chargers_eval": "Colonnine DC 30 kW", "dc40_chargers_eval": "Colonnine DC 40 kW",
-        "dc60_chargers_eval": "Colonnine DC 60 kW", "dc90_chargers_eval": "Colonnine DC 90 kW",
-        
-        # -- INPUT SEZIONE D: PARAMETRI FINANZIARI (RICAVI/OPEX/CAPEX) --
-        "financial_params_header": "D. Parametri Finanziari e Costi Annuali",
-        "energy_sale_price": "Prezzo di Vendita (Eur/kWh)",
-        "energy_purchase_cost": "Costo di Acquisto Energia (Eur/kWh)",
-        "max_initial_investment": "Budget Massima Iniziale (€)",
-        "useful_life_years": "Vita Utile Attesa (Anni)",
-        "annual_charger_maintenance_cost": "Costo Manutenzione Annuale (€)",
-        "annual_software_cost": "Costo Software/Piattaforma Annuale (€)",
-        "annual_insurance_cost": "Costo Assicurazione Annuale (€)",
-        "annual_land_cost": "Costo Affitto/Terreno Annuale (€)",
-        
-        # -- OUTPUT METRICHE BASE --
-        "charging_point_summary": "Riepilogo Operativo",
-        "total_installed_power": "Potenza Totale Installata",
-        "estimated_annual_energy_delivered": "Energia Erogata Annua (Stimata)",
-        "daily_cars_served": "Auto Servite Giornaliere",
-        "plug_utilization_rate": "Tasso di Utilizzo Posti/Stalli", # NEW METRIC
-        "key_economic_indicators": "Indicatori Economici Chiave",
-        "estimated_annual_revenue": "Ricavo Annuo Stimato",
-        "total_system_cost_capex": "Costo Totale Investimento (CapEx)",
-        "annual_operating_cost_opex": "Costo Operativo Annuo (OpEx Totale)",
-        "estimated_annual_net_profit": "Profitto Netto Annuo Stimato",
-        "within_budget": "✅ Nel Budget", "over_budget": "❌ Oltre Budget",
-        "roi_test": "ROI Annuale (Netto)",
-        "payback_period": "Tempo di Ritorno (Payback)",
-        "infinite_payback": "Infinito (> Vita Utile)", "years_label": "anni",
-
-        # -- OUTPUT TABELLE/GRAFICI --
-        "detailed_financial_analysis": "Analisi Finanziaria Dettagliata",
-        "detailed_visualization_tab": "Visualizzazione Operativa",
-        "financial_summary_tab": "Riepilogo Economico",
-        "payback_trend_tab": "Andamento Payback",
-        "investment_distribution_tab": "Distribuzione Investimento (CapEx)",
-        "operational_cost_breakdown_tab": "Dettaglio Costi Operativi (OpEx)", 
-        "cars_served_vs_not_served": "Auto Servite vs. Non Servite (Giornaliere)",
-        "served_cars": "Auto Servite", "not_served_cars": "Auto Non Servite",
-        "estimated_monthly_energy_delivered": "Energia Erogata Mensile (KWh)",
-        "month_label": "Mese", "energy_kwh_label": "Energia (kWh)",
-        "annual_financial_summary": "Riepilogo Finanziario Annuale",
-        "revenue_label": "Ricavi", "cost_label_short": "Costi", "profit_label_short": "Profitto",
-        "financial_summary_category_label": "Voce di Bilancio", "financial_summary_value_label": "Valore (€)",
-        "cumulative_net_profit_trend": "Andamento Profitto Netto Cumulativo",
-        "payback_not_calculable": "Il Payback non è calcolabile (Profitto Netto Annuo non positivo).",
-        "year_label": "Anno", "cumulative_net_profit_label": "Profitto Netto Cumulativo (€)",
-        "payback_line": "Ritorno sull'Investimento a {years:.1f} anni",
-        "charger_cost_component": "Costo Colonnine (Hardware)", "installation_cost_component": "Costo Installazione/Opere",
-        "annual_cost_breakdown_header": "Dettaglio Costi Operativi Totali Annuali (OpEx)",
-        "energy_cost_line": "Costo Energia Acquistata", "amortization_cost_line": "Costo Ammortamento (CapEx)",
-        "maintenance_cost_line": "Costo Manutenzione", "software_cost_line": "Costo Software/Piattaforma",
-        "insurance_cost_line": "Costo Assicurazione", "land_cost_line": "Costo Terreno/Affitto",
-        "total_opex_line": "Totale Costi Operativi (OpEx)",
-        "calculate_point_performance": "Calcola Performance e ROI",
-        # -- RACCOMANDAZIONI --
-        "highly_utilized_infra": "⚠️ L'infrastruttura è altamente utilizzata o satura.",
-        "underutilized_infra": "ℹ️ L'infrastruttura sembra essere sottoutilizzata.",
-        "cars_not_served_warning": "⚠️ Non tutte le auto sono state servite! ({count} auto non servite/giorno).",
-        "add_more_chargers_rec": "Considera l'aggiunta di ulteriori stalli/colonnine o un aumento della potenza.",
-        "reduce_chargers_rec": "Se il Payback è negativo, valuta la riduzione del CapEx.",
-        "negative_net_profit_warning": "❌ Profitto Netto Annuale Non Positivo. L'investimento non è sostenibile.",
-        "investment_over_budget": "🛑 Il costo totale di investimento (CapEx) è superiore al budget massimo impostato.",
-
-        # ... (Mantieni solo le chiavi usate per brevità)
-    }
-    return texts.get(key, f"_{key}_")
+# Misura del rerun per sezioni e fasi (no-op se AIJOSA_PROFILING non è impostata)
+start_rerun("intestazione")
+
+lingua = st.session_state.get("lingua", LINGUA_DEFAULT)
+get_text = get_catalog(lingua).get
 
 # ==============================================================================
 # 1. LOGICA DI CALCOLO (MIGLIORATA CON CAPACITÀ DI SERVIZIO)
+#    Il motore (scalare e vettoriale) vive in performance.py.
 # ==============================================================================
 
 GIORNI_ANNUI_TAB3 = 260 # Default value
-
-def calculate_charging_point_performance(params: Dict[str, Union[int, float]]) -> Dict[str, Any]:
-    """
-    Calcola il rendimento e il ROI di un punto di ricarica,
-    considerando sia la capacità energetica che la capacità di servizio (sessioni).
-    """
-    
-    # 1. CONFIGURAZIONE HARDWARE E CAPEX
-    potenza_totale_kw = (
-        params['ac_22'] * 22 + params['dc_20'] * 20 + params['dc_30'] * 30 +
-        params['dc_40'] * 40 + params['dc_60'] * 60 + params['dc_90'] * 90
-    )
-    costo_colonnine = (
-        params['ac_22'] * 1000 + params['dc_20'] * 8000 + params['dc_30'] * 12000 +
-        params['dc_40'] * 15000 + params['dc_60'] * 18000 + params['dc_90'] * 25000
-    )
-    costo_installazione = potenza_totale_kw * 150 # Stima 150€/kW
-    costo_totale_investimento = costo_colonnine + costo_installazione
-
-    # 2. CAPACITÀ OPERATIVA (I due colli di bottiglia)
-    
-    # Capacità 1: Basata sull'Energia Massima Erogabile
-    energia_massima_capacita = potenza_totale_kw * params['ore_disponibili'] * (params['utilizzo_percentuale'] / 100)
-
-    # Capacità 2: Basata sul Numero Massimo di Sessioni (Tempo di Occupazione)
-    tempo_totale_slot = params['tempo_ricarica_media'] + params['tempo_turnover']
-    num_totale_colonnine = params['ac_22'] + params['dc_20'] + params['dc_30'] + params['dc_40'] + params['dc_60'] + params['dc_90']
-    
-    if tempo_totale_slot > 0 and num_totale_colonnine > 0:
-        sessioni_massime_giorno = (num_totale_colonnine * params['ore_disponibili']) / tempo_totale_slot
-        energia_massima_sessioni = sessioni_massime_giorno * params['kwh_per_auto']
-    else:
-        sessioni_massime_giorno = 0
-        energia_massima_sessioni = 0
-
-    # 3. ENERGIA EROGATA EFFETTIVA E METRICHE DI SERVIZIO
-
-    energia_richiesta_totale_giorno = params['num_auto_giorno'] * params['kwh_per_auto']
-    
-    # Energia Erogata = Il minimo tra Domanda, Capacità Energetica e Capacità di Servizio
-    energia_erogata_giorno = min(
-        energia_richiesta_totale_giorno, 
-        energia_massima_capacita,
-        energia_massima_sessioni
-    )
-    
-    energia_erogata_annuo = energia_erogata_giorno * params['giorni_attivi']
-
-    # Auto Servite e Metriche di Utilizzo
-    auto_servite = math.floor(energia_erogata_giorno / params['kwh_per_auto']) if params['kwh_per_auto'] > 0 else 0
-    auto_non_servite = max(0, params['num_auto_giorno'] - auto_servite)
-
-    tasso_utilizzo_plug = (auto_servite / sessioni_massime_giorno) * 100 if sessioni_massime_giorno > 0 else 0
-    tasso_utilizzo_energetico = (energia_erogata_giorno / energia_massima_capacita) * 100 if energia_massima_capacita > 0 else 0
-
-    # 4. CONTO ECONOMICO (ANNUO)
-    
-    # Ricavi
-    guadagno_annuo = energia_erogata_annuo * params['prezzo_vendita']
-
-    # Costi Operativi (OpEx)
-    costo_operativo_energia_annuo = energia_erogata_annuo * params['costo_acquisto_energia_kwh']
-    
-    # Ammortamento (lineare sul CapEx)
-    costo_ammortamento_annuo = (
-        costo_totale_investimento / params['vita_utile_anni'] 
-        if params['vita_utile_anni'] > 0 
-        else costo_totale_investimento
-    )
-
-    costo_operativo_totale_annuo = (
-        costo_operativo_energia_annuo +
-        params['costo_manutenzione_annuale'] +
-        params['costo_software_annuale'] +
-        params['costo_assicurazione_annuale'] +
-        params['costo_terreno_annuale'] +
-        costo_ammortamento_annuo
-    )
-
-    # Profitto e ROI
-    profitto_netto_annuo = guadagno_annuo - costo_operativo_totale_annuo
-    
-    ROI = (profitto_netto_annuo / costo_totale_investimento) * 100 if costo_totale_investimento > 0 else 0
-    
-    payback_period = costo_totale_investimento / profitto_netto_annuo if profitto_netto_annuo > 0 else float('inf')
-    
-    if payback_period > params['vita_utile_anni']:
-        payback_period = float('inf')
-
-    # 5. RISULTATI
-    return {
-        'potenza_totale_kw': potenza_totale_kw,
-        'energia_erogata_annuo': energia_erogata_annuo,
-        'auto_servite': auto_servite,
-        'auto_non_servite': auto_non_servite,
-        'guadagno_annuo': guadagno_annuo,
-        'costo_totale_investimento': costo_totale_investimento,
-        'costo_operativo_totale_annuo': costo_operativo_totale_annuo,
-        'profitto_netto_annuo': profitto_netto_annuo,
-        'ROI': ROI,
-        'payback_period': payback_period,
-        'entro_budget': costo_totale_investimento <= params['budget'],
-        'tasso_utilizzo_energetico': tasso_utilizzo_energetico,
-        'tasso_utilizzo_plug': tasso_utilizzo_plug,
-        
-        # Dettagli per la visualizzazione
-        'costo_operativo_energia_annuo': costo_operativo_energia_annuo,
-        'costo_ammortamento_annuo': costo_ammortamento_annuo,
-        'costo_colonnine': costo_colonnine, 
-        'costo_installazione': costo_installazione, 
-    }
+COLONNINE_INIZIALI_TAB3 = {'ac_22': 2} # Mix iniziale della Sezione C (gli altri tipi a 0)
+INTERVALLO_AGGIORNAMENTO_JOB = 0.5 # Secondi tra due letture dello stato dei job in background
 
 # ==============================================================================
 # 2. INTERFACCIA UTENTE STREAMLIT (CON STRUTTURA UX MIGLIORATA)
 # ==============================================================================
 
+def plotly_chart_cached(nome: str, costruisci) -> None:
+    """
+    Mostra una figura Plotly costruita al massimo una volta per risultato:
+    la figura è serializzata in JSON nella cache condivisa, chiave = (risultato, lingua, nome).
+    """
+    chiave = (st.session_state.chiave_risultati_tab3, lingua, nome)
+    with stage("figura"):
+        fig_json = FIGURE_CACHE.get_or_compute(chiave, lambda: costruisci().to_json())
+    with stage("plotly_chart"):
+        st.plotly_chart(pio.from_json(fig_json), use_container_width=True)
+
+def invia_job(nome: str, passi) -> None:
+    """Accoda un calcolo nel runner condiviso, a nome della sessione (un nuovo invio annulla il precedente)."""
+    try:
+        JOB_RUNNER.submit(st.session_state.id_sessione, nome, passi)
+    except JobQueueFull:
+        st.warning(get_text("job_server_busy"))
+
+def pannello_job(nome: str, al_termine, mostra_parziale=None) -> None:
+    """
+    Avanzamento, annullamento e risultati parziali di un job della sessione.
+    Il frammento si riesegue da solo finché il job è attivo; alla fine
+    `al_termine(risultato)` salva il risultato in `st.session_state` e l'app
+    viene rieseguita per intero, una volta sola per job.
+    """
+    job = JOB_RUNNER.get(st.session_state.id_sessione, nome)
+    if job is None:
+        return
+
+    @st.fragment(run_every=INTERVALLO_AGGIORNAMENTO_JOB if job.attivo else None)
+    def _pannello():
+        job = JOB_RUNNER.get(st.session_state.id_sessione, nome)
+        if job is None:
+            return
+        if job.attivo:
+            col_avanzamento, col_annulla = st.columns([4, 1])
+            col_avanzamento.progress(job.avanzamento, text=get_text("job_running").format(percentuale=job.avanzamento * 100))
+            if col_annulla.button(get_text("job_cancel"), key=f"{nome}_annulla"):
+                job.cancel()
+            if mostra_parziale is not None and job.parziale is not None:
+                mostra_parziale(job.parziale)
+        elif st.session_state.get(f"{nome}_visto") != job.id:
+            st.session_state[f"{nome}_visto"] = job.id
+            if job.stato == COMPLETATO:
+                al_termine(job.risultato)
+            st.rerun()
+        elif job.stato == ANNULLATO:
+            st.info(get_text("job_cancelled"))
+        elif job.stato == ERRORE:
+            st.error(get_text("job_failed").format(errore=job.errore))
+
+    _pannello()
+
 # Simula l'ambiente 'with tab3:' del tuo codice originale
 with st.container(): 
+    st.selectbox("Lingua / Language", list(LINGUE), format_func=LINGUE.get, key="lingua")
     st.header(get_text("performance_eval_header"))
     st.markdown(get_text("performance_eval_intro"))
 
     if 'risultati_tab3' not in st.session_state:
         st.session_state.risultati_tab3 = None
+    if 'id_sessione' not in st.session_state:
+        st.session_state.id_sessione = uuid.uuid4().hex
 
     # --- A. PREVISIONE DOMANDA E USO (BASE) ---
+    checkpoint("a_domanda")
     st.subheader(get_text("demand_forecast_header"))
     with st.expander(get_text("demand_forecast_header"), expanded=True):
         col_domanda1, col_domanda2 = st.columns(2)
@@ -248,6 +126,7 @@ with st.container():
             tempo_turnover_tab3 = st.number_input(get_text("turnover_time"), 0.0, 1.0, 0.25, step=0.05, key="tab3_tempo_turnover")
 
     # --- B. CONFIGURAZIONE OPERATIVA E DISPONIBILITÀ ---
+    checkpoint("b_operativa")
     st.subheader(get_text("operational_config_header"))
     with st.expander(get_text("operational_config_header"), expanded=False):
         col_op1, col_op2 = st.columns(2)
@@ -256,22 +135,51 @@ with st.container():
             giorni_attivi_tab3 = st.slider(get_text("annual_op_days"), 1, 365, GIORNI_ANNUI_TAB3, step=5, key="tab3_giorni_op")
         with col_op2:
             utilizzo_percentuale_tab3 = st.slider(get_text("infra_utilization_prob"), 10, 100, 85, step=5, key="tab3_utilizzo")
+
+        motori_capacita = {"analitico": get_text("capacity_engine_analytic"), "simulazione": get_text("capacity_engine_simulation"), "orario": get_text("capacity_engine_hourly"), "rete": get_text("capacity_engine_grid")}
+        motore_capacita_tab3 = st.radio(get_text("capacity_engine"), list(motori_capacita), format_func=motori_capacita.get, horizontal=True, key="tab3_motore_capacita")
+        if motore_capacita_tab3 == "simulazione":
+            col_sim1, col_sim2 = st.columns(2)
+            with col_sim1:
+                pazienza_tab3 = st.slider(get_text("max_wait_minutes"), 0, 120, 30, step=5, key="tab3_pazienza")
+            with col_sim2:
+                profili_arrivo = {"uniforme": get_text("arrival_profile_uniform"), "horeca": get_text("arrival_profile_horeca")}
+                profilo_arrivi_tab3 = st.selectbox(get_text("arrival_profile"), list(profili_arrivo), index=1, format_func=profili_arrivo.get, key="tab3_profilo_arrivi")
+        elif motore_capacita_tab3 == "orario":
+            col_ora1, col_ora2 = st.columns(2)
+            with col_ora1:
+                file_domanda_tab3 = st.file_uploader(get_text("hourly_demand_profile"), type=["csv", "npy", "parquet"], key="tab3_profilo_domanda")
+            with col_ora2:
+                file_prezzi_tab3 = st.file_uploader(get_text("hourly_price_profile"), type=["csv", "npy", "parquet"], key="tab3_profilo_prezzi")
+            if file_domanda_tab3 is None:
+                st.warning(get_text("hourly_demand_profile_required"))
+        elif motore_capacita_tab3 == "rete":
+            col_rete1, col_rete2, col_rete3 = st.columns(3)
+            with col_rete1:
+                potenza_connessione_tab3 = st.number_input(get_text("grid_connection_kw"), 3, 2000, 50, step=5, key="tab3_rete_potenza")
+            with col_rete2:
+                politiche_rete = {"equa": get_text("grid_policy_equal"), "priorita": get_text("grid_policy_priority")}
+                politica_rete_tab3 = st.selectbox(get_text("grid_sharing_policy"), list(politiche_rete), format_func=politiche_rete.get, key="tab3_rete_politica")
+            with col_rete3:
+                profili_arrivo = {"uniforme": get_text("arrival_profile_uniform"), "horeca": get_text("arrival_profile_horeca")}
+                profilo_rete_tab3 = st.selectbox(get_text("arrival_profile"), list(profili_arrivo), index=1, format_func=profili_arrivo.get, key="tab3_rete_profilo")
             
     # --- C. CONFIGURAZIONE HARDWARE (CAPEX) ---
+    checkpoint("c_hardware")
     st.subheader(get_text("charger_point_config"))
     with st.expander(get_text("select_quantify_chargers"), expanded=True):
+        # Un campo per tipo del catalogo (catalogs/default.json), ripartiti su tre colonne
         cols_chargers_tab3 = st.columns(3)
-        with cols_chargers_tab3[0]:
-            ac_22_tab3 = st.number_input(get_text("ac22_chargers_eval"), 0, 50, 2, key="tab3_ac22")
-            dc_20_tab3 = st.number_input(get_text("dc20_chargers_eval"), 0, 20, 0, key="tab3_dc20")
-        with cols_chargers_tab3[1]:
-            dc_30_tab3 = st.number_input(get_text("dc30_chargers_eval"), 0, 20, 0, key="tab3_dc30")
-            dc_40_tab3 = st.number_input(get_text("dc40_chargers_eval"), 0, 20, 0, key="tab3_dc40")
-        with cols_chargers_tab3[2]:
-            dc_60_tab3 = st.number_input(get_text("dc60_chargers_eval"), 0, 20, 0, key="tab3_dc60")
-            dc_90_tab3 = st.number_input(get_text("dc90_chargers_eval"), 0, 20, 0, key="tab3_dc90")
+        colonnine_tab3 = {}
+        for i, tipo in enumerate(TIPI_COLONNINE):
+            with cols_chargers_tab3[i * 3 // len(TIPI_COLONNINE)]:
+                colonnine_tab3[tipo] = st.number_input(
+                    get_text("chargers_eval").format(nome=CATALOGO_DEFAULT.nomi[tipo]), 0, LIMITI_COLONNINE.get(tipo, LIMITE_DEFAULT),
+                    COLONNINE_INIZIALI_TAB3.get(tipo, 0), key=f"tab3_{tipo.replace('_', '')}"
+                )
 
     # --- D. PARAMETRI FINANZIARI E COSTI ANNUALI (RICAVI/OPEX) ---
+    checkpoint("d_finanziari")
     st.subheader(get_text("financial_params_header"))
     with st.expander(get_text("financial_params_header"), expanded=False):
         col_fin1, col_fin2 = st.columns(2)
@@ -288,29 +196,80 @@ with st.container():
             costo_assicurazione_annuale_tab3 = st.number_input(get_text("annual_insurance_cost"), 0, 10000, 200, step=50, key="tab3_assicurazione_annuale")
             costo_terreno_annuale_tab3 = st.number_input(get_text("annual_land_cost"), 0, 50000, 0, step=100, key="tab3_terreno_annuale")
             
-    # Bottone di Calcolo
-    if st.button(get_text("calculate_point_performance"), key="tab3_calcola", type="primary"):
-        params_tab3 = {
-            'num_auto_giorno': num_auto_giorno_tab3, 'kwh_per_auto': kwh_per_auto_tab3,
-            'tempo_ricarica_media': tempo_ricarica_media_tab3, 'tempo_turnover': tempo_turnover_tab3,
-            'ore_disponibili': ore_disponibili_tab3, 'giorni_attivi': giorni_attivi_tab3,
-            'prezzo_vendita': prezzo_vendita_tab3, 'costo_acquisto_energia_kwh': costo_acquisto_energia_kwh_tab3,
-            'utilizzo_percentuale': utilizzo_percentuale_tab3, 'budget': budget_tab3,
-            'ac_22': ac_22_tab3, 'dc_20': dc_20_tab3, 'dc_30': dc_30_tab3, 
-            'dc_40': dc_40_tab3, 'dc_60': dc_60_tab3, 'dc_90': dc_90_tab3,
-            'costo_manutenzione_annuale': costo_manutenzione_annuale_tab3,
-            'costo_software_annuale': costo_software_annuale_tab3,
-            'costo_assicurazione_annuale': costo_assicurazione_annuale_tab3,
-            'costo_terreno_annuale': costo_terreno_annuale_tab3,
-            'vita_utile_anni': vita_utile_anni_tab3
-        }
+    # Parametri correnti (usati dal calcolo e dall'ottimizzatore)
+    params_tab3 = {
+        'num_auto_giorno': num_auto_giorno_tab3, 'kwh_per_auto': kwh_per_auto_tab3,
+        'tempo_ricarica_media': tempo_ricarica_media_tab3, 'tempo_turnover': tempo_turnover_tab3,
+        'ore_disponibili': ore_disponibili_tab3, 'giorni_attivi': giorni_attivi_tab3,
+        'prezzo_vendita': prezzo_vendita_tab3, 'costo_acquisto_energia_kwh': costo_acquisto_energia_kwh_tab3,
+        'utilizzo_percentuale': utilizzo_percentuale_tab3, 'budget': budget_tab3,
+        **colonnine_tab3,
+        'costo_manutenzione_annuale': costo_manutenzione_annuale_tab3,
+        'costo_software_annuale': costo_software_annuale_tab3,
+        'costo_assicurazione_annuale': costo_assicurazione_annuale_tab3,
+        'costo_terreno_annuale': costo_terreno_annuale_tab3,
+        'vita_utile_anni': vita_utile_anni_tab3
+    }
 
-        with st.spinner(get_text("calculate_performance_spinner")):
-            risultati_tab3_temp = calculate_charging_point_performance(params_tab3)
-            st.session_state.risultati_tab3 = risultati_tab3_temp 
-        st.success(get_text("performance_analysis_complete"))
+    # Bottone di Calcolo
+    checkpoint("calcolo")
+    # Il motore orario non parte senza profilo della domanda (avviso sotto il caricamento)
+    manca_profilo_tab3 = motore_capacita_tab3 == "orario" and file_domanda_tab3 is None
+    if st.button(get_text("calculate_point_performance"), key="tab3_calcola", type="primary", disabled=manca_profilo_tab3):
+        # Chiave canonica: parametri + motore e relative opzioni (stessi input => stessi risultati)
+        if motore_capacita_tab3 == "orario":
+            opzioni_motore_tab3 = {
+                "domanda": hashlib.sha256(file_domanda_tab3.getvalue()).hexdigest(),
+                "prezzi": hashlib.sha256(file_prezzi_tab3.getvalue()).hexdigest() if file_prezzi_tab3 is not None else None,
+            }
+            calcola_tab3 = lambda: calculate_charging_point_performance_hourly(params_tab3, file_domanda_tab3, file_prezzi_tab3)
+        elif motore_capacita_tab3 == "simulazione":
+            opzioni_motore_tab3 = {"pazienza": pazienza_tab3, "profilo": profilo_arrivi_tab3}
+            calcola_tab3 = lambda: calculate_charging_point_performance_simulated(
+                params_tab3, pazienza_ore=pazienza_tab3 / 60,
+                profilo_orario=horeca_profile(ore_disponibili_tab3) if profilo_arrivi_tab3 == "horeca" else None
+            )
+        elif motore_capacita_tab3 == "rete":
+            opzioni_motore_tab3 = {"potenza": potenza_connessione_tab3, "politica": politica_rete_tab3, "profilo": profilo_rete_tab3}
+            calcola_tab3 = lambda: calculate_charging_point_performance_grid(
+                params_tab3, potenza_connessione_tab3, politica_rete_tab3, profilo_arrivi=profilo_rete_tab3
+            )
+        else:
+            opzioni_motore_tab3 = None
+            calcola_tab3 = lambda: calculate_charging_point_performance(params_tab3)
+        chiave_tab3 = scenario_key(params_tab3, motore_capacita_tab3, opzioni_motore_tab3)
+
+        # Cache del processo, poi archivio persistente condiviso con le altre sessioni e i batch.
+        # Il motore analitico no: come in batch_cli, ricalcolarlo costa meno di una lettura SQLite
+        archivio_tab3 = default_result_store() if motore_capacita_tab3 != "analitico" else None
+        if archivio_tab3 is not None:
+            calcola_locale_tab3 = calcola_tab3
+            calcola_tab3 = lambda: archivio_tab3.get_or_compute(chiave_tab3, calcola_locale_tab3)
+
+        if motore_capacita_tab3 == "analitico" or chiave_tab3 in RESULTS_CACHE:
+            with st.spinner(get_text("calculate_performance_spinner")):
+                with stage("calcolo"):
+                    st.session_state.risultati_tab3 = RESULTS_CACHE.get_or_compute(chiave_tab3, calcola_tab3)
+                st.session_state.chiave_risultati_tab3 = chiave_tab3
+                st.session_state.params_risultati_tab3 = dict(params_tab3)
+            st.success(get_text("performance_analysis_complete"))
+        else:
+            # Motori a simulazione: calcolo in background, la sessione resta reattiva
+            params_job_tab3 = dict(params_tab3)
+            invia_job("prestazioni_tab3", single_step(
+                lambda: (chiave_tab3, params_job_tab3, RESULTS_CACHE.get_or_compute(chiave_tab3, calcola_tab3))
+            ))
+
+    def applica_prestazioni_tab3(risultato):
+        chiave, params, risultati = risultato
+        st.session_state.risultati_tab3 = risultati
+        st.session_state.chiave_risultati_tab3 = chiave
+        st.session_state.params_risultati_tab3 = params
+
+    pannello_job("prestazioni_tab3", applica_prestazioni_tab3)
     
     # --- RISULTATI E OUTPUT ---
+    checkpoint("risultati")
     
     if st.session_state.risultati_tab3 is not None:
         risultati_tab3 = st.session_state.risultati_tab3
@@ -320,11 +279,23 @@ with st.container():
         st.subheader(get_text("charging_point_summary"))
         col1_tab3, col2_tab3, col3_tab3, col4_tab3 = st.columns(4)
         
-        col1_tab3.metric(get_text("total_installed_power"), f"{risultati_tab3['potenza_totale_kw']} kW")
+        col1_tab3.metric(get_text("total_installed_power"), f"{risultati_tab3['potenza_totale_kw']:g} kW")
         col2_tab3.metric(get_text("estimated_annual_energy_delivered"), f"{(risultati_tab3['energia_erogata_annuo']/1000):,.1f} MWh") # Convertito in MWh
-        col3_tab3.metric(get_text("daily_cars_served"), f"{risultati_tab3['auto_servite']}/{num_auto_giorno_tab3}")
+        col3_tab3.metric(get_text("daily_cars_served"), f"{risultati_tab3['auto_servite']}/{st.session_state.params_risultati_tab3['num_auto_giorno']}")
         col4_tab3.metric(get_text("plug_utilization_rate"), f"{risultati_tab3['tasso_utilizzo_plug']:.1f}%")
 
+        if 'sim_attesa_media_ore' in risultati_tab3: # Risultati del motore a simulazione
+            col_sim_a, col_sim_b, col_sim_c = st.columns(3)
+            col_sim_a.metric(get_text("avg_wait_time"), f"{risultati_tab3['sim_attesa_media_ore'] * 60:.0f} min")
+            col_sim_b.metric(get_text("p90_wait_time"), f"{risultati_tab3['sim_attesa_p90_ore'] * 60:.0f} min")
+            col_sim_c.metric(get_text("avg_cars_not_served"), f"{risultati_tab3['sim_auto_non_servite_media']:.1f}")
+
+        if 'rete_potenza_picco_kw' in risultati_tab3: # Risultati del motore con connessione limitata
+            col_rete_a, col_rete_b, col_rete_c = st.columns(3)
+            col_rete_a.metric(get_text("grid_peak_power"), f"{risultati_tab3['rete_potenza_picco_kw']:.1f} kW")
+            col_rete_b.metric(get_text("grid_required_peak_power"), f"{risultati_tab3['rete_potenza_richiesta_picco_kw']:.1f} kW")
+            col_rete_c.metric(get_text("grid_connection_utilization"), f"{risultati_tab3['rete_utilizzo_connessione']:.1f}%")
+
         # RIEPILOGO FINANZIARIO CHIAVE
         st.subheader(get_text("key_economic_indicators"))
         col5_tab3, col6_tab3, col7_tab3 = st.columns(3)
@@ -344,75 +315,118 @@ with st.container():
         payback_display = f"{risultati_tab3['payback_period']:.1f} {get_text('years_label')}" if risultati_tab3['payback_period'] != float('inf') else get_text('infinite_payback')
         col_payback.metric(get_text("payback_period"), payback_display)
 
-        # TABELLE E GRAFICI
-        tab3_1, tab3_2, tab3_3, tab3_4, tab3_5 = st.tabs([
-            get_text("detailed_visualization_tab"), 
-            get_text("financial_summary_tab"), 
-            get_text("payback_trend_tab"), 
-            get_text("investment_distribution_tab"),
-            get_text("operational_cost_breakdown_tab")
-        ])
+        # TABELLE E GRAFICI (solo la vista selezionata viene costruita; figure in cache per risultato)
+        params_risultati_tab3 = st.session_state.params_risultati_tab3
+        viste_tab3 = {
+            "operativa": get_text("detailed_visualization_tab"),
+            "economico": get_text("financial_summary_tab"),
+            "payback": get_text("payback_trend_tab"),
+            "capex": get_text("investment_distribution_tab"),
+            "opex": get_text("operational_cost_breakdown_tab"),
+        }
+        vista_tab3 = st.radio(get_text("charts_view_label"), list(viste_tab3), format_func=viste_tab3.get, horizontal=True, label_visibility="collapsed", key="tab3_vista")
 
-        with tab3_1: # Visualizzazione Operativa
+        if vista_tab3 == "operativa": # Visualizzazione Operativa
             st.markdown(f"#### {get_text('cars_served_vs_not_served')}")
-            df_auto = pd.DataFrame({"Category": [get_text("served_cars"), get_text("not_served_cars")], "Value": [risultati_tab3['auto_servite'], risultati_tab3['auto_non_servite']]})
-            st.plotly_chart(px.pie(df_auto, values="Value", names="Category", title=get_text("cars_served_vs_not_served"), template="plotly_white"), use_container_width=True)
+            def figura_auto():
+                with stage("dataframe"):
+                    df_auto = pd.DataFrame({"Category": [get_text("served_cars"), get_text("not_served_cars")], "Value": [risultati_tab3['auto_servite'], risultati_tab3['auto_non_servite']]})
+                return px.pie(df_auto, values="Value", names="Category", title=get_text("cars_served_vs_not_served"), template="plotly_white")
+            plotly_chart_cached("auto", figura_auto)
 
             st.markdown(f"#### {get_text('estimated_monthly_energy_delivered')}")
-            months = list(range(1, 13))
-            # Stagionalità per realismo
-            monthly_energy = [risultati_tab3['energia_erogata_annuo'] / 12 * (1 + 0.1 * math.sin(2 * math.pi * (i - 4) / 12)) for i in months] 
-            df_monthly = pd.DataFrame({"Mese": months, "EnergiaKWh": monthly_energy})
-            fig = px.line(df_monthly, x="Mese", y="EnergiaKWh", title=get_text("estimated_monthly_energy_delivered"), markers=True, template="plotly_white")
-            st.plotly_chart(fig, use_container_width=True)
-
-
-        with tab3_2: # Riepilogo Economico (Waterfall Chart)
+            def figura_mensile():
+                months = list(range(1, 13))
+                if 'energia_mensile' in risultati_tab3: # Totali mensili reali dalla modalità oraria
+                    monthly_energy = risultati_tab3['energia_mensile']
+                else:
+                    # Stagionalità per realismo
+                    monthly_energy = [risultati_tab3['energia_erogata_annuo'] / 12 * (1 + 0.1 * math.sin(2 * math.pi * (i - 4) / 12)) for i in months] 
+                with stage("dataframe"):
+                    df_monthly = pd.DataFrame({"Mese": months, "EnergiaKWh": monthly_energy})
+                return px.line(df_monthly, x="Mese", y="EnergiaKWh", title=get_text("estimated_monthly_energy_delivered"), markers=True, template="plotly_white")
+            plotly_chart_cached("mensile", figura_mensile)
+
+            if 'rete_profilo_potenza_kw' in risultati_tab3:
+                st.markdown(f"#### {get_text('grid_power_profile')}")
+                def figura_rete():
+                    with stage("dataframe"):
+                        df_rete = pd.DataFrame({
+                            "Ora": risultati_tab3['rete_ore'],
+                            get_text("delivered_power_label"): risultati_tab3['rete_profilo_potenza_kw'],
+                            get_text("requested_power_label"): risultati_tab3['rete_profilo_richiesta_kw'],
+                        })
+                    fig = px.line(df_rete, x="Ora", y=[get_text("delivered_power_label"), get_text("requested_power_label")], line_shape="hv",
+                                  title=get_text("grid_power_profile"), labels={"Ora": get_text("hour_label"), "value": get_text("power_kw_label"), "variable": ""}, template="plotly_white")
+                    fig.add_hline(y=risultati_tab3['rete_potenza_connessione_kw'], line_dash="dash", line_color="red", annotation_text=get_text("grid_limit_label"))
+                    return fig
+                plotly_chart_cached("rete", figura_rete)
+
+            if 'sim_istogramma_attese' in risultati_tab3:
+                st.markdown(f"#### {get_text('wait_time_distribution')}")
+                def figura_attese():
+                    conteggi_attese, bordi_attese = risultati_tab3['sim_istogramma_attese']
+                    with stage("dataframe"):
+                        df_attese = pd.DataFrame({"Attesa": np.asarray(bordi_attese[:-1]) * 60, "Auto": conteggi_attese})
+                    return px.bar(df_attese, x="Attesa", y="Auto", title=get_text("wait_time_distribution"), labels={"Attesa": get_text("wait_minutes_label"), "Auto": get_text("cars_label")}, template="plotly_white")
+                plotly_chart_cached("attese", figura_attese)
+
+        elif vista_tab3 == "economico": # Riepilogo Economico (Waterfall Chart)
             st.markdown(f"#### {get_text('annual_financial_summary')}")
-            df_financial_summary = pd.DataFrame({
-                "Category": [get_text("estimated_annual_revenue"), get_text("annual_operating_cost_opex"), get_text("estimated_annual_net_profit")],
-                "Value": [risultati_tab3['guadagno_annuo'], -risultati_tab3['costo_operativo_totale_annuo'], risultati_tab3['profitto_netto_annuo']],
-                "Type": [get_text("revenue_label"), get_text("cost_label_short"), get_text("profit_label_short")]
-            })
-            fig_financial_summary = px.bar(df_financial_summary, x="Category", y="Value", color="Type", 
-                                            color_discrete_map={get_text("revenue_label"): "green", get_text("cost_label_short"): "red", get_text("profit_label_short"): "blue"},
-                                            title=get_text("annual_financial_summary"), template="plotly_white")
-            st.plotly_chart(fig_financial_summary, use_container_width=True)
-
-        with tab3_3: # Andamento Payback
+            def figura_economico():
+                with stage("dataframe"):
+                    df_financial_summary = pd.DataFrame({
+                        "Category": [get_text("estimated_annual_revenue"), get_text("annual_operating_cost_opex"), get_text("estimated_annual_net_profit")],
+                        "Value": [risultati_tab3['guadagno_annuo'], -risultati_tab3['costo_operativo_totale_annuo'], risultati_tab3['profitto_netto_annuo']],
+                        "Type": [get_text("revenue_label"), get_text("cost_label_short"), get_text("profit_label_short")]
+                    })
+                return px.bar(df_financial_summary, x="Category", y="Value", color="Type", 
+                              color_discrete_map={get_text("revenue_label"): "green", get_text("cost_label_short"): "red", get_text("profit_label_short"): "blue"},
+                              title=get_text("annual_financial_summary"), template="plotly_white")
+            plotly_chart_cached("economico", figura_economico)
+
+        elif vista_tab3 == "payback": # Andamento Payback
             st.markdown(f"#### {get_text('cumulative_net_profit_trend')}")
             if risultati_tab3['profitto_netto_annuo'] > 0 and risultati_tab3['payback_period'] != float('inf'):
-                max_years = min(15, math.ceil(risultati_tab3['payback_period']) + 3)
-                years = list(range(1, max_years + 1))
-                cumulative_profit = [risultati_tab3['profitto_netto_annuo'] * y for y in years]
-                
-                df_payback = pd.DataFrame({"Anno": years, "Profitto Netto Cumulativo (€)": cumulative_profit, "Investimento Iniziale": [risultati_tab3['costo_totale_investimento']] * len(years)})
+                def figura_payback():
+                    max_years = min(15, math.ceil(risultati_tab3['payback_period']) + 3)
+                    years = list(range(1, max_years + 1))
+                    cumulative_profit = [risultati_tab3['profitto_netto_annuo'] * y for y in years]
+                    
+                    with stage("dataframe"):
+                        df_payback = pd.DataFrame({"Anno": years, "Profitto Netto Cumulativo (€)": cumulative_profit, "Investimento Iniziale": [risultati_tab3['costo_totale_investimento']] * len(years)})
 
-                fig_payback = px.line(df_payback, x="Anno", y=["Profitto Netto Cumulativo (€)", "Investimento Iniziale"], title=get_text("cumulative_net_profit_trend"), markers=True, color_discrete_map={"Profitto Netto Cumulativo (€)": "green", "Investimento Iniziale": "red"}, template="plotly_white")
-                
-                if risultati_tab3['payback_period'] > 0:
-                    fig_payback.add_vline(x=risultati_tab3['payback_period'], line_width=2, line_dash="dash", line_color="blue", annotation_text=get_text("payback_line").format(years=risultati_tab3['payback_period']), annotation_position="top right")
-                st.plotly_chart(fig_payback, use_container_width=True)
+                    fig_payback = px.line(df_payback, x="Anno", y=["Profitto Netto Cumulativo (€)", "Investimento Iniziale"], title=get_text("cumulative_net_profit_trend"), markers=True, color_discrete_map={"Profitto Netto Cumulativo (€)": "green", "Investimento Iniziale": "red"}, template="plotly_white")
+                    
+                    if risultati_tab3['payback_period'] > 0:
+                        fig_payback.add_vline(x=risultati_tab3['payback_period'], line_width=2, line_dash="dash", line_color="blue", annotation_text=get_text("payback_line").format(years=risultati_tab3['payback_period']), annotation_position="top right")
+                    return fig_payback
+                plotly_chart_cached("payback", figura_payback)
             else:
                 st.info(get_text("payback_not_calculable"))
 
-        with tab3_4: # Distribuzione Investimento (CapEx)
+        elif vista_tab3 == "capex": # Distribuzione Investimento (CapEx)
             st.markdown(f"#### {get_text('initial_investment_cost_distribution')}")
-            df_investment_breakdown = pd.DataFrame({"Component": [get_text("charger_cost_component"), get_text("installation_cost_component")], "Cost": [risultati_tab3['costo_colonnine'], risultati_tab3['costo_installazione']]})
-            st.plotly_chart(px.pie(df_investment_breakdown, values="Cost", names="Component", title=get_text("initial_investment_cost_distribution"), color_discrete_sequence=px.colors.qualitative.Set2, template="plotly_white"), use_container_width=True)
+            def figura_capex():
+                with stage("dataframe"):
+                    df_investment_breakdown = pd.DataFrame({"Component": [get_text("charger_cost_component"), get_text("installation_cost_component")], "Cost": [risultati_tab3['costo_colonnine'], risultati_tab3['costo_installazione']]})
+                return px.pie(df_investment_breakdown, values="Cost", names="Component", title=get_text("initial_investment_cost_distribution"), color_discrete_sequence=px.colors.qualitative.Set2, template="plotly_white")
+            plotly_chart_cached("capex", figura_capex)
             
-        with tab3_5: # Dettaglio Costi Operativi (OpEx)
+        elif vista_tab3 == "opex": # Dettaglio Costi Operativi (OpEx)
             st.markdown(f"#### {get_text('annual_cost_breakdown_header')}")
-            df_opex_breakdown = pd.DataFrame({
-                get_text("financial_summary_category_label"): [get_text("energy_cost_line"), get_text("amortization_cost_line"), get_text("maintenance_cost_line"), get_text("software_cost_line"), get_text("insurance_cost_line"), get_text("land_cost_line")],
-                "Valore Grezzo": [risultati_tab3['costo_operativo_energia_annuo'], risultati_tab3['costo_ammortamento_annuo'], costo_manutenzione_annuale_tab3, costo_software_annuale_tab3, costo_assicurazione_annuale_tab3, costo_terreno_annuale_tab3]
-            })
-            df_opex_breakdown[get_text("financial_summary_value_label")] = df_opex_breakdown["Valore Grezzo"].apply(lambda x: f"€{x:,.0f}")
-
-            total_row = pd.DataFrame({get_text("financial_summary_category_label"): [get_text("total_opex_line")], get_text("financial_summary_value_label"): [f"€{risultati_tab3['costo_operativo_totale_annuo']:,.0f}"]})
-            df_opex_breakdown = pd.concat([df_opex_breakdown.drop(columns="Valore Grezzo"), total_row], ignore_index=True)
+            with stage("dataframe"):
+                df_opex_breakdown = pd.DataFrame({
+                    get_text("financial_summary_category_label"): [get_text("energy_cost_line"), get_text("amortization_cost_line"), get_text("maintenance_cost_line"), get_text("software_cost_line"), get_text("insurance_cost_line"), get_text("land_cost_line")],
+                    "Valore Grezzo": [risultati_tab3['costo_operativo_energia_annuo'], risultati_tab3['costo_ammortamento_annuo'], params_risultati_tab3['costo_manutenzione_annuale'], params_risultati_tab3['costo_software_annuale'], params_risultati_tab3['costo_assicurazione_annuale'], params_risultati_tab3['costo_terreno_annuale']]
+                })
+                df_opex_breakdown[get_text("financial_summary_value_label")] = df_opex_breakdown["Valore Grezzo"].apply(lambda x: f"€{x:,.0f}")
+
+                total_row = pd.DataFrame({get_text("financial_summary_category_label"): [get_text("total_opex_line")], get_text("financial_summary_value_label"): [f"€{risultati_tab3['costo_operativo_totale_annuo']:,.0f}"]})
+                df_opex_breakdown = pd.concat([df_opex_breakdown.drop(columns="Valore Grezzo"), total_row], ignore_index=True)
             
-            st.table(df_opex_breakdown)
+            with stage("st_dataframe"):
+                st.table(df_opex_breakdown)
 
 
         # RACCOMANDAZIONI
@@ -438,3 +452,256 @@ with st.container():
                     st.error(get_text("investment_over_budget"))
             else:
                 st.info("Esegui l'analisi per visualizzare le raccomandazioni.")
+
+    # --- E. OTTIMIZZAZIONE MIX COLONNINE ---
+    checkpoint("e_ottimizzatore")
+    st.divider()
+    st.subheader(get_text("charger_mix_optimizer_header"))
+    with st.expander(get_text("charger_mix_optimizer_header"), expanded=False):
+        obiettivi_opt = {
+            "ROI": get_text("optimizer_objective_roi"),
+            "payback_period": get_text("optimizer_objective_payback"),
+            "auto_servite": get_text("optimizer_objective_cars"),
+        }
+        col_opt1, col_opt2 = st.columns(2)
+        with col_opt1:
+            obiettivo_opt = st.selectbox(get_text("optimizer_objective"), list(obiettivi_opt), format_func=obiettivi_opt.get, key="tab3_opt_obiettivo")
+        with col_opt2:
+            top_k_opt = st.number_input(get_text("optimizer_top_k"), 1, 50, 10, step=1, key="tab3_opt_top_k")
+
+        # In background: l'enumerazione dei mix può richiedere secondi con budget alti
+        if st.button(get_text("run_optimizer"), key="tab3_opt_calcola"):
+            argomenti_opt = (dict(params_tab3), obiettivo_opt, int(top_k_opt))
+            invia_job("ottimizzazione_tab3", single_step(lambda: optimize_charger_mix(*argomenti_opt)))
+
+        def applica_ottimizzazione(df_opt):
+            st.session_state.ottimizzazione_tab3 = df_opt
+
+        pannello_job("ottimizzazione_tab3", applica_ottimizzazione)
+        job_opt = JOB_RUNNER.get(st.session_state.id_sessione, "ottimizzazione_tab3")
+        if st.session_state.get("ottimizzazione_tab3") is not None and (job_opt is None or not job_opt.attivo):
+            df_opt = st.session_state.ottimizzazione_tab3
+            if df_opt.empty:
+                st.info(get_text("optimizer_no_results"))
+            else:
+                with stage("st_dataframe"):
+                    st.dataframe(df_opt[[*TIPI_COLONNINE, "costo_totale_investimento", "auto_servite", "profitto_netto_annuo", "ROI", "payback_period"]], use_container_width=True)
+
+    # --- F. ANALISI DI RISCHIO MONTE CARLO ---
+    checkpoint("f_monte_carlo")
+    st.subheader(get_text("monte_carlo_header"))
+    with st.expander(get_text("monte_carlo_header"), expanded=False):
+        st.markdown(get_text("monte_carlo_intro"))
+        distribuzioni_mc_label = {
+            "fixed": get_text("distribution_fixed"), "uniform": get_text("distribution_uniform"),
+            "normal": get_text("distribution_normal"), "triangular": get_text("distribution_triangular"),
+        }
+        parametri_mc = {
+            "num_auto_giorno": get_text("expected_daily_cars"), "kwh_per_auto": get_text("avg_energy_per_car"),
+            "prezzo_vendita": get_text("energy_sale_price"), "costo_acquisto_energia_kwh": get_text("energy_purchase_cost"),
+            "utilizzo_percentuale": get_text("infra_utilization_prob"),
+        }
+        distribuzioni_mc = {}
+        for chiave_mc, etichetta_mc in parametri_mc.items():
+            col_mc1, col_mc2, col_mc3 = st.columns([2, 1, 1])
+            col_mc1.markdown(f"**{etichetta_mc}** ({params_tab3[chiave_mc]})")
+            nome_mc = col_mc2.selectbox(get_text("distribution_label"), list(distribuzioni_mc_label), index=3, format_func=distribuzioni_mc_label.get, key=f"tab3_mc_dist_{chiave_mc}")
+            variabilita_mc = col_mc3.slider(get_text("variability_label"), 0, 100, 20, step=5, key=f"tab3_mc_var_{chiave_mc}") / 100
+            valore_mc = params_tab3[chiave_mc]
+            if nome_mc == "uniform":
+                distribuzioni_mc[chiave_mc] = ("uniform", valore_mc * (1 - variabilita_mc), valore_mc * (1 + variabilita_mc))
+            elif nome_mc == "normal":
+                distribuzioni_mc[chiave_mc] = ("normal", valore_mc, valore_mc * variabilita_mc)
+            elif nome_mc == "triangular":
+                distribuzioni_mc[chiave_mc] = ("triangular", valore_mc * (1 - variabilita_mc), valore_mc, valore_mc * (1 + variabilita_mc))
+
+        col_mc_n, col_mc_seed = st.columns(2)
+        with col_mc_n:
+            n_estrazioni_mc = st.selectbox(get_text("monte_carlo_draws"), [100_000, 1_000_000, 5_000_000, 20_000_000], index=1, format_func=lambda n: f"{n:,}", key="tab3_mc_n")
+        with col_mc_seed:
+            seed_mc = st.number_input(get_text("monte_carlo_seed"), 0, 2**31 - 1, 42, step=1, key="tab3_mc_seed")
+
+        def mostra_monte_carlo(risultati_mc):
+            st.metric(get_text("loss_probability"), f"{risultati_mc['probabilita_perdita'] * 100:.1f}%")
+            st.dataframe(risultati_mc["sintesi"], use_container_width=True)
+
+        # In background: sintesi e probabilità di perdita si aggiornano a ogni blocco di estrazioni
+        if st.button(get_text("run_monte_carlo"), key="tab3_mc_calcola"):
+            argomenti_mc = (dict(params_tab3), distribuzioni_mc, n_estrazioni_mc, int(seed_mc))
+            invia_job("monte_carlo_tab3", lambda: (
+                (parziale["n_estrazioni"] / parziale["n_richieste"], parziale)
+                for parziale in iter_monte_carlo(*argomenti_mc[:3], seed=argomenti_mc[3], n_jobs=PROCESSI_PER_JOB)
+            ))
+
+        def applica_monte_carlo(risultati_mc):
+            st.session_state.monte_carlo_tab3 = risultati_mc
+
+        pannello_job("monte_carlo_tab3", applica_monte_carlo, mostra_monte_carlo)
+        job_mc = JOB_RUNNER.get(st.session_state.id_sessione, "monte_carlo_tab3")
+        if st.session_state.get("monte_carlo_tab3") is not None and (job_mc is None or not job_mc.attivo):
+            mostra_monte_carlo(st.session_state.monte_carlo_tab3)
+
+    # --- G. ANALISI DI SENSITIVITÀ (TORNADO) ---
+    checkpoint("g_sensitivita")
+    st.subheader(get_text("sensitivity_header"))
+    with st.expander(get_text("sensitivity_header"), expanded=False):
+        etichette_parametri = {
+            "num_auto_giorno": get_text("expected_daily_cars"), "kwh_per_auto": get_text("avg_energy_per_car"),
+            "tempo_ricarica_media": get_text("avg_charge_time"), "tempo_turnover": get_text("turnover_time"),
+            "ore_disponibili": get_text("daily_op_hours"), "giorni_attivi": get_text("annual_op_days"),
+            "utilizzo_percentuale": get_text("infra_utilization_prob"),
+            "prezzo_vendita": get_text("energy_sale_price"), "costo_acquisto_energia_kwh": get_text("energy_purchase_cost"),
+            "vita_utile_anni": get_text("useful_life_years"),
+            "costo_manutenzione_annuale": get_text("annual_charger_maintenance_cost"), "costo_software_annuale": get_text("annual_software_cost"),
+            "costo_assicurazione_annuale": get_text("annual_insurance_cost"), "costo_terreno_annuale": get_text("annual_land_cost"),
+            **{tipo: get_text("chargers_eval").format(nome=nome) for tipo, nome in CATALOGO_DEFAULT.nomi.items()},
+        }
+        variazione_sens = st.slider(get_text("sensitivity_variation"), 1, 50, 10, step=1, key="tab3_sens_variazione") / 100
+
+        if st.button(get_text("run_sensitivity"), key="tab3_sens_calcola"):
+            with stage("calcolo"):
+                st.session_state.sensitivita_tab3 = sensitivity_analysis(params_tab3, variazione_sens)
+
+        if st.session_state.get("sensitivita_tab3") is not None:
+            df_sens = st.session_state.sensitivita_tab3
+            st.metric(get_text("binding_limit"), get_text(f"binding_limit_{df_sens['limite_vincolante'].iloc[0]}"))
+
+            # Parametri con effetto nullo esclusi; il più influente in alto
+            with stage("dataframe"):
+                df_sens_vis = df_sens[df_sens["ampiezza"] > 0].iloc[::-1]
+                df_tornado = pd.DataFrame({
+                    "Parametro": list(df_sens_vis["parametro"].map(etichette_parametri)) * 2,
+                    "Delta": list(df_sens_vis["delta_giu"]) + list(df_sens_vis["delta_su"]),
+                    "Variazione": [f"-{variazione_sens:.0%}"] * len(df_sens_vis) + [f"+{variazione_sens:.0%}"] * len(df_sens_vis),
+                })
+            with stage("figura"):
+                fig_tornado = px.bar(df_tornado, x="Delta", y="Parametro", color="Variazione", orientation="h", barmode="overlay",
+                                     title=get_text("sensitivity_tornado_title"), labels={"Delta": get_text("profit_change_label"), "Parametro": get_text("parameter_label")},
+                                     template="plotly_white")
+            with stage("plotly_chart"):
+                st.plotly_chart(fig_tornado, use_container_width=True)
+
+            with stage("st_dataframe"):
+                st.dataframe(pd.DataFrame({
+                    get_text("parameter_label"): df_sens["parametro"].map(etichette_parametri),
+                    get_text("elasticity_label"): df_sens["elasticita"].round(3),
+                    get_text("analytic_elasticity_label"): df_sens["elasticita_analitica"].round(3),
+                }), use_container_width=True, hide_index=True)
+
+    # --- H. FLUSSI DI CASSA PLURIENNALI ---
+    checkpoint("h_flussi_cassa")
+    st.subheader(get_text("cash_flow_header"))
+    with st.expander(get_text("cash_flow_header"), expanded=False):
+        col_cf1, col_cf2, col_cf3 = st.columns(3)
+        with col_cf1:
+            tasso_sconto_cf = st.number_input(get_text("discount_rate"), 0.0, 30.0, 7.0, step=0.5, key="tab3_cf_sconto")
+            orizzonte_cf = st.number_input(get_text("analysis_horizon"), 1, 40, 20, step=1, key="tab3_cf_orizzonte")
+        with col_cf2:
+            crescita_domanda_cf = st.number_input(get_text("demand_growth"), -20.0, 50.0, 5.0, step=0.5, key="tab3_cf_crescita")
+            degrado_cf = st.number_input(get_text("charger_degradation"), 0.0, 20.0, 1.0, step=0.5, key="tab3_cf_degrado")
+        with col_cf3:
+            indicizzazione_prezzo_cf = st.number_input(get_text("price_escalation"), -10.0, 20.0, 2.0, step=0.5, key="tab3_cf_ind_prezzo")
+            indicizzazione_energia_cf = st.number_input(get_text("energy_cost_escalation"), -10.0, 20.0, 2.0, step=0.5, key="tab3_cf_ind_energia")
+            indicizzazione_opex_cf = st.number_input(get_text("opex_escalation"), -10.0, 20.0, 2.0, step=0.5, key="tab3_cf_ind_opex")
+
+        if st.button(get_text("run_cash_flow"), key="tab3_cf_calcola"):
+            with stage("calcolo"):
+                st.session_state.flussi_cassa_tab3 = calculate_cash_flows(
+                    params_tab3, tasso_sconto_cf / 100, int(orizzonte_cf),
+                    crescita_domanda=crescita_domanda_cf / 100, indicizzazione_prezzo=indicizzazione_prezzo_cf / 100,
+                    indicizzazione_costo_energia=indicizzazione_energia_cf / 100, indicizzazione_opex=indicizzazione_opex_cf / 100,
+                    degrado_annuo=degrado_cf / 100,
+                )
+
+        if st.session_state.get("flussi_cassa_tab3") is not None:
+            risultati_cf = st.session_state.flussi_cassa_tab3
+            col_van, col_tir, col_pb = st.columns(3)
+            col_van.metric(get_text("npv_label"), f"€{risultati_cf['VAN']:,.0f}")
+            col_tir.metric(get_text("irr_label"), f"{risultati_cf['TIR'] * 100:.1f}%" if math.isfinite(risultati_cf['TIR']) else get_text("irr_not_calculable"))
+            col_pb.metric(get_text("discounted_payback_label"), f"{risultati_cf['payback_attualizzato']:.1f} {get_text('years_label')}" if math.isfinite(risultati_cf['payback_attualizzato']) else get_text('infinite_payback'))
+
+            df_piano = risultati_cf["piano"]
+            with stage("figura"):
+                fig_cf = px.bar(df_piano, x="anno", y="flusso_cumulato_attualizzato", title=get_text("cumulative_discounted_cash_flow"),
+                                labels={"anno": get_text("year_label"), "flusso_cumulato_attualizzato": get_text("cumulative_discounted_cash_flow")}, template="plotly_white")
+            with stage("plotly_chart"):
+                st.plotly_chart(fig_cf, use_container_width=True)
+            with stage("st_dataframe"):
+                st.dataframe(df_piano.round(0), use_container_width=True, hide_index=True)
+
+    # --- I. FRONTIERA DI PARETO (MIX DI COLONNINE) ---
+    checkpoint("i_pareto")
+    st.subheader(get_text("pareto_header"))
+    with st.expander(get_text("pareto_header"), expanded=False):
+        st.markdown(get_text("pareto_intro"))
+        obiettivi_pareto = {
+            "costo_totale_investimento": get_text("total_system_cost_capex"),
+            "auto_servite": get_text("daily_cars_served"),
+            "tasso_utilizzo_plug": get_text("plug_utilization_rate"),
+            "ROI": get_text("roi_test"),
+            "payback_period": get_text("payback_period"),
+        }
+        scelti_pareto = st.multiselect(get_text("pareto_objectives"), list(obiettivi_pareto), default=list(OBIETTIVI_PARETO_DEFAULT),
+                                       format_func=obiettivi_pareto.get, key="tab3_pareto_obiettivi")
+
+        # Frontiera in cache per parametri e obiettivi (i rerun a parametri invariati non
+        # ricalcolano), calcolata in background alla prima richiesta; lo spazio hardware ha una
+        # cache propria, quindi cambiando solo prezzi o costi si rifà il conto economico e l'estrazione
+        def applica_pareto(risultato):
+            st.session_state.pareto_tab3 = risultato
+
+        df_pareto = None
+        if st.toggle(get_text("pareto_toggle"), key="tab3_pareto_attiva"):
+            if len(scelti_pareto) < 2:
+                st.warning(get_text("pareto_need_two_objectives"))
+            else:
+                chiave_pareto = canonical_hash({"pareto": params_tab3, "obiettivi": scelti_pareto})
+                df_pareto = RESULTS_CACHE.get(chiave_pareto)
+                pareto_sessione = st.session_state.get("pareto_tab3")
+                if df_pareto is None and pareto_sessione is not None and pareto_sessione[0] == chiave_pareto:
+                    df_pareto = pareto_sessione[1]
+                if df_pareto is None and st.session_state.get("pareto_tab3_inviata") != chiave_pareto:
+                    # Un solo invio per chiave: i rerun durante il calcolo non lo ripetono
+                    st.session_state.pareto_tab3_inviata = chiave_pareto
+                    argomenti_pareto = (chiave_pareto, dict(params_tab3), list(scelti_pareto))
+                    invia_job("pareto_tab3", single_step(lambda: (
+                        argomenti_pareto[0],
+                        RESULTS_CACHE.get_or_compute(argomenti_pareto[0], lambda: pareto_frontier(*argomenti_pareto[1:])),
+                    )))
+                pannello_job("pareto_tab3", applica_pareto)
+            if df_pareto is not None:
+                if df_pareto.empty:
+                    st.info(get_text("optimizer_no_results"))
+                else:
+                    st.caption(get_text("pareto_candidates").format(candidati=df_pareto.attrs["candidati"], frontiera=len(df_pareto)))
+                    with stage("figura"):
+                        fig_pareto = px.scatter(df_pareto, x="costo_totale_investimento", y="ROI", color="auto_servite",
+                                                hover_data=[*TIPI_COLONNINE, "tasso_utilizzo_plug", "payback_period"],
+                                                title=get_text("pareto_chart_title"), labels=obiettivi_pareto, template="plotly_white")
+                    with stage("plotly_chart"):
+                        st.plotly_chart(fig_pareto, use_container_width=True)
+                    with stage("st_dataframe"):
+                        st.dataframe(df_pareto[[*TIPI_COLONNINE, "costo_totale_investimento", "auto_servite", "tasso_utilizzo_plug", "profitto_netto_annuo", "ROI", "payback_period"]],
+                                     use_container_width=True, hide_index=True)
+        else:
+            # Riattivando la frontiera un calcolo annullato o fallito si può ripetere
+            st.session_state.pop("pareto_tab3_inviata", None)
+
+# ==============================================================================
+# 3. PROFILAZIONE DEL RERUN (SOLO CON AIJOSA_PROFILING)
+#    Tempi (e allocazioni) per sezione e fase del rerun appena eseguito;
+#    le stesse misure sono esportate da profiling.py per il monitoraggio.
+# ==============================================================================
+
+profilo_rerun = finish_rerun()
+if profilo_rerun is not None:
+    with st.expander(get_text("profiling_header"), expanded=False):
+        quantili_rerun = rerun_latency_quantiles()
+        col_prof1, col_prof2, col_prof3 = st.columns(3)
+        col_prof1.metric(get_text("profiling_rerun_time"), f"{profilo_rerun.durata * 1000:.1f} ms")
+        col_prof2.metric(get_text("profiling_p50"), f"{quantili_rerun[0.5] * 1000:.1f} ms")
+        col_prof3.metric(get_text("profiling_p95"), f"{quantili_rerun[0.95] * 1000:.1f} ms")
+        st.markdown(f"**{get_text('profiling_by_stage')}**")
+        st.dataframe(pd.Series(profilo_rerun.per_fase(), name="ms").sort_values(ascending=False).round(2), use_container_width=True)
+        st.markdown(f"**{get_text('profiling_by_section')}**")
+        st.dataframe(profilo_rerun.tabella().round(2), use_container_width=True, hide_index=True)
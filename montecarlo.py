@@ -0,0 +1,259 @@
+import math
+from typing import Dict, Any, Iterator, Union, Mapping, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from performance import PARAM_KEYS, compute_performance_arrays
+
+# ==============================================================================
+# ANALISI DI RISCHIO MONTE CARLO (PARALLELA, AGGREGAZIONE IN STREAMING)
+#    Le estrazioni sono divise in blocchi con seed derivati da un unico
+#    SeedSequence: stesso seed => stessi numeri, qualunque sia n_jobs.
+# ==============================================================================
+
+# Parametri che possono ricevere una distribuzione
+PARAMETRI_STOCASTICI = (
+    'num_auto_giorno', 'kwh_per_auto', 'prezzo_vendita',
+    'costo_acquisto_energia_kwh', 'utilizzo_percentuale',
+)
+
+# Metriche aggregate in uscita
+METRICHE_RISCHIO = ('profitto_netto_annuo', 'ROI', 'payback_period')
+
+# Nome distribuzione -> numero di parametri attesi
+DISTRIBUZIONI = {
+    'fixed': 1,       # (valore,)
+    'uniform': 2,     # (minimo, massimo)
+    'normal': 2,      # (media, deviazione standard)
+    'triangular': 3,  # (minimo, moda, massimo)
+}
+
+DIMENSIONE_BLOCCO = 200_000
+
+Distribuzione = Union[float, int, Tuple[Any, ...]]
+
+
+class QuantileSketch:
+    """
+    Sketch dei quantili a errore relativo (bucket logaritmici, stile DDSketch).
+    Memoria fissa indipendente dal numero di valori, fusione esatta per somma
+    dei contatori: il risultato non dipende dall'ordine dei blocchi.
+    """
+
+    def __init__(self, accuratezza: float = 0.005, minimo: float = 1e-6, massimo: float = 1e12):
+        self.accuratezza = accuratezza
+        self.gamma = (1 + accuratezza) / (1 - accuratezza)
+        self._log_gamma = math.log(self.gamma)
+        self._minimo_assoluto = minimo
+        self._offset = math.floor(math.log(minimo) / self._log_gamma)
+        num_bucket = math.ceil(math.log(massimo) / self._log_gamma) - self._offset + 1
+        self.positivi = np.zeros(num_bucket, dtype=np.int64)
+        self.negativi = np.zeros(num_bucket, dtype=np.int64)
+        self.zeri = 0
+        self.infiniti = 0
+        self.conteggio = 0
+        self.somma = 0.0
+        self.minimo = math.inf
+        self.massimo = -math.inf
+
+    def _indici(self, valori: np.ndarray) -> np.ndarray:
+        indici = np.ceil(np.log(valori) / self._log_gamma).astype(np.int64) - self._offset
+        return np.clip(indici, 0, self.positivi.shape[0] - 1)
+
+    def add(self, valori: np.ndarray) -> None:
+        valori = np.asarray(valori, dtype=float).ravel()
+        infiniti = np.isposinf(valori)
+        finiti = valori[np.isfinite(valori)]
+        self.infiniti += int(infiniti.sum())
+        self.conteggio += int(finiti.shape[0]) + int(infiniti.sum())
+        if finiti.shape[0] == 0:
+            return
+        self.somma += float(finiti.sum())
+        self.minimo = min(self.minimo, float(finiti.min()))
+        self.massimo = max(self.massimo, float(finiti.max()))
+
+        assoluti = np.abs(finiti)
+        non_nulli = assoluti >= self._minimo_assoluto
+        self.zeri += int((~non_nulli).sum())
+        pos = finiti > 0
+        n = self.positivi.shape[0]
+        self.positivi += np.bincount(self._indici(assoluti[non_nulli & pos]), minlength=n)
+        self.negativi += np.bincount(self._indici(assoluti[non_nulli & ~pos]), minlength=n)
+
+    def merge(self, altro: 'QuantileSketch') -> 'QuantileSketch':
+        self.positivi += altro.positivi
+        self.negativi += altro.negativi
+        self.zeri += altro.zeri
+        self.infiniti += altro.infiniti
+        self.conteggio += altro.conteggio
+        self.somma += altro.somma
+        self.minimo = min(self.minimo, altro.minimo)
+        self.massimo = max(self.massimo, altro.massimo)
+        return self
+
+    def copy(self) -> 'QuantileSketch':
+        copia = QuantileSketch.__new__(QuantileSketch)
+        copia.__dict__.update(self.__dict__)
+        copia.positivi = self.positivi.copy()
+        copia.negativi = self.negativi.copy()
+        return copia
+
+    def mean(self) -> float:
+        """Media dei valori finiti."""
+        finiti = self.conteggio - self.infiniti
+        return self.somma / finiti if finiti > 0 else math.nan
+
+    def quantile(self, q: float) -> float:
+        """Quantile approssimato (errore relativo <= accuratezza)."""
+        if self.conteggio == 0:
+            return math.nan
+        # Ordine crescente: negativi (modulo decrescente), zeri, positivi, +inf
+        conteggi = np.concatenate([self.negativi[::-1], [self.zeri], self.positivi, [self.infiniti]])
+        posizione = int(np.searchsorted(np.cumsum(conteggi), q * (self.conteggio - 1), side='right'))
+        n = self.positivi.shape[0]
+        if posizione == 2 * n + 1:
+            return math.inf
+        if posizione == n:
+            return 0.0
+        if posizione < n:
+            segno, indice = -1.0, n - 1 - posizione
+        else:
+            segno, indice = 1.0, posizione - n - 1
+        valore = segno * 2 * self.gamma ** (indice + self._offset) / (self.gamma + 1)
+        return min(max(valore, self.minimo), self.massimo)
+
+
+def _campiona(rng: np.random.Generator, distribuzione: Distribuzione, n: int) -> np.ndarray:
+    """Estrae `n` valori dalla distribuzione indicata."""
+    if not isinstance(distribuzione, tuple):
+        return np.full(n, float(distribuzione))
+    nome, *argomenti = distribuzione
+    if nome == 'fixed':
+        return np.full(n, float(argomenti[0]))
+    if nome == 'uniform':
+        return rng.uniform(argomenti[0], argomenti[1], n)
+    if nome == 'normal':
+        return rng.normal(argomenti[0], argomenti[1], n)
+    if nome == 'triangular':
+        if argomenti[0] == argomenti[2]:
+            # Ampiezza nulla (variabilità 0 o valore 0): NumPy rifiuta left == right
+            return np.full(n, float(argomenti[1]))
+        return rng.triangular(argomenti[0], argomenti[1], argomenti[2], n)
+    raise ValueError(f"Distribuzione non supportata: {nome}")
+
+
+def _valida_distribuzioni(distribuzioni: Mapping[str, Distribuzione]) -> None:
+    for chiave, distribuzione in distribuzioni.items():
+        if chiave not in PARAMETRI_STOCASTICI:
+            raise ValueError(f"Parametro non stocastico: {chiave}. Ammessi: {', '.join(PARAMETRI_STOCASTICI)}")
+        if isinstance(distribuzione, tuple):
+            nome, *argomenti = distribuzione
+            if nome not in DISTRIBUZIONI:
+                raise ValueError(f"Distribuzione non supportata: {nome}. Ammesse: {', '.join(DISTRIBUZIONI)}")
+            if len(argomenti) != DISTRIBUZIONI[nome]:
+                raise ValueError(f"La distribuzione '{nome}' richiede {DISTRIBUZIONI[nome]} parametri.")
+
+
+def _simula_blocco(
+    params: Mapping[str, Union[int, float]],
+    distribuzioni: Mapping[str, Distribuzione],
+    seed: np.random.SeedSequence,
+    n: int,
+) -> Dict[str, Any]:
+    """Esegue `n` estrazioni e restituisce gli sketch delle metriche del blocco."""
+    rng = np.random.default_rng(seed)
+    colonne: Dict[str, np.ndarray] = {k: np.broadcast_to(params[k], n) for k in PARAM_KEYS}
+    # Ordine fisso di estrazione per la riproducibilità
+    for chiave in PARAMETRI_STOCASTICI:
+        if chiave in distribuzioni:
+            colonne[chiave] = np.maximum(_campiona(rng, distribuzioni[chiave], n), 0)
+    colonne['num_auto_giorno'] = np.rint(colonne['num_auto_giorno']).astype(np.int64)
+    colonne['utilizzo_percentuale'] = np.minimum(colonne['utilizzo_percentuale'], 100)
+
+    risultati = compute_performance_arrays(colonne)
+    sketch = {m: QuantileSketch() for m in METRICHE_RISCHIO}
+    for m in METRICHE_RISCHIO:
+        sketch[m].add(risultati[m])
+    return {'sketch': sketch, 'perdite': int((risultati['profitto_netto_annuo'] <= 0).sum()), 'n': n}
+
+
+def _sintesi(sketch: Mapping[str, QuantileSketch], percentili: Sequence[float]) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            **{f"P{p:g}": [sketch[m].quantile(p / 100) for m in METRICHE_RISCHIO] for p in percentili},
+            'media': [sketch[m].mean() for m in METRICHE_RISCHIO],
+            'min': [sketch[m].minimo for m in METRICHE_RISCHIO],
+            'max': [sketch[m].massimo for m in METRICHE_RISCHIO],
+        },
+        index=list(METRICHE_RISCHIO),
+    )
+
+
+def iter_monte_carlo(
+    params: Mapping[str, Union[int, float]],
+    distribuzioni: Mapping[str, Distribuzione],
+    n_estrazioni: int = 1_000_000,
+    seed: int = 0,
+    n_jobs: int = -1,
+    percentili: Sequence[float] = (10, 50, 90),
+    dimensione_blocco: int = DIMENSIONE_BLOCCO,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Come `run_monte_carlo`, ma restituisce il risultato parziale dopo ogni blocco
+    ridotto (`n_estrazioni` = estrazioni completate, `n_richieste` = totale):
+    l'ultimo coincide con `run_monte_carlo`. Chiudere il generatore annulla i
+    blocchi non ancora eseguiti.
+    """
+    _valida_distribuzioni(distribuzioni)
+    num_blocchi = max(1, math.ceil(n_estrazioni / dimensione_blocco))
+    seeds = np.random.SeedSequence(seed).spawn(num_blocchi)
+    dimensioni = [min(dimensione_blocco, n_estrazioni - i * dimensione_blocco) for i in range(num_blocchi)]
+
+    params = {k: params[k] for k in PARAM_KEYS}
+    distribuzioni = dict(distribuzioni)
+    blocchi = Parallel(n_jobs=n_jobs, return_as='generator')(
+        delayed(_simula_blocco)(params, distribuzioni, s, n) for s, n in zip(seeds, dimensioni)
+    )
+
+    sketch = {m: QuantileSketch() for m in METRICHE_RISCHIO}
+    perdite = 0
+    completate = 0
+    for blocco in blocchi:
+        for m in METRICHE_RISCHIO:
+            sketch[m].merge(blocco['sketch'][m])
+        perdite += blocco['perdite']
+        completate += blocco['n']
+        yield {
+            'sintesi': _sintesi(sketch, percentili),
+            'probabilita_perdita': perdite / completate if completate > 0 else math.nan,
+            'n_estrazioni': completate,
+            'n_richieste': n_estrazioni,
+            # Copia: i parziali restano validi mentre i blocchi successivi sono fusi
+            'sketch': {m: sk.copy() for m, sk in sketch.items()},
+        }
+
+
+def run_monte_carlo(
+    params: Mapping[str, Union[int, float]],
+    distribuzioni: Mapping[str, Distribuzione],
+    n_estrazioni: int = 1_000_000,
+    seed: int = 0,
+    n_jobs: int = -1,
+    percentili: Sequence[float] = (10, 50, 90),
+    dimensione_blocco: int = DIMENSIONE_BLOCCO,
+) -> Dict[str, Any]:
+    """
+    Simulazione Monte Carlo del punto di ricarica.
+
+    `distribuzioni` associa a ciascun parametro di `PARAMETRI_STOCASTICI` una
+    tupla `(nome, *parametri)` (vedi `DISTRIBUZIONI`) o un valore fisso; i
+    parametri non indicati restano quelli di `params`. I blocchi sono distribuiti
+    su un pool di processi e ridotti man mano in sketch a memoria fissa.
+    """
+    risultato = None
+    for risultato in iter_monte_carlo(params, distribuzioni, n_estrazioni, seed, n_jobs, percentili, dimensione_blocco):
+        pass
+    del risultato['n_richieste']
+    return risultato
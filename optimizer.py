@@ -0,0 +1,186 @@
+from typing import Dict, Any, Union, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from catalog import ChargerCatalog, resolve_catalog
+from performance import PARAMETRI_COSTI_FISSI, PARAMETRI_DOMANDA_E_RICAVI, compute_performance_arrays, hardware_arrays
+
+# ==============================================================================
+# OTTIMIZZATORE DEL MIX DI COLONNINE (VINCOLO DI BUDGET)
+#    Enumerazione con potatura monotona + valutazione vettoriale a blocchi.
+# ==============================================================================
+
+# Limiti massimi per tipo, come nei number_input della Sezione C (gli altri tipi del catalogo: LIMITE_DEFAULT)
+LIMITI_COLONNINE = {
+    'ac_22': 50, 'dc_20': 20, 'dc_30': 20, 'dc_40': 20, 'dc_60': 20, 'dc_90': 20,
+}
+LIMITE_DEFAULT = 20
+
+# Obiettivo -> (colonna dei risultati, True se va massimizzata)
+OBIETTIVI = {
+    'ROI': ('ROI', True),
+    'payback_period': ('payback_period', False),
+    'auto_servite': ('auto_servite', True),
+}
+
+DIMENSIONE_BLOCCO = 250_000
+
+
+def _capex_unitario(catalogo: Optional[ChargerCatalog] = None) -> np.ndarray:
+    """CapEx marginale (colonnina + installazione) di una unità di ciascun tipo."""
+    return resolve_catalog(catalogo).capex_unitario
+
+
+def _limiti(catalogo: ChargerCatalog, limiti: Optional[Mapping[str, int]]) -> Dict[str, int]:
+    base = {t: LIMITI_COLONNINE.get(t, LIMITE_DEFAULT) for t in catalogo.tipi}
+    return dict(base, **(limiti or {}))
+
+
+def _colonne_mix(base: Mapping[str, Any], blocco: np.ndarray, catalogo: ChargerCatalog) -> Dict[str, Any]:
+    """Colonne del motore per un blocco di mix: parametri ripetuti più un conteggio per tipo."""
+    n = blocco.shape[0]
+    colonne: Dict[str, Any] = {k: np.full(n, v) for k, v in base.items()}
+    colonne.update({t: blocco[:, i].astype(np.int64) for i, t in enumerate(catalogo.tipi)})
+    return colonne
+
+
+def _potatura_saturazione_esatta(params: Mapping[str, Union[int, float]], obiettivi: Sequence[str]) -> bool:
+    """
+    Vero se la potatura per saturazione non scarta mix migliori per gli obiettivi
+    (il migliore o la frontiera di Pareto: un mix scartato perde sempre contro il
+    prefisso saturo da cui deriva, ma può comunque entrare tra i primi K).
+    Oltre la saturazione l'energia erogata è la domanda, quindi il ROI vale
+    margine / CapEx - ammortamento relativo: cala con il CapEx solo se il margine
+    annuo prima dell'ammortamento non è negativo. Gli altri obiettivi peggiorano sempre.
+    """
+    if 'ROI' not in obiettivi:
+        return True
+    energia_annua = params['num_auto_giorno'] * params['kwh_per_auto'] * params['giorni_attivi']
+    margine = (
+        energia_annua * (params['prezzo_vendita'] - params['costo_acquisto_energia_kwh'])
+        - params['costo_manutenzione_annuale'] - params['costo_software_annuale']
+        - params['costo_assicurazione_annuale'] - params['costo_terreno_annuale']
+    )
+    return margine >= 0
+
+
+def enumerate_charger_mixes(
+    params: Mapping[str, Union[int, float]],
+    limiti: Optional[Mapping[str, int]] = None,
+    catalogo: Optional[ChargerCatalog] = None,
+    potatura_saturazione: bool = True,
+) -> np.ndarray:
+    """
+    Enumera i mix di colonnine candidati (una riga per mix, una colonna per tipo
+    del catalogo).
+
+    Potature, grazie alla monotonia del modello:
+    - Budget (sempre esatta): il CapEx cresce con ogni colonnina, quindi un
+      prefisso oltre budget non viene mai espanso.
+    - Saturazione (con `potatura_saturazione`): se il mix ha già capacità
+      energetica e di sessione sufficienti a coprire la domanda, aggiungere
+      colonnine non aumenta l'energia erogata ma solo il CapEx (payback e
+      utilizzo peggiorano, auto servite invariate), quindi il mix non viene
+      ulteriormente espanso. Per il ROI è esatta solo se il margine prima
+      dell'ammortamento non è negativo: va disattivata altrimenti
+      (vedi `_potatura_saturazione_esatta`).
+    """
+    catalogo = resolve_catalog(catalogo)
+    limiti = _limiti(catalogo, limiti)
+    unitario = catalogo.capex_unitario
+    potenza = catalogo.potenza_effettiva_kw
+    # Colonnine equivalenti per unità di ciascun tipo (vedi `hardware_arrays`)
+    equivalenti = hardware_arrays(
+        dict({k: params[k] for k in ('kwh_per_auto', 'tempo_ricarica_media', 'tempo_turnover')},
+             **{t: np.eye(len(catalogo), dtype=np.int64)[i] for i, t in enumerate(catalogo.tipi)}),
+        catalogo
+    )['colonnine_equivalenti']
+
+    domanda = params['num_auto_giorno'] * params['kwh_per_auto']
+    energia_per_kw = params['ore_disponibili'] * (params['utilizzo_percentuale'] / 100)
+    tempo_totale_slot = params['tempo_ricarica_media'] + params['tempo_turnover']
+    energia_per_colonnina = (
+        params['ore_disponibili'] / tempo_totale_slot * params['kwh_per_auto'] if tempo_totale_slot > 0 else 0.0
+    )
+
+    def satura(potenza_kw: np.ndarray, num_colonnine: np.ndarray) -> np.ndarray:
+        return (potenza_kw * energia_per_kw >= domanda) & (num_colonnine * energia_per_colonnina >= domanda)
+
+    # Prefissi: conteggi, CapEx, potenza e numero di colonnine accumulati
+    conteggi = np.zeros((1, 0), dtype=np.int16)
+    capex = np.zeros(1)
+    kw = np.zeros(1)
+    num = np.zeros(1)
+
+    for i, tipo in enumerate(catalogo.tipi):
+        blocchi_conteggi, blocchi_capex, blocchi_kw, blocchi_num = [], [], [], []
+        attivi = np.ones(conteggi.shape[0], dtype=bool)
+        for k in range(limiti[tipo] + 1):
+            capex_k = capex + k * unitario[i]
+            kw_k = kw + k * potenza[i]
+            num_k = num + k * equivalenti[i]
+            if k > 0:
+                # Si aggiunge un'unità solo a prefissi non ancora saturi e nel budget
+                attivi &= capex_k <= params['budget']
+                if potatura_saturazione:
+                    attivi &= ~satura(kw_k - potenza[i], num_k - equivalenti[i])
+            if not attivi.any():
+                break
+            blocchi_conteggi.append(np.column_stack([conteggi[attivi], np.full(attivi.sum(), k, dtype=np.int16)]))
+            blocchi_capex.append(capex_k[attivi])
+            blocchi_kw.append(kw_k[attivi])
+            blocchi_num.append(num_k[attivi])
+        conteggi = np.concatenate(blocchi_conteggi)
+        capex = np.concatenate(blocchi_capex)
+        kw = np.concatenate(blocchi_kw)
+        num = np.concatenate(blocchi_num)
+
+    return conteggi
+
+
+def optimize_charger_mix(
+    params: Mapping[str, Union[int, float]],
+    obiettivo: str = 'ROI',
+    top_k: int = 10,
+    limiti: Optional[Mapping[str, int]] = None,
+    dimensione_blocco: int = DIMENSIONE_BLOCCO,
+    catalogo: Optional[ChargerCatalog] = None,
+) -> pd.DataFrame:
+    """
+    Restituisce le migliori `top_k` configurazioni entro `params['budget']`
+    secondo l'obiettivo scelto ('ROI', 'payback_period' o 'auto_servite').
+    A parità di obiettivo vince il mix con CapEx minore. Le chiavi delle
+    colonnine in `params` vengono ignorate: il mix è la variabile di decisione,
+    sui tipi di `catalogo` (default: quello del processo).
+    """
+    if obiettivo not in OBIETTIVI:
+        raise ValueError(f"Obiettivo non supportato: {obiettivo}. Valori ammessi: {', '.join(OBIETTIVI)}")
+    colonna, massimizza = OBIETTIVI[obiettivo]
+
+    catalogo = resolve_catalog(catalogo)
+    # Con top_k > 1 i mix oltre la saturazione possono occupare i posti dal secondo in poi
+    potatura = top_k == 1 and _potatura_saturazione_esatta(params, [obiettivo])
+    candidati = enumerate_charger_mixes(params, limiti, catalogo, potatura)
+    base = {k: params[k] for k in PARAMETRI_DOMANDA_E_RICAVI + PARAMETRI_COSTI_FISSI}
+
+    migliori_conteggi = np.empty((0, len(catalogo)), dtype=np.int16)
+    migliori: Dict[str, np.ndarray] = {}
+
+    for inizio in range(0, candidati.shape[0], dimensione_blocco):
+        blocco = candidati[inizio:inizio + dimensione_blocco]
+        risultati = compute_performance_arrays(_colonne_mix(base, blocco, catalogo), catalogo=catalogo)
+
+        # Unione con la classifica corrente e taglio ai primi K
+        if migliori:
+            risultati = {k: np.concatenate([migliori[k], v]) for k, v in risultati.items()}
+            blocco = np.concatenate([migliori_conteggi, blocco])
+        valore = risultati[colonna].astype(float)
+        ordine = np.lexsort((risultati['costo_totale_investimento'], -valore if massimizza else valore))[:top_k]
+        migliori = {k: v[ordine] for k, v in risultati.items()}
+        migliori_conteggi = blocco[ordine]
+
+    df = pd.DataFrame(migliori_conteggi.astype(np.int64), columns=list(catalogo.tipi))
+    for k, v in migliori.items():
+        df[k] = v
+    return df
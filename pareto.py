@@ -0,0 +1,244 @@
+from typing import Any, Dict, Mapping, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from catalog import ChargerCatalog, resolve_catalog
+from optimizer import DIMENSIONE_BLOCCO, _colonne_mix, _limiti, _potatura_saturazione_esatta, enumerate_charger_mixes
+from performance import RESULT_KEYS, compute_financial_arrays, compute_operational_arrays
+from ui_cache import LRUCache, canonical_hash
+
+# ==============================================================================
+# FRONTIERA DI PARETO SUL MIX DI COLONNINE
+#    Spazio hardware (mix candidati + energia e capacità di ciascuno) calcolato
+#    una volta per domanda e configurazione operativa e tenuto in cache: se
+#    cambiano solo prezzi, costi fissi o vita utile si ricalcola il solo conto
+#    economico. La frontiera si estrae con un algoritmo di skyline
+#    (filtro di eliminazione + sort-filter), senza confronti a coppie O(n²).
+# ==============================================================================
+
+# Obiettivo -> (colonna dei risultati, True se va massimizzata), come `OBIETTIVI` dell'ottimizzatore
+OBIETTIVI_PARETO = {
+    'costo_totale_investimento': ('costo_totale_investimento', False),
+    'auto_servite': ('auto_servite', True),
+    'tasso_utilizzo_plug': ('tasso_utilizzo_plug', True),
+    'ROI': ('ROI', True),
+    'payback_period': ('payback_period', False),
+}
+OBIETTIVI_PARETO_DEFAULT = ('costo_totale_investimento', 'auto_servite', 'ROI')
+
+# Parametri da cui dipendono energia e capacità dei mix (blocchi 1-3 del modello)
+PARAMETRI_OPERATIVI = (
+    'num_auto_giorno', 'kwh_per_auto', 'tempo_ricarica_media', 'tempo_turnover',
+    'ore_disponibili', 'utilizzo_percentuale',
+)
+# Risultati dei blocchi 1-3 conservati per ogni mix dello spazio hardware
+CHIAVI_OPERATIVE = (
+    'potenza_totale_kw', 'costo_totale_investimento', 'costo_colonnine', 'costo_installazione',
+    'energia_erogata_giorno', 'auto_servite', 'auto_non_servite',
+    'tasso_utilizzo_energetico', 'tasso_utilizzo_plug',
+)
+
+MAX_SPAZI_HARDWARE = 4
+MAX_BYTE_SPAZI_HARDWARE = 256 * 2**20 # Ogni spazio può contenere milioni di mix (~80 byte ciascuno)
+CAMPIONE_SKYLINE = 1024 # Punti campionati per scegliere i filtri di eliminazione
+BLOCCO_SKYLINE = 256
+
+
+def _byte_spazio(spazio: Mapping[str, Any]) -> int:
+    return spazio['conteggi'].nbytes + sum(v.nbytes for v in spazio['operativi'].values())
+
+
+# Spazi hardware condivisi tra sessioni, come `RESULTS_CACHE`, con limite di memoria
+HARDWARE_CACHE = LRUCache(MAX_SPAZI_HARDWARE, MAX_BYTE_SPAZI_HARDWARE, _byte_spazio)
+
+
+def _valuta_spazio(params: Mapping[str, Union[int, float]], limiti: Mapping[str, int], catalogo: ChargerCatalog,
+                   potatura_saturazione: bool) -> Dict[str, Any]:
+    conteggi = enumerate_charger_mixes(params, limiti, catalogo, potatura_saturazione)
+    base = {k: params[k] for k in PARAMETRI_OPERATIVI}
+    blocchi = []
+    for inizio in range(0, conteggi.shape[0], DIMENSIONE_BLOCCO):
+        blocco = conteggi[inizio:inizio + DIMENSIONE_BLOCCO]
+        operativi = compute_operational_arrays(_colonne_mix(base, blocco, catalogo), catalogo=catalogo)
+        blocchi.append({k: operativi[k] for k in CHIAVI_OPERATIVE})
+    operativi = {k: np.concatenate([b[k] for b in blocchi]) for k in CHIAVI_OPERATIVE}
+    return {'budget': params['budget'], 'conteggi': conteggi, 'operativi': operativi}
+
+
+def hardware_space(
+    params: Mapping[str, Union[int, float]],
+    limiti: Optional[Mapping[str, int]] = None,
+    catalogo: Optional[ChargerCatalog] = None,
+    potatura_saturazione: bool = True,
+) -> Dict[str, Any]:
+    """
+    Mix candidati entro `params['budget']` (vedi `enumerate_charger_mixes`) con i
+    risultati operativi di ciascuno: {'conteggi': array (n, tipi), 'operativi': {chiave: array}}.
+
+    La cache è indicizzata dai soli `PARAMETRI_OPERATIVI`, dai limiti, dal catalogo e
+    dalla potatura per saturazione, non dai parametri finanziari. Uno spazio calcolato
+    con budget maggiore serve anche budget minori: le potature dell'enumerazione sono
+    monotone, quindi i mix entro il budget nuovo sono esattamente quelli con CapEx non superiore.
+    """
+    catalogo = resolve_catalog(catalogo)
+    limiti = _limiti(catalogo, limiti)
+    chiave = canonical_hash({
+        'operativi': {k: params[k] for k in PARAMETRI_OPERATIVI}, 'limiti': limiti, 'catalogo': catalogo.firma,
+        'saturazione': potatura_saturazione,
+    })
+    spazio = HARDWARE_CACHE.get(chiave)
+    if spazio is None or spazio['budget'] < params['budget']:
+        spazio = _valuta_spazio(params, limiti, catalogo, potatura_saturazione)
+        HARDWARE_CACHE.put(chiave, spazio)
+    if spazio['budget'] == params['budget']:
+        return spazio
+
+    entro_budget = spazio['conteggi'] @ catalogo.capex_unitario <= params['budget']
+    return {
+        'budget': params['budget'],
+        'conteggi': spazio['conteggi'][entro_budget],
+        'operativi': {k: v[entro_budget] for k, v in spazio['operativi'].items()},
+    }
+
+
+def _punteggio(valori: np.ndarray) -> np.ndarray:
+    """
+    Somma dei valori normalizzati in [0, 1] colonna per colonna (infiniti portati
+    oltre gli estremi finiti). È strettamente monotona rispetto alla dominanza:
+    se a domina b, punteggio(a) < punteggio(b).
+    """
+    punteggio = np.zeros(valori.shape[0])
+    for colonna in valori.T:
+        finiti = np.isfinite(colonna)
+        if not finiti.any():
+            continue
+        minimo, massimo = colonna[finiti].min(), colonna[finiti].max()
+        ampiezza = massimo - minimo if massimo > minimo else 1.0
+        colonna = np.clip(colonna, minimo - ampiezza, massimo + ampiezza)
+        punteggio += (colonna - minimo) / ampiezza
+    return punteggio
+
+
+def _dominati_da(colonne: Sequence[np.ndarray], filtro: np.ndarray) -> np.ndarray:
+    """Maschera dei punti (dati per colonne) dominati dal punto `filtro` (minimizzazione)."""
+    peggiori_uguali = colonne[0] >= filtro[0]
+    peggiori = colonne[0] > filtro[0]
+    for colonna, valore in zip(colonne[1:], filtro[1:]):
+        peggiori_uguali &= colonna >= valore
+        peggiori |= colonna > valore
+    return peggiori_uguali & peggiori
+
+
+def _filtro_eliminazione(valori: np.ndarray) -> np.ndarray:
+    """
+    Indici dei punti non dominati dai filtri, cioè dalla skyline di un campione
+    casuale: vicina a quella vera e quindi molto selettiva. Ogni filtro lavora
+    solo sui superstiti dei precedenti.
+    """
+    campione = np.random.default_rng(0).choice(valori.shape[0], CAMPIONE_SKYLINE, replace=False)
+    filtri = valori[campione[skyline(valori[campione])]]
+    indici = np.arange(valori.shape[0])
+    colonne = [np.ascontiguousarray(c) for c in valori.T]
+    for filtro in filtri:
+        vivi = ~_dominati_da(colonne, filtro)
+        if not vivi.all():
+            colonne = [c[vivi] for c in colonne]
+            indici = indici[vivi]
+    return indici
+
+
+def skyline(valori: np.ndarray, massimizza: Optional[Sequence[bool]] = None) -> np.ndarray:
+    """
+    Indici delle righe non dominate di `valori` (una colonna per obiettivo, da
+    minimizzare salvo dove `massimizza` è vero). Tra righe identiche ne resta una
+    sola, la prima. NaN è trattato come il valore peggiore.
+
+    Due obiettivi: ordinamento e scansione con minimo corrente, O(n log n).
+    Tre o più: LESS (Linear Elimination Sort for Skyline). Un filtro di
+    eliminazione scarta in blocco la gran parte dei dominati; i superstiti,
+    ordinati per punteggio monotono, possono essere dominati solo da punti
+    precedenti e si confrontano a blocchi con la skyline già trovata, quindi il
+    costo dipende dalla dimensione della frontiera e non da n².
+    """
+    valori = np.asarray(valori, dtype=float)
+    if valori.ndim != 2:
+        raise ValueError("valori deve essere una matrice (righe, obiettivi)")
+    n, d = valori.shape
+    if n == 0 or d == 0:
+        return np.arange(min(n, 1))
+    if massimizza is not None:
+        valori = valori * np.where(np.asarray(massimizza, dtype=bool), -1.0, 1.0)
+    if np.isnan(valori).any():
+        valori = np.where(np.isnan(valori), np.inf, valori)
+
+    # Filtro di eliminazione solo dove ripaga il campionamento
+    indici = _filtro_eliminazione(valori) if d >= 3 and n > 4 * CAMPIONE_SKYLINE else np.arange(n)
+
+    # Ordine lessicografico: i duplicati diventano adiacenti (ne resta il primo)
+    ordinati = valori[indici]
+    ordine = np.lexsort(ordinati.T[::-1])
+    ordine, ordinati = indici[ordine], ordinati[ordine]
+    nuovi = np.ones(ordinati.shape[0], dtype=bool)
+    nuovi[1:] = (ordinati[1:] != ordinati[:-1]).any(axis=1)
+    ordine, ordinati = ordine[nuovi], ordinati[nuovi]
+
+    if d == 1:
+        return ordine[:1]
+    if d == 2:
+        # Prima colonna crescente: un punto è nella frontiera se migliora la seconda
+        minimo_precedente = np.minimum.accumulate(np.concatenate([[np.inf], ordinati[:-1, 1]]))
+        return np.sort(ordine[ordinati[:, 1] < minimo_precedente])
+
+    per_punteggio = np.argsort(_punteggio(ordinati), kind='stable')
+    ordine, ordinati = ordine[per_punteggio], ordinati[per_punteggio]
+
+    frontiera = np.empty((0, d))
+    indici = []
+    for inizio in range(0, ordinati.shape[0], BLOCCO_SKYLINE):
+        blocco = ordinati[inizio:inizio + BLOCCO_SKYLINE]
+        # Dominanza rispetto alla frontiera corrente...
+        vivi = ~((frontiera[None, :, :] <= blocco[:, None, :]).all(axis=2) & (frontiera[None, :, :] < blocco[:, None, :]).any(axis=2)).any(axis=1)
+        # ...e ai punti precedenti dello stesso blocco (dominanza transitiva: vanno bene anche quelli dominati)
+        meglio_uguale = (blocco[None, :, :] <= blocco[:, None, :]).all(axis=2)
+        meglio = (blocco[None, :, :] < blocco[:, None, :]).any(axis=2)
+        vivi &= ~np.tril(meglio_uguale & meglio, k=-1).any(axis=1)
+        frontiera = np.concatenate([frontiera, blocco[vivi]])
+        indici.append(ordine[inizio:inizio + BLOCCO_SKYLINE][vivi])
+    return np.sort(np.concatenate(indici))
+
+
+def pareto_frontier(
+    params: Mapping[str, Union[int, float]],
+    obiettivi: Sequence[str] = OBIETTIVI_PARETO_DEFAULT,
+    limiti: Optional[Mapping[str, int]] = None,
+    catalogo: Optional[ChargerCatalog] = None,
+) -> pd.DataFrame:
+    """
+    Configurazioni non dominate entro `params['budget']` rispetto agli obiettivi
+    scelti, ordinate per CapEx: una riga per mix con i conteggi per tipo e tutte
+    le colonne di `RESULT_KEYS`. Le chiavi delle colonnine in `params` sono
+    ignorate. `df.attrs['candidati']` riporta il numero di mix valutati.
+    """
+    non_validi = [o for o in obiettivi if o not in OBIETTIVI_PARETO]
+    if non_validi or len(obiettivi) < 2:
+        raise ValueError(
+            f"Servono almeno due obiettivi tra: {', '.join(OBIETTIVI_PARETO)}" + (f" (non supportati: {', '.join(non_validi)})" if non_validi else "")
+        )
+
+    catalogo = resolve_catalog(catalogo)
+    spazio = hardware_space(params, limiti, catalogo, _potatura_saturazione_esatta(params, obiettivi))
+    operativi = spazio['operativi']
+    finanziari = compute_financial_arrays(params, operativi)
+    risultati = dict(operativi, **finanziari)
+
+    valori = np.column_stack([risultati[OBIETTIVI_PARETO[o][0]].astype(float) for o in obiettivi])
+    indici = skyline(valori, [OBIETTIVI_PARETO[o][1] for o in obiettivi])
+    indici = indici[np.argsort(risultati['costo_totale_investimento'][indici], kind='stable')]
+
+    conteggi = spazio['conteggi'][indici].astype(np.int64)
+    colonne = {t: conteggi[:, i] for i, t in enumerate(catalogo.tipi)}
+    colonne.update({k: np.broadcast_to(risultati[k], valori.shape[:1])[indici] for k in RESULT_KEYS})
+    df = pd.DataFrame(colonne)
+    df.attrs['candidati'] = int(valori.shape[0])
+    return df
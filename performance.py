@@ -0,0 +1,403 @@
+import math
+from typing import Dict, Any, Tuple, Union, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from catalog import ChargerCatalog, default_catalog, resolve_catalog
+from profiling import stage
+
+# ==============================================================================
+# 1. LOGICA DI CALCOLO (MIGLIORATA CON CAPACITÀ DI SERVIZIO)
+#    Motore vettoriale: una riga per scenario, stesse chiavi di `params`.
+# ==============================================================================
+
+# Catalogo delle colonnine (catalogs/default.json o `AIJOSA_CATALOGO`): i tipi
+# sono anche le chiavi dei conteggi in `params`
+CATALOGO_DEFAULT = default_catalog()
+TIPI_COLONNINE = CATALOGO_DEFAULT.tipi
+
+# Potenza di targa (kW) e prezzo (€) per tipo di colonnina
+POTENZA_COLONNINE_KW = dict(zip(TIPI_COLONNINE, CATALOGO_DEFAULT.potenza_kw.tolist()))
+COSTO_COLONNINE_EUR = dict(zip(TIPI_COLONNINE, CATALOGO_DEFAULT.prezzo_eur.tolist()))
+# Potenza media di una sessione (kW): la targa ridotta dalla curva di potenza, se presente
+POTENZA_EFFETTIVA_COLONNINE_KW = dict(zip(TIPI_COLONNINE, CATALOGO_DEFAULT.potenza_effettiva_kw.tolist()))
+
+PARAMETRI_DOMANDA_E_RICAVI = (
+    'num_auto_giorno', 'kwh_per_auto', 'tempo_ricarica_media', 'tempo_turnover',
+    'ore_disponibili', 'giorni_attivi', 'prezzo_vendita', 'costo_acquisto_energia_kwh',
+    'utilizzo_percentuale', 'budget',
+)
+PARAMETRI_COSTI_FISSI = (
+    'costo_manutenzione_annuale', 'costo_software_annuale', 'costo_assicurazione_annuale',
+    'costo_terreno_annuale', 'vita_utile_anni',
+)
+PARAM_KEYS = PARAMETRI_DOMANDA_E_RICAVI + TIPI_COLONNINE + PARAMETRI_COSTI_FISSI
+
+RESULT_KEYS = (
+    'potenza_totale_kw', 'energia_erogata_annuo', 'auto_servite', 'auto_non_servite',
+    'guadagno_annuo', 'costo_totale_investimento', 'costo_operativo_totale_annuo',
+    'profitto_netto_annuo', 'ROI', 'payback_period', 'entro_budget',
+    'tasso_utilizzo_energetico', 'tasso_utilizzo_plug',
+    'costo_operativo_energia_annuo', 'costo_ammortamento_annuo',
+    'costo_colonnine', 'costo_installazione',
+)
+
+
+def _dividi(numeratore: np.ndarray, denominatore: np.ndarray, condizione: np.ndarray, altrimenti: float = 0.0) -> np.ndarray:
+    """Divisione elemento per elemento valutata solo dove `condizione` è vera."""
+    numeratore, denominatore = np.broadcast_arrays(
+        np.asarray(numeratore, dtype=float), np.asarray(denominatore, dtype=float)
+    )
+    out = np.full(numeratore.shape, altrimenti, dtype=float)
+    return np.divide(numeratore, denominatore, out=out, where=condizione)
+
+
+def _chiavi_parametri(catalogo: Optional[ChargerCatalog] = None) -> Tuple[str, ...]:
+    """Chiavi richieste negli scenari: `PARAM_KEYS` con i tipi del catalogo al posto di quelli di default."""
+    if catalogo is None:
+        return PARAM_KEYS
+    return PARAMETRI_DOMANDA_E_RICAVI + catalogo.tipi + PARAMETRI_COSTI_FISSI
+
+
+def _colonne_scenari(scenari: Union[pd.DataFrame, Mapping[str, Any]], catalogo: Optional[ChargerCatalog] = None) -> Dict[str, np.ndarray]:
+    """Estrae le colonne richieste come array NumPy 1-D della stessa lunghezza."""
+    chiavi = _chiavi_parametri(catalogo)
+    mancanti = [k for k in chiavi if k not in scenari]
+    if mancanti:
+        raise KeyError(f"Parametri mancanti negli scenari: {', '.join(mancanti)}")
+    colonne = {k: np.atleast_1d(np.asarray(scenari[k])) for k in chiavi}
+    lunghezze = {v.shape[0] for v in colonne.values()}
+    if len(lunghezze) > 1:
+        raise ValueError("Tutte le colonne degli scenari devono avere la stessa lunghezza.")
+    return colonne
+
+
+def hardware_arrays(colonne: Mapping[str, np.ndarray], catalogo: Optional[ChargerCatalog] = None) -> Dict[str, np.ndarray]:
+    """
+    Blocco 1 del modello come prodotti scalari tra la matrice dei conteggi
+    (scenari, tipi) e le colonne del catalogo: CapEx, potenza di targa, potenza
+    media effettiva (curve di potenza) e numero di colonnine.
+
+    `colonnine_equivalenti` conta le colonnine in sessioni di durata standard
+    (`tempo_ricarica_media + tempo_turnover`): un tipo con curva di potenza
+    troppo lento per erogare `kwh_per_auto` nel tempo medio tiene occupato il
+    posto più a lungo e vale meno di una colonnina. Senza curve coincide con
+    `num_totale_colonnine`.
+    """
+    catalogo = resolve_catalog(catalogo)
+    p = colonne
+    conteggi = catalogo.conteggi(p)
+
+    totali = conteggi @ catalogo.per_unita
+    potenza_totale_kw, costo_colonnine, costo_installazione, potenza_effettiva_kw = np.moveaxis(totali, -1, 0)
+    num_totale_colonnine = conteggi.sum(axis=-1)
+
+    if not catalogo.con_curva.any():
+        colonnine_equivalenti = num_totale_colonnine
+    else:
+        # Durata della sessione per i tipi con curva: almeno il tempo per erogare kwh_per_auto
+        tempo_ricarica = np.asarray(p['tempo_ricarica_media'], dtype=float)[..., None]
+        tempo_energia = np.asarray(p['kwh_per_auto'], dtype=float)[..., None] / catalogo.potenza_effettiva_kw[catalogo.con_curva]
+        slot_standard = tempo_ricarica + np.asarray(p['tempo_turnover'], dtype=float)[..., None]
+        slot_tipo = np.maximum(tempo_ricarica, tempo_energia) + np.asarray(p['tempo_turnover'], dtype=float)[..., None]
+        rapporto = _dividi(slot_standard, slot_tipo, slot_tipo > 0)
+        colonnine_equivalenti = (
+            conteggi[..., ~catalogo.con_curva].sum(axis=-1) + (conteggi[..., catalogo.con_curva] * rapporto).sum(axis=-1)
+        )
+
+    return {
+        'potenza_totale_kw': potenza_totale_kw,
+        'potenza_effettiva_kw': potenza_effettiva_kw,
+        'costo_colonnine': costo_colonnine,
+        'costo_installazione': costo_installazione,
+        'costo_totale_investimento': costo_colonnine + costo_installazione,
+        'num_totale_colonnine': num_totale_colonnine,
+        'colonnine_equivalenti': colonnine_equivalenti,
+    }
+
+
+def capacity_limits(colonne: Mapping[str, np.ndarray], catalogo: Optional[ChargerCatalog] = None) -> Dict[str, np.ndarray]:
+    """
+    Blocchi 1-2 del modello: CapEx, potenza installata, domanda giornaliera e i
+    due limiti di capacità (energia e sessioni), vettorizzati sugli scenari.
+    """
+    p = colonne
+
+    # 1. CONFIGURAZIONE HARDWARE E CAPEX
+    h = hardware_arrays(p, catalogo)
+
+    # 2. CAPACITÀ OPERATIVA (I due colli di bottiglia)
+    energia_massima_capacita = h['potenza_effettiva_kw'] * p['ore_disponibili'] * (p['utilizzo_percentuale'] / 100)
+
+    tempo_totale_slot = p['tempo_ricarica_media'] + p['tempo_turnover']
+    num_totale_colonnine = h['num_totale_colonnine']
+
+    slot_validi = (tempo_totale_slot > 0) & (num_totale_colonnine > 0)
+    sessioni_massime_giorno = _dividi(h['colonnine_equivalenti'] * p['ore_disponibili'], tempo_totale_slot, slot_validi)
+    energia_massima_sessioni = np.where(slot_validi, sessioni_massime_giorno * p['kwh_per_auto'], 0.0)
+
+    return dict(
+        h,
+        energia_richiesta_totale_giorno=p['num_auto_giorno'] * p['kwh_per_auto'],
+        energia_massima_capacita=energia_massima_capacita,
+        sessioni_massime_giorno=sessioni_massime_giorno,
+        energia_massima_sessioni=energia_massima_sessioni,
+    )
+
+
+def compute_operational_arrays(
+    colonne: Mapping[str, np.ndarray],
+    energia_erogata_giorno: Optional[np.ndarray] = None,
+    catalogo: Optional[ChargerCatalog] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Blocchi 1-3 del modello (hardware, capacità, energia erogata e metriche di
+    servizio): dipendono solo da domanda, configurazione operativa e mix di
+    colonnine, non da prezzi e costi. Restituisce i limiti di `capacity_limits`
+    più energia erogata giornaliera, auto servite e tassi di utilizzo.
+
+    Se `energia_erogata_giorno` è fornita (es. da un motore di simulazione), sostituisce
+    il minimo tra domanda e i due limiti di capacità analitici.
+    """
+    p = colonne
+    c = capacity_limits(p, catalogo)
+    energia_massima_capacita = c['energia_massima_capacita']
+    sessioni_massime_giorno = c['sessioni_massime_giorno']
+    energia_massima_sessioni = c['energia_massima_sessioni']
+
+    # 3. ENERGIA EROGATA EFFETTIVA E METRICHE DI SERVIZIO
+    energia_richiesta_totale_giorno = c['energia_richiesta_totale_giorno']
+    if energia_erogata_giorno is None:
+        energia_erogata_giorno = np.minimum(
+            np.minimum(energia_richiesta_totale_giorno, energia_massima_capacita),
+            energia_massima_sessioni
+        )
+
+    auto_servite = np.floor(_dividi(energia_erogata_giorno, p['kwh_per_auto'], p['kwh_per_auto'] > 0)).astype(np.int64)
+    auto_non_servite = np.maximum(0, p['num_auto_giorno'] - auto_servite)
+
+    tasso_utilizzo_plug = _dividi(auto_servite, sessioni_massime_giorno, sessioni_massime_giorno > 0) * 100
+    tasso_utilizzo_energetico = _dividi(energia_erogata_giorno, energia_massima_capacita, energia_massima_capacita > 0) * 100
+
+    return dict(
+        c,
+        energia_erogata_giorno=energia_erogata_giorno,
+        auto_servite=auto_servite,
+        auto_non_servite=auto_non_servite,
+        tasso_utilizzo_plug=tasso_utilizzo_plug,
+        tasso_utilizzo_energetico=tasso_utilizzo_energetico,
+    )
+
+
+def compute_financial_arrays(
+    colonne: Mapping[str, np.ndarray],
+    operativi: Mapping[str, np.ndarray],
+) -> Dict[str, np.ndarray]:
+    """
+    Blocco 4 del modello (conto economico annuo) a partire dai risultati di
+    `compute_operational_arrays`: usa solo giorni attivi, prezzi, costi fissi,
+    vita utile e budget, quindi può essere ricalcolato senza rivalutare l'hardware.
+    """
+    p = colonne
+    costo_totale_investimento = operativi['costo_totale_investimento']
+    energia_erogata_annuo = operativi['energia_erogata_giorno'] * p['giorni_attivi']
+
+    # 4. CONTO ECONOMICO (ANNUO)
+    guadagno_annuo = energia_erogata_annuo * p['prezzo_vendita']
+    costo_operativo_energia_annuo = energia_erogata_annuo * p['costo_acquisto_energia_kwh']
+
+    vita_valida = p['vita_utile_anni'] > 0
+    costo_ammortamento_annuo = np.where(
+        vita_valida,
+        _dividi(costo_totale_investimento, p['vita_utile_anni'], vita_valida),
+        costo_totale_investimento
+    )
+
+    costo_operativo_totale_annuo = (
+        costo_operativo_energia_annuo +
+        p['costo_manutenzione_annuale'] +
+        p['costo_software_annuale'] +
+        p['costo_assicurazione_annuale'] +
+        p['costo_terreno_annuale'] +
+        costo_ammortamento_annuo
+    )
+
+    profitto_netto_annuo = guadagno_annuo - costo_operativo_totale_annuo
+
+    ROI = _dividi(profitto_netto_annuo, costo_totale_investimento, costo_totale_investimento > 0) * 100
+
+    payback_period = _dividi(costo_totale_investimento, profitto_netto_annuo, profitto_netto_annuo > 0, altrimenti=np.inf)
+    payback_period[payback_period > p['vita_utile_anni']] = np.inf
+
+    return {
+        'energia_erogata_annuo': energia_erogata_annuo,
+        'guadagno_annuo': guadagno_annuo,
+        'costo_operativo_totale_annuo': costo_operativo_totale_annuo,
+        'profitto_netto_annuo': profitto_netto_annuo,
+        'ROI': ROI,
+        'payback_period': payback_period,
+        'entro_budget': costo_totale_investimento <= p['budget'],
+        'costo_operativo_energia_annuo': costo_operativo_energia_annuo,
+        'costo_ammortamento_annuo': costo_ammortamento_annuo,
+    }
+
+
+def compute_performance_arrays(
+    colonne: Mapping[str, np.ndarray],
+    energia_erogata_giorno: Optional[np.ndarray] = None,
+    catalogo: Optional[ChargerCatalog] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Nucleo vettoriale del modello: riceve array NumPy allineati (uno per chiave di
+    `PARAM_KEYS`) e restituisce un dizionario di array, uno per chiave di `RESULT_KEYS`.
+    I rami del calcolo scalare (zero slot, zero colonnine, zero kWh, payback infinito)
+    sono gestiti con maschere, nello stesso ordine di operazioni della versione scalare.
+
+    Se `energia_erogata_giorno` è fornita (es. da un motore di simulazione), sostituisce
+    il minimo tra domanda e i due limiti di capacità analitici. `catalogo` sceglie
+    i tipi di colonnina (default: `CATALOGO_DEFAULT`).
+    """
+    operativi = compute_operational_arrays(colonne, energia_erogata_giorno, catalogo)
+    finanziari = compute_financial_arrays(colonne, operativi)
+
+    # 5. RISULTATI
+    tutti = dict(operativi, **finanziari)
+    return {k: tutti[k] for k in RESULT_KEYS}
+
+
+def calculate_charging_point_performance_batch(
+    scenari: Union[pd.DataFrame, Mapping[str, Any]],
+    catalogo: Optional[ChargerCatalog] = None,
+) -> Union[pd.DataFrame, Dict[str, np.ndarray]]:
+    """
+    Calcola il rendimento di molti scenari in un unico passaggio vettoriale.
+
+    `scenari` può essere un DataFrame (una riga per scenario) oppure un dizionario
+    di array NumPy con le stesse chiavi di `params`. Restituisce un DataFrame con
+    lo stesso indice se l'input è un DataFrame, altrimenti un dizionario di array.
+    Con un `catalogo` diverso dal default servono le colonne dei suoi tipi.
+    """
+    risultati = compute_performance_arrays(_colonne_scenari(scenari, catalogo), catalogo=catalogo)
+    if isinstance(scenari, pd.DataFrame):
+        return pd.DataFrame(risultati, index=scenari.index, columns=list(RESULT_KEYS))
+    return risultati
+
+
+_TIPI_NATIVI = {int, float, bool}
+
+
+def _calcola_scalare(p: Mapping[str, Union[int, float]], catalogo: ChargerCatalog) -> Dict[str, Any]:
+    """
+    Stesse formule e stesso ordine di operazioni di `compute_performance_arrays`
+    su numeri Python: per un solo scenario evita la costruzione degli array e
+    conserva i tipi del modello originale (int per CapEx, potenza ed energia
+    quando gli ingressi sono interi).
+    """
+    # 1. CONFIGURAZIONE HARDWARE E CAPEX
+    potenza_totale_kw = costo_colonnine = costo_installazione = potenza_effettiva_kw = 0
+    num_totale_colonnine = 0
+    for tipo, (potenza, prezzo, installazione, effettiva) in zip(catalogo.tipi, catalogo.per_unita_scalari):
+        n = p[tipo]
+        potenza_totale_kw += n * potenza
+        costo_colonnine += n * prezzo
+        costo_installazione += n * installazione
+        potenza_effettiva_kw += n * effettiva
+        num_totale_colonnine += n
+    costo_totale_investimento = costo_colonnine + costo_installazione
+
+    colonnine_equivalenti = num_totale_colonnine
+    if any(catalogo.con_curva_scalari):
+        slot_standard = p['tempo_ricarica_media'] + p['tempo_turnover']
+        colonnine_senza_curva, colonnine_curva = 0, 0.0
+        for tipo, (_, _, _, effettiva), con_curva in zip(catalogo.tipi, catalogo.per_unita_scalari, catalogo.con_curva_scalari):
+            if not con_curva:
+                colonnine_senza_curva += p[tipo]
+                continue
+            slot_tipo = max(p['tempo_ricarica_media'], p['kwh_per_auto'] / effettiva) + p['tempo_turnover']
+            colonnine_curva += p[tipo] * (slot_standard / slot_tipo if slot_tipo > 0 else 0.0)
+        colonnine_equivalenti = colonnine_senza_curva + colonnine_curva
+
+    # 2. CAPACITÀ OPERATIVA (I due colli di bottiglia)
+    energia_massima_capacita = potenza_effettiva_kw * p['ore_disponibili'] * (p['utilizzo_percentuale'] / 100)
+    tempo_totale_slot = p['tempo_ricarica_media'] + p['tempo_turnover']
+    if tempo_totale_slot > 0 and num_totale_colonnine > 0:
+        sessioni_massime_giorno = (colonnine_equivalenti * p['ore_disponibili']) / tempo_totale_slot
+        energia_massima_sessioni = sessioni_massime_giorno * p['kwh_per_auto']
+    else:
+        sessioni_massime_giorno = 0
+        energia_massima_sessioni = 0
+
+    # 3. ENERGIA EROGATA EFFETTIVA E METRICHE DI SERVIZIO
+    energia_richiesta_totale_giorno = p['num_auto_giorno'] * p['kwh_per_auto']
+    energia_erogata_giorno = min(energia_richiesta_totale_giorno, energia_massima_capacita, energia_massima_sessioni)
+    energia_erogata_annuo = energia_erogata_giorno * p['giorni_attivi']
+
+    auto_servite = math.floor(energia_erogata_giorno / p['kwh_per_auto']) if p['kwh_per_auto'] > 0 else 0
+    auto_non_servite = max(0, p['num_auto_giorno'] - auto_servite)
+    tasso_utilizzo_plug = (auto_servite / sessioni_massime_giorno) * 100 if sessioni_massime_giorno > 0 else 0
+    tasso_utilizzo_energetico = (energia_erogata_giorno / energia_massima_capacita) * 100 if energia_massima_capacita > 0 else 0
+
+    # 4. CONTO ECONOMICO (ANNUO)
+    guadagno_annuo = energia_erogata_annuo * p['prezzo_vendita']
+    costo_operativo_energia_annuo = energia_erogata_annuo * p['costo_acquisto_energia_kwh']
+    costo_ammortamento_annuo = (
+        costo_totale_investimento / p['vita_utile_anni']
+        if p['vita_utile_anni'] > 0
+        else costo_totale_investimento
+    )
+    costo_operativo_totale_annuo = (
+        costo_operativo_energia_annuo +
+        p['costo_manutenzione_annuale'] +
+        p['costo_software_annuale'] +
+        p['costo_assicurazione_annuale'] +
+        p['costo_terreno_annuale'] +
+        costo_ammortamento_annuo
+    )
+    profitto_netto_annuo = guadagno_annuo - costo_operativo_totale_annuo
+    ROI = (profitto_netto_annuo / costo_totale_investimento) * 100 if costo_totale_investimento > 0 else 0
+    payback_period = costo_totale_investimento / profitto_netto_annuo if profitto_netto_annuo > 0 else float('inf')
+    if payback_period > p['vita_utile_anni']:
+        payback_period = float('inf')
+
+    # 5. RISULTATI
+    return {
+        'potenza_totale_kw': potenza_totale_kw,
+        'energia_erogata_annuo': energia_erogata_annuo,
+        'auto_servite': auto_servite,
+        'auto_non_servite': auto_non_servite,
+        'guadagno_annuo': guadagno_annuo,
+        'costo_totale_investimento': costo_totale_investimento,
+        'costo_operativo_totale_annuo': costo_operativo_totale_annuo,
+        'profitto_netto_annuo': profitto_netto_annuo,
+        'ROI': ROI,
+        'payback_period': payback_period,
+        'entro_budget': costo_totale_investimento <= p['budget'],
+        'tasso_utilizzo_energetico': tasso_utilizzo_energetico,
+        'tasso_utilizzo_plug': tasso_utilizzo_plug,
+        'costo_operativo_energia_annuo': costo_operativo_energia_annuo,
+        'costo_ammortamento_annuo': costo_ammortamento_annuo,
+        'costo_colonnine': costo_colonnine,
+        'costo_installazione': costo_installazione,
+    }
+
+
+def calculate_charging_point_performance(params: Dict[str, Union[int, float]], catalogo: Optional[ChargerCatalog] = None) -> Dict[str, Any]:
+    """
+    Calcola il rendimento e il ROI di un punto di ricarica,
+    considerando sia la capacità energetica che la capacità di servizio (sessioni).
+    Stessi risultati del motore vettoriale, calcolati su numeri Python (vedi
+    `_calcola_scalare`): tipi nativi e pochi microsecondi per chiamata.
+    """
+    catalogo = resolve_catalog(catalogo)
+    if not set(map(type, params.values())) <= _TIPI_NATIVI:
+        # Scalari NumPy (es. da una riga di DataFrame) convertiti in numeri Python
+        params = {k: v.item() if isinstance(v, np.generic) else v for k, v in params.items()}
+    try:
+        with stage('motore'):
+            return _calcola_scalare(params, catalogo)
+    except KeyError:
+        mancanti = [k for k in _chiavi_parametri(catalogo) if k not in params]
+        if mancanti:
+            raise KeyError(f"Parametri mancanti negli scenari: {', '.join(mancanti)}") from None
+        raise
@@ -0,0 +1,249 @@
+import json
+import math
+import os
+import threading
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from contextlib import nullcontext
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+# ==============================================================================
+# STRUMENTAZIONE DEI RERUN (TEMPI E ALLOCAZIONI PER FASE)
+#    Disattivata di default: `stage` restituisce un context manager vuoto e
+#    condiviso, quindi il costo è una chiamata di funzione. Con
+#    AIJOSA_PROFILING=1 si misurano i tempi, con AIJOSA_PROFILING=memoria
+#    anche le allocazioni (tracemalloc, molto più lento: solo per diagnosi).
+#    Ogni rerun completato è esportato in AIJOSA_METRICHE: righe JSON, o
+#    testo Prometheus se il file termina in `.prom`.
+# ==============================================================================
+
+MODALITA = os.environ.get('AIJOSA_PROFILING', '').strip().lower()
+PROFILAZIONE_ATTIVA = MODALITA not in ('', '0', 'off')
+MISURA_ALLOCAZIONI = MODALITA == 'memoria'
+
+PERCORSO_METRICHE_DEFAULT = os.path.join('.cache', 'metriche.jsonl')
+FINESTRA_RERUN = 1000 # Rerun recenti su cui si calcolano i quantili di latenza
+QUANTILI = (0.5, 0.95, 0.99)
+FASE_WIDGET = 'widget' # Tempo della sezione non coperto da fasi misurate
+
+_NULLO = nullcontext()
+_locale = threading.local()
+_lock = threading.Lock()
+_durate_rerun: 'deque[float]' = deque(maxlen=FINESTRA_RERUN)
+_totali_fasi: Dict[str, List[float]] = defaultdict(lambda: [0.0, 0]) # fase -> [secondi, chiamate]
+_rerun_completati = 0
+_secondi_rerun = 0.0
+
+if MISURA_ALLOCAZIONI and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+
+def _percorso_metriche() -> Optional[str]:
+    """Percorso di esportazione: `AIJOSA_METRICHE`, vuota = nessuna esportazione."""
+    percorso = os.environ.get('AIJOSA_METRICHE', PERCORSO_METRICHE_DEFAULT)
+    return percorso or None
+
+
+class _Intervallo:
+    """Una fase aperta: durata totale, durata delle fasi annidate e picco di memoria."""
+
+    __slots__ = ('sezione', 'fase', 'inizio', 'figli', 'memoria_inizio', 'picco')
+
+    def __init__(self, sezione: str, fase: str):
+        self.sezione = sezione
+        self.fase = fase
+        self.figli = 0.0
+        if MISURA_ALLOCAZIONI:
+            self.memoria_inizio = self.picco = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.inizio = time.perf_counter()
+
+
+class RerunProfile:
+    """Fasi misurate in un rerun, nell'ordine di chiusura."""
+
+    def __init__(self):
+        self.timestamp = time.time()
+        self.inizio = time.perf_counter()
+        self.durata = 0.0
+        self.voci: List[Dict[str, Any]] = []
+        self._pila: List[_Intervallo] = []
+
+    def _apri(self, sezione: str, fase: str) -> None:
+        if MISURA_ALLOCAZIONI and self._pila:
+            # Il picco di tracemalloc è unico: il padre salva il suo prima dell'azzeramento
+            padre = self._pila[-1]
+            padre.picco = max(padre.picco, tracemalloc.get_traced_memory()[1])
+        self._pila.append(_Intervallo(sezione, fase))
+
+    def _chiudi(self) -> None:
+        fine = time.perf_counter()
+        intervallo = self._pila.pop()
+        durata = fine - intervallo.inizio
+        voce = {
+            'sezione': intervallo.sezione, 'fase': intervallo.fase,
+            'ms': durata * 1000, 'ms_propri': (durata - intervallo.figli) * 1000,
+        }
+        if MISURA_ALLOCAZIONI:
+            attuale, picco = tracemalloc.get_traced_memory()
+            intervallo.picco = max(intervallo.picco, picco)
+            voce['kib_picco'] = (intervallo.picco - intervallo.memoria_inizio) / 1024
+            voce['kib_netti'] = (attuale - intervallo.memoria_inizio) / 1024
+        if self._pila:
+            padre = self._pila[-1]
+            padre.figli += durata
+            if MISURA_ALLOCAZIONI:
+                padre.picco = max(padre.picco, intervallo.picco)
+        self.voci.append(voce)
+
+    def per_fase(self) -> Dict[str, float]:
+        """Millisecondi propri (senza fasi annidate) per fase, sezioni accorpate in `FASE_WIDGET`."""
+        totali: Dict[str, float] = defaultdict(float)
+        for voce in self.voci:
+            totali[voce['fase']] += voce['ms_propri']
+        return dict(totali)
+
+    def tabella(self) -> pd.DataFrame:
+        """Una riga per (sezione, fase), ordinata per tempo proprio decrescente."""
+        tabella = pd.DataFrame(self.voci)
+        if tabella.empty:
+            return tabella
+        colonne = [c for c in ('ms', 'ms_propri', 'kib_picco', 'kib_netti') if c in tabella]
+        tabella = tabella.groupby(['sezione', 'fase'], sort=False)[colonne].sum()
+        return tabella.sort_values('ms_propri', ascending=False).reset_index()
+
+    def to_record(self) -> Dict[str, Any]:
+        return {
+            'timestamp': self.timestamp,
+            'pid': os.getpid(),
+            'totale_ms': self.durata * 1000,
+            'fasi_ms': self.per_fase(),
+            'voci': self.voci,
+        }
+
+
+class _Fase:
+    __slots__ = ('profilo', 'fase')
+
+    def __init__(self, profilo: RerunProfile, fase: str):
+        self.profilo = profilo
+        self.fase = fase
+
+    def __enter__(self):
+        pila = self.profilo._pila
+        self.profilo._apri(pila[-1].sezione if pila else '', self.fase)
+
+    def __exit__(self, *eccezione):
+        self.profilo._chiudi()
+        return False
+
+
+def stage(fase: str):
+    """
+    Context manager che misura una fase del rerun in corso nel thread (calcolo,
+    DataFrame, figura, ...). Senza profilazione attiva o fuori da un rerun
+    (job in background, batch) non misura nulla.
+    """
+    if not PROFILAZIONE_ATTIVA:
+        return _NULLO
+    profilo = getattr(_locale, 'profilo', None)
+    if profilo is None:
+        return _NULLO
+    return _Fase(profilo, fase)
+
+
+def start_rerun(sezione: str) -> None:
+    """Inizia la misura di un rerun dalla sezione indicata (un rerun interrotto, es. da st.rerun, è scartato)."""
+    if not PROFILAZIONE_ATTIVA:
+        return
+    profilo = _locale.profilo = RerunProfile()
+    profilo._apri(sezione, FASE_WIDGET)
+
+
+def checkpoint(sezione: str) -> None:
+    """Chiude la sezione corrente del rerun e apre la successiva."""
+    profilo = getattr(_locale, 'profilo', None) if PROFILAZIONE_ATTIVA else None
+    if profilo is None:
+        return
+    while profilo._pila:
+        profilo._chiudi()
+    profilo._apri(sezione, FASE_WIDGET)
+
+
+def finish_rerun() -> Optional[RerunProfile]:
+    """Chiude il rerun, aggiorna le statistiche del processo e lo esporta; `None` se non attiva."""
+    global _rerun_completati, _secondi_rerun
+    profilo = getattr(_locale, 'profilo', None) if PROFILAZIONE_ATTIVA else None
+    if profilo is None:
+        return None
+    _locale.profilo = None
+    while profilo._pila:
+        profilo._chiudi()
+    profilo.durata = time.perf_counter() - profilo.inizio
+
+    with _lock:
+        _durate_rerun.append(profilo.durata)
+        _rerun_completati += 1
+        _secondi_rerun += profilo.durata
+        for voce in profilo.voci:
+            totale = _totali_fasi[voce['fase']]
+            totale[0] += voce['ms_propri'] / 1000
+            totale[1] += 1
+        _esporta(profilo)
+    return profilo
+
+
+def _quantile(ordinati: List[float], q: float) -> float:
+    """Quantile nearest-rank di una lista ordinata, come nei summary Prometheus."""
+    if not ordinati:
+        return math.nan
+    return ordinati[min(len(ordinati) - 1, max(0, math.ceil(q * len(ordinati)) - 1))]
+
+
+def rerun_latency_quantiles(quantili=QUANTILI) -> Dict[float, float]:
+    """Quantili (secondi) della durata degli ultimi `FINESTRA_RERUN` rerun del processo."""
+    with _lock:
+        durate = sorted(_durate_rerun)
+    return {q: _quantile(durate, q) for q in quantili}
+
+
+def _testo_prometheus() -> str:
+    """Metriche del processo in formato testo Prometheus (chiamata con il lock)."""
+    durate = sorted(_durate_rerun)
+    righe = [
+        '# HELP aijosa_rerun_seconds Durata dei rerun di main.py (quantili sugli ultimi rerun).',
+        '# TYPE aijosa_rerun_seconds summary',
+    ]
+    for q in QUANTILI:
+        righe.append(f'aijosa_rerun_seconds{{quantile="{q:g}"}} {_quantile(durate, q):.6f}')
+    righe += [
+        f'aijosa_rerun_seconds_sum {_secondi_rerun:.6f}',
+        f'aijosa_rerun_seconds_count {_rerun_completati}',
+        '# HELP aijosa_stage_seconds_total Tempo proprio cumulato per fase.',
+        '# TYPE aijosa_stage_seconds_total counter',
+        *(f'aijosa_stage_seconds_total{{fase="{f}"}} {s:.6f}' for f, (s, _) in sorted(_totali_fasi.items())),
+        '# HELP aijosa_stage_calls_total Numero di misure per fase.',
+        '# TYPE aijosa_stage_calls_total counter',
+        *(f'aijosa_stage_calls_total{{fase="{f}"}} {n}' for f, (_, n) in sorted(_totali_fasi.items())),
+    ]
+    return '\n'.join(righe) + '\n'
+
+
+def _esporta(profilo: RerunProfile) -> None:
+    """Scrive il rerun nel file delle metriche (chiamata con il lock)."""
+    percorso = _percorso_metriche()
+    if percorso is None:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(percorso)), exist_ok=True)
+    if percorso.endswith('.prom'):
+        # Sostituzione atomica: il collector textfile non legge mai un file a metà
+        temporaneo = f'{percorso}.{os.getpid()}.tmp'
+        with open(temporaneo, 'w', encoding='utf-8') as f:
+            f.write(_testo_prometheus())
+        os.replace(temporaneo, percorso)
+    else:
+        with open(percorso, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(profilo.to_record(), separators=(',', ':')) + '\n')
@@ -0,0 +1,230 @@
+import heapq
+import math
+from typing import Dict, Any, Union, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from catalog import ChargerCatalog, resolve_catalog
+from performance import compute_performance_arrays, _colonne_scenari
+
+# ==============================================================================
+# MOTORE DI CAPACITÀ A EVENTI DISCRETI (CODA AI PUNTI DI RICARICA)
+#    Alternativa alla formula `colonnine * ore / tempo_slot`, che assume arrivi
+#    perfettamente distribuiti: qui gli arrivi sono casuali (Poisson orario),
+#    le auto occupano il primo posto libero più veloce e rinunciano se l'attesa
+#    supera la pazienza.
+# ==============================================================================
+
+PAZIENZA_ORE = 0.5 # Attesa massima tollerata prima di rinunciare
+BIN_ATTESE_ORE = np.linspace(0, 2, 25) # Istogramma delle attese (5 minuti per classe)
+
+
+def horeca_profile(ore_disponibili: int) -> np.ndarray:
+    """
+    Profilo orario degli arrivi con due picchi (pranzo e cena) distribuiti
+    sulla finestra operativa. Restituisce pesi che sommano a 1.
+    """
+    ore = np.arange(ore_disponibili) + 0.5
+    larghezza = max(ore_disponibili / 8, 0.75)
+    pesi = (
+        np.exp(-0.5 * ((ore - 0.3 * ore_disponibili) / larghezza) ** 2) +
+        np.exp(-0.5 * ((ore - 0.75 * ore_disponibili) / larghezza) ** 2) +
+        0.1
+    )
+    return pesi / pesi.sum()
+
+
+def _durate_sessione(params: Mapping[str, Union[int, float]], potenza_effettiva_kw: np.ndarray) -> np.ndarray:
+    """
+    Occupazione del posto (h) per tipo, data la potenza media di sessione di
+    ciascun tipo: l'auto resta almeno il tempo medio di ricarica, di più se la
+    colonnina è troppo lenta per erogare `kwh_per_auto`; a cui si aggiunge il turnover.
+    La potenza non dipende da `utilizzo_percentuale` (disponibilità dei posti, vedi `simulate_plug_queue`).
+    """
+    potenza_effettiva = np.asarray(potenza_effettiva_kw, dtype=float)
+    tempo_energia = np.divide(
+        params['kwh_per_auto'], potenza_effettiva,
+        out=np.full(potenza_effettiva.shape[0], np.inf), where=potenza_effettiva > 0
+    )
+    return np.maximum(params['tempo_ricarica_media'], tempo_energia) + params['tempo_turnover']
+
+
+def _genera_arrivi(rng: np.random.Generator, num_auto_giorno: float, profilo: np.ndarray, giorni: int) -> np.ndarray:
+    """Arrivi Poisson non omogenei: restituisce gli istanti (h) ordinati per giorno, shape (giorni, max_arrivi) con NaN di riempimento."""
+    arrivi_ora = rng.poisson(num_auto_giorno * profilo, size=(giorni, profilo.shape[0]))
+    per_giorno = arrivi_ora.sum(axis=1)
+    larghezza = int(per_giorno.max()) if giorni > 0 else 0
+    istanti = np.full((giorni, larghezza), np.nan)
+    ore = np.repeat(np.tile(np.arange(profilo.shape[0]), giorni), arrivi_ora.ravel())
+    giorno = np.repeat(np.arange(giorni), per_giorno)
+    posizione = np.arange(ore.shape[0]) - np.repeat(np.cumsum(per_giorno) - per_giorno, per_giorno)
+    istanti[giorno, posizione] = ore + rng.random(ore.shape[0])
+    istanti.sort(axis=1) # I NaN finiscono in coda
+    return istanti
+
+
+def simulate_plug_queue(
+    params: Mapping[str, Union[int, float]],
+    giorni: int = 365,
+    pazienza_ore: float = PAZIENZA_ORE,
+    profilo_orario: Optional[Sequence[float]] = None,
+    seed: int = 0,
+    catalogo: Optional[ChargerCatalog] = None,
+) -> Dict[str, Any]:
+    """
+    Simula `giorni` giornate operative di un sito con un ciclo a eventi su heap.
+
+    Gli eventi in coda sono tuple compatte `(istante_fine, rango_tipo)`: un posto
+    torna libero quando il suo evento esce dall'heap. La coda è FIFO, quindi
+    l'attesa di un'auto è nota al suo arrivo e la rinuncia non richiede eventi
+    dedicati. Un'auto è servita se la sessione inizia entro `ore_disponibili`.
+
+    `utilizzo_percentuale` è la disponibilità dei posti, come nel motore analitico
+    (dove riduce la capacità energetica): ogni giorno ciascun posto è fuori servizio
+    per l'intera giornata con probabilità 1 - `utilizzo_percentuale` / 100, mentre le
+    sessioni avvengono a piena potenza. L'utilizzo è riferito ai posti installati.
+    """
+    ore_disponibili = int(math.ceil(params['ore_disponibili']))
+    profilo = np.full(ore_disponibili, 1 / ore_disponibili) if profilo_orario is None else np.asarray(profilo_orario, dtype=float)
+    if profilo.shape[0] != ore_disponibili:
+        raise ValueError("Il profilo orario deve avere un peso per ogni ora operativa.")
+    profilo = profilo / profilo.sum()
+
+    # Tipi presenti ordinati dal più veloce: rango 0 = priorità massima
+    catalogo = resolve_catalog(catalogo)
+    indici = sorted((i for i, t in enumerate(catalogo.tipi) if params[t] > 0), key=lambda i: -catalogo.potenza_kw[i])
+    tipi = [catalogo.tipi[i] for i in indici]
+    posti = [int(params[t]) for t in tipi]
+    durate = _durate_sessione(params, catalogo.potenza_effettiva_kw[indici]).tolist()
+    chiusura = float(params['ore_disponibili'])
+
+    rng = np.random.default_rng(seed)
+    istanti = _genera_arrivi(rng, params['num_auto_giorno'], profilo, giorni)
+    # Posti in servizio per giorno, estratti dopo gli arrivi: a parità di seed gli arrivi non cambiano
+    disponibilita = min(max(params['utilizzo_percentuale'] / 100, 0.0), 1.0)
+    if disponibilita < 1:
+        posti_giorno = rng.binomial(posti, disponibilita, size=(giorni, len(posti))).tolist()
+    else:
+        posti_giorno = [posti] * giorni
+
+    arrivi_giorno = np.count_nonzero(~np.isnan(istanti), axis=1)
+    servite_giorno = np.zeros(giorni, dtype=np.int64)
+    ore_occupate = np.zeros(len(tipi))
+    attese = np.empty(int(arrivi_giorno.sum()), dtype=np.float32)
+    num_attese = 0
+
+    heappop, heappush = heapq.heappop, heapq.heappush
+    for g in range(giorni):
+        liberi = list(posti_giorno[g])
+        totale_liberi = sum(liberi)
+        occupati: list = [] # heap di (istante_fine, rango)
+        servite = 0
+        for t in istanti[g, :arrivi_giorno[g]].tolist():
+            while occupati and occupati[0][0] <= t:
+                liberi[heappop(occupati)[1]] += 1
+                totale_liberi += 1
+
+            if totale_liberi:
+                rango = 0
+                while not liberi[rango]:
+                    rango += 1
+                liberi[rango] -= 1
+                totale_liberi -= 1
+                inizio = t
+            elif occupati and occupati[0][0] - t <= pazienza_ore and occupati[0][0] < chiusura:
+                inizio, rango = heappop(occupati)
+            else:
+                continue # Rinuncia: attesa troppo lunga o sito saturo fino a chiusura
+
+            fine = inizio + durate[rango]
+            heappush(occupati, (fine, rango))
+            ore_occupate[rango] += min(fine, chiusura) - inizio
+            attese[num_attese] = inizio - t
+            num_attese += 1
+            servite += 1
+        servite_giorno[g] = servite
+
+    attese = attese[:num_attese]
+    ore_posto = np.array(posti, dtype=float) * chiusura * giorni
+    utilizzo_per_tipo = {
+        t: float(ore_occupate[r] / ore_posto[r] * 100) if ore_posto[r] > 0 else 0.0 for r, t in enumerate(tipi)
+    }
+    ha_attese = attese.shape[0] > 0
+    return {
+        'arrivi_giorno': arrivi_giorno,
+        'auto_servite_giorno': servite_giorno,
+        'auto_non_servite_giorno': arrivi_giorno - servite_giorno,
+        'auto_servite_media': float(servite_giorno.mean()) if giorni > 0 else 0.0,
+        'auto_non_servite_media': float((arrivi_giorno - servite_giorno).mean()) if giorni > 0 else 0.0,
+        'tasso_utilizzo_plug': float(ore_occupate.sum() / ore_posto.sum() * 100) if ore_posto.sum() > 0 else 0.0,
+        'utilizzo_per_tipo': utilizzo_per_tipo,
+        'attesa_media_ore': float(attese.mean()) if ha_attese else 0.0,
+        'attesa_p50_ore': float(np.percentile(attese, 50)) if ha_attese else 0.0,
+        'attesa_p90_ore': float(np.percentile(attese, 90)) if ha_attese else 0.0,
+        'attesa_p95_ore': float(np.percentile(attese, 95)) if ha_attese else 0.0,
+        'istogramma_attese': np.histogram(np.minimum(attese, BIN_ATTESE_ORE[-1]), bins=BIN_ATTESE_ORE),
+    }
+
+
+def calculate_charging_point_performance_simulated(
+    params: Dict[str, Union[int, float]],
+    giorni: int = 365,
+    pazienza_ore: float = PAZIENZA_ORE,
+    profilo_orario: Optional[Sequence[float]] = None,
+    seed: int = 0,
+    catalogo: Optional[ChargerCatalog] = None,
+) -> Dict[str, Any]:
+    """
+    Come `calculate_charging_point_performance`, ma l'energia erogata e le auto
+    servite provengono dalla simulazione a eventi invece che dalla formula di
+    capacità. Le chiavi `sim_*` riportano attese e utilizzo per tipo.
+    """
+    sim = simulate_plug_queue(params, giorni, pazienza_ore, profilo_orario, seed, catalogo)
+    energia_giorno = np.array([sim['auto_servite_media'] * params['kwh_per_auto']])
+    colonne = _colonne_scenari(params, catalogo)
+    risultati = {k: v[0].item() for k, v in compute_performance_arrays(colonne, energia_giorno, catalogo).items()}
+    risultati['tasso_utilizzo_plug'] = sim['tasso_utilizzo_plug']
+    risultati.update({
+        'sim_auto_non_servite_media': sim['auto_non_servite_media'],
+        'sim_attesa_media_ore': sim['attesa_media_ore'],
+        'sim_attesa_p90_ore': sim['attesa_p90_ore'],
+        'sim_utilizzo_per_tipo': sim['utilizzo_per_tipo'],
+        # Liste come nei motori orario e di rete: il risultato passa da JSON nell'archivio
+        'sim_istogramma_attese': [v.tolist() for v in sim['istogramma_attese']],
+    })
+    return risultati
+
+
+def _riepilogo_sito(params: Mapping[str, Union[int, float]], giorni: int, pazienza_ore: float, seed: np.random.SeedSequence,
+                   catalogo: Optional[ChargerCatalog]) -> Dict[str, float]:
+    sim = simulate_plug_queue(params, giorni, pazienza_ore, seed=seed, catalogo=catalogo)
+    return {
+        'auto_servite_media': sim['auto_servite_media'],
+        'auto_non_servite_media': sim['auto_non_servite_media'],
+        'tasso_utilizzo_plug': sim['tasso_utilizzo_plug'],
+        'attesa_media_ore': sim['attesa_media_ore'],
+        'attesa_p90_ore': sim['attesa_p90_ore'],
+    }
+
+
+def simulate_plug_queue_batch(
+    scenari: pd.DataFrame,
+    giorni: int = 365,
+    pazienza_ore: float = PAZIENZA_ORE,
+    seed: int = 0,
+    n_jobs: int = -1,
+    catalogo: Optional[ChargerCatalog] = None,
+) -> pd.DataFrame:
+    """
+    Simula `giorni` giornate per ogni sito (riga) di `scenari` su un pool di
+    processi. Ogni sito riceve un seed derivato, quindi il risultato è
+    riproducibile indipendentemente da `n_jobs`.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(len(scenari))
+    righe = scenari.to_dict(orient='records')
+    riepiloghi = Parallel(n_jobs=n_jobs, batch_size='auto')(
+        delayed(_riepilogo_sito)(r, giorni, pazienza_ore, s, catalogo) for r, s in zip(righe, seeds)
+    )
+    return pd.DataFrame(riepiloghi, index=scenari.index)
@@ -0,0 +1,356 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from catalog import ChargerCatalog, resolve_catalog
+from performance import _chiavi_parametri
+
+# ==============================================================================
+# ARCHIVIO PERSISTENTE DEI RISULTATI (INDIRIZZATO PER CONTENUTO)
+#    Database SQLite locale in modalità WAL: più worker Streamlit e processi
+#    batch possono leggere e scrivere insieme. La chiave è l'hash dei parametri
+#    normalizzati, del motore e della versione del modello.
+# ==============================================================================
+
+# Da incrementare a ogni modifica delle formule: invalida tutti i risultati salvati
+VERSIONE_MODELLO = "2"
+
+PERCORSO_DEFAULT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'risultati.sqlite')
+MAX_VOCI = 1_000_000
+MAX_BYTE = 512 * 2**20
+DIMENSIONE_LOTTO = 500 # Limite di variabili per query SQLite
+SOGLIA_ACCESSI = 10_000 # Ultimi accessi accumulati in memoria prima di una scrittura dedicata
+RISOLUZIONE_ACCESSI = 60.0 # Secondi: un accesso più recente di così non viene registrato di nuovo
+FRAZIONE_DOPO_EVICTION = 0.9 # L'eviction scende sotto i limiti con margine, per non ripetersi a ogni scrittura
+
+
+def _prefisso_chiave(motore: str, opzioni: Any, catalogo: Optional[ChargerCatalog]) -> bytes:
+    voci = {'versione': VERSIONE_MODELLO, 'catalogo': resolve_catalog(catalogo).firma, 'motore': motore, 'opzioni': opzioni}
+    testo = json.dumps(voci, sort_keys=True, separators=(',', ':'), default=str)
+    return testo.encode('utf-8')
+
+
+def scenario_key(params: Mapping[str, Union[int, float]], motore: str = 'analitico', opzioni: Any = None,
+                 catalogo: Optional[ChargerCatalog] = None) -> str:
+    """
+    Chiave di uno scenario: SHA-256 di versione del modello, firma del catalogo
+    delle colonnine, motore, opzioni e valori dei parametri normalizzati (float64
+    nell'ordine di `PARAM_KEYS`), così `2` e `2.0` o un ordine diverso delle
+    chiavi danno la stessa chiave.
+    """
+    valori = np.array([params[k] for k in _chiavi_parametri(catalogo)], dtype=np.float64)
+    return hashlib.sha256(_prefisso_chiave(motore, opzioni, catalogo) + valori.tobytes()).hexdigest()
+
+
+def scenario_keys(scenari: pd.DataFrame, motore: str = 'analitico', opzioni: Any = None,
+                  catalogo: Optional[ChargerCatalog] = None) -> List[str]:
+    """Versione batch di `scenario_key`: una chiave per riga di `scenari`, identica a quella scalare."""
+    valori = np.ascontiguousarray(scenari[list(_chiavi_parametri(catalogo))].to_numpy(dtype=np.float64))
+    prefisso = hashlib.sha256(_prefisso_chiave(motore, opzioni, catalogo))
+    chiavi = []
+    for riga in valori:
+        h = prefisso.copy()
+        h.update(riga.tobytes())
+        chiavi.append(h.hexdigest())
+    return chiavi
+
+
+def _serializza(valore: Any) -> str:
+    return json.dumps(valore, separators=(',', ':'), default=lambda x: x.item() if isinstance(x, np.generic) else x.tolist())
+
+
+class ResultStore:
+    """
+    Archivio chiave -> risultato su SQLite: dict JSON-serializzabili (`put_many`)
+    o righe di DataFrame numerici come record binari NumPy (`put_frame`), il cui
+    dtype è registrato una volta nella tabella `formati`.
+
+    Ogni thread apre la propria connessione; le scritture sono transazioni
+    brevi con attesa sul lock (`timeout`), quindi è sicuro tra thread e processi.
+    Le letture non scrivono: gli ultimi accessi (con risoluzione
+    `RISOLUZIONE_ACCESSI`, sufficiente per l'LRU) sono accumulati in memoria e
+    registrati con la scrittura successiva (o ogni `SOGLIA_ACCESSI` letture).
+    Numero e byte delle voci sono tenuti aggiornati da trigger in `statistiche`;
+    superato `max_voci` o `max_byte`, l'eviction rimuove le voci usate meno di
+    recente scorrendo l'indice su `ultimo_accesso`, fino a `FRAZIONE_DOPO_EVICTION`
+    dei limiti.
+    """
+
+    def __init__(self, percorso: str = PERCORSO_DEFAULT, max_voci: int = MAX_VOCI, max_byte: Optional[int] = MAX_BYTE, timeout: float = 30.0):
+        self.percorso = percorso
+        self.max_voci = max_voci
+        self.max_byte = max_byte
+        self.timeout = timeout
+        self._locale = threading.local()
+        self._accessi: Dict[str, float] = {}
+        self._lock_accessi = threading.Lock()
+        self._dtype_formati: Dict[int, np.dtype] = {}
+        self._id_formati: Dict[str, int] = {}
+        cartella = os.path.dirname(os.path.abspath(percorso))
+        os.makedirs(cartella, exist_ok=True)
+        with self._scrittura() as conn:
+            # `valore`: testo JSON, oppure record binario se `formato` non è NULL
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS risultati ("
+                " chiave TEXT PRIMARY KEY, valore TEXT NOT NULL, dimensione INTEGER NOT NULL, ultimo_accesso REAL NOT NULL,"
+                " formato INTEGER)"
+            )
+            if 'formato' not in {riga[1] for riga in conn.execute("PRAGMA table_info(risultati)")}:
+                conn.execute("ALTER TABLE risultati ADD COLUMN formato INTEGER") # Archivi creati prima dei record binari
+            conn.execute("CREATE TABLE IF NOT EXISTS formati (id INTEGER PRIMARY KEY, descrizione TEXT UNIQUE NOT NULL)")
+            # Indice coprente per l'eviction: si scorrono le voci più vecchie senza leggere la tabella
+            conn.execute("DROP INDEX IF EXISTS risultati_accesso")
+            conn.execute("CREATE INDEX IF NOT EXISTS risultati_eviction ON risultati (ultimo_accesso, dimensione)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS statistiche ("
+                " id INTEGER PRIMARY KEY CHECK (id = 0), voci INTEGER NOT NULL, byte INTEGER NOT NULL)"
+            )
+            conn.execute("INSERT OR IGNORE INTO statistiche SELECT 0, COUNT(*), COALESCE(SUM(dimensione), 0) FROM risultati")
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS risultati_inserimento AFTER INSERT ON risultati BEGIN"
+                " UPDATE statistiche SET voci = voci + 1, byte = byte + NEW.dimensione WHERE id = 0; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS risultati_cancellazione AFTER DELETE ON risultati BEGIN"
+                " UPDATE statistiche SET voci = voci - 1, byte = byte - OLD.dimensione WHERE id = 0; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS risultati_modifica AFTER UPDATE OF dimensione ON risultati BEGIN"
+                " UPDATE statistiche SET byte = byte + NEW.dimensione - OLD.dimensione WHERE id = 0; END"
+            )
+
+    def _connessione(self) -> sqlite3.Connection:
+        conn = getattr(self._locale, 'conn', None)
+        if conn is None:
+            # Transazioni gestite a mano (`_scrittura`), senza BEGIN impliciti
+            conn = sqlite3.connect(self.percorso, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._locale.conn = conn
+        return conn
+
+    @contextmanager
+    def _scrittura(self) -> Iterator[sqlite3.Connection]:
+        """
+        Transazione di scrittura con BEGIN IMMEDIATE: il lock si prende subito
+        (attendendo fino a `timeout`), così una transazione che ha già letto non
+        deve essere promossa a scrittura, causa tipica di "database is locked".
+        """
+        conn = self._connessione()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def __len__(self) -> int:
+        return self._connessione().execute("SELECT voci FROM statistiche WHERE id = 0").fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        voci, byte = self._connessione().execute("SELECT voci, byte FROM statistiche WHERE id = 0").fetchone()
+        return {'voci': voci, 'byte': byte}
+
+    # --- Lettura ---
+
+    def _leggi(self, chiavi: Sequence[str]) -> Dict[str, Tuple[Optional[int], Any]]:
+        """Righe (formato, valore) presenti per le chiavi richieste, senza lock di scrittura."""
+        conn = self._connessione()
+        righe: Dict[str, Tuple[Optional[int], Any]] = {}
+        accedute = []
+        soglia = time.time() - RISOLUZIONE_ACCESSI
+        for i in range(0, len(chiavi), DIMENSIONE_LOTTO):
+            lotto = list(chiavi[i:i + DIMENSIONE_LOTTO])
+            segnaposto = ','.join('?' * len(lotto))
+            cursore = conn.execute(f"SELECT chiave, formato, valore, ultimo_accesso FROM risultati WHERE chiave IN ({segnaposto})", lotto)
+            for chiave, formato, valore, ultimo_accesso in cursore:
+                righe[chiave] = (formato, valore)
+                if ultimo_accesso < soglia:
+                    accedute.append(chiave)
+        if accedute:
+            self._registra_accessi(accedute)
+        return righe
+
+    def _dtype(self, formato: int) -> np.dtype:
+        dtype = self._dtype_formati.get(formato)
+        if dtype is None:
+            descrizione = self._connessione().execute("SELECT descrizione FROM formati WHERE id = ?", (formato,)).fetchone()[0]
+            dtype = self._dtype_formati[formato] = np.dtype([tuple(campo) for campo in json.loads(descrizione)])
+        return dtype
+
+    def _decodifica(self, formato: Optional[int], valore: Any) -> Dict[str, Any]:
+        if formato is None:
+            return json.loads(valore)
+        record = np.frombuffer(valore, dtype=self._dtype(formato))[0]
+        return dict(zip(record.dtype.names, record.tolist()))
+
+    def get_many(self, chiavi: Sequence[str]) -> Dict[str, Any]:
+        """Risultati presenti per le chiavi richieste (le mancanti sono omesse), come dict."""
+        return {chiave: self._decodifica(*riga) for chiave, riga in self._leggi(chiavi).items()}
+
+    def get(self, chiave: str, default: Any = None) -> Any:
+        return self.get_many([chiave]).get(chiave, default)
+
+    def get_frame(self, chiavi: Sequence[str]) -> Tuple[np.ndarray, pd.DataFrame]:
+        """
+        Versione colonnare per i batch: maschera delle chiavi trovate e DataFrame
+        dei loro risultati nell'ordine di `chiavi`. I record binari di un unico
+        formato sono decodificati in blocco da NumPy, senza passare da dict.
+        """
+        righe = self._leggi(chiavi)
+        trovate = [righe.get(chiave) for chiave in chiavi]
+        maschera = np.fromiter((riga is not None for riga in trovate), dtype=bool, count=len(chiavi))
+        trovate = [riga for riga in trovate if riga is not None]
+        formati = {formato for formato, _ in trovate}
+        if len(formati) == 1 and None not in formati:
+            dtype = self._dtype(formati.pop())
+            return maschera, pd.DataFrame(np.frombuffer(b''.join(valore for _, valore in trovate), dtype=dtype))
+        # Voci JSON (salvate dall'interfaccia o da versioni precedenti) o formati misti
+        return maschera, pd.DataFrame([self._decodifica(*riga) for riga in trovate])
+
+    # --- Scrittura ---
+
+    def _registra_accessi(self, chiavi: Iterable[str]) -> None:
+        adesso = time.time()
+        with self._lock_accessi:
+            self._accessi.update(dict.fromkeys(chiavi, adesso))
+            da_scrivere = len(self._accessi) >= SOGLIA_ACCESSI
+        if da_scrivere:
+            self.flush()
+
+    def _scrivi_accessi(self, conn: sqlite3.Connection) -> None:
+        """Registra gli ultimi accessi accumulati (chiamata dentro una transazione di scrittura)."""
+        with self._lock_accessi:
+            accessi, self._accessi = self._accessi, {}
+        if accessi:
+            conn.executemany("UPDATE risultati SET ultimo_accesso = ? WHERE chiave = ?", ((t, k) for k, t in accessi.items()))
+
+    def flush(self) -> None:
+        """Scrive subito gli ultimi accessi ancora in memoria."""
+        with self._scrittura() as conn:
+            self._scrivi_accessi(conn)
+
+    def _inserisci(self, righe: List[Tuple[str, Any, int, float, Optional[int]]], formato_descrizione: Optional[str] = None) -> None:
+        with self._scrittura() as conn:
+            if formato_descrizione is not None:
+                formato = self._id_formato(conn, formato_descrizione)
+                righe = [(chiave, valore, dimensione, adesso, formato) for chiave, valore, dimensione, adesso, _ in righe]
+            conn.executemany(
+                "INSERT INTO risultati (chiave, valore, dimensione, ultimo_accesso, formato) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (chiave) DO UPDATE SET valore = excluded.valore, dimensione = excluded.dimensione,"
+                " ultimo_accesso = excluded.ultimo_accesso, formato = excluded.formato", righe
+            )
+            self._scrivi_accessi(conn)
+            self._evict(conn)
+
+    def _id_formato(self, conn: sqlite3.Connection, descrizione: str) -> int:
+        formato = self._id_formati.get(descrizione)
+        if formato is None:
+            conn.execute("INSERT OR IGNORE INTO formati (descrizione) VALUES (?)", (descrizione,))
+            formato = self._id_formati[descrizione] = conn.execute("SELECT id FROM formati WHERE descrizione = ?", (descrizione,)).fetchone()[0]
+        return formato
+
+    def put_many(self, voci: Iterable[Tuple[str, Any]]) -> None:
+        """Inserisce (o sostituisce) più risultati in un'unica transazione, poi applica l'eviction."""
+        adesso = time.time()
+        righe = []
+        for chiave, valore in voci:
+            testo = _serializza(valore)
+            righe.append((chiave, testo, len(testo), adesso, None))
+        self._inserisci(righe)
+
+    def put(self, chiave: str, valore: Any) -> None:
+        self.put_many([(chiave, valore)])
+
+    def put_frame(self, chiavi: Sequence[str], risultati: pd.DataFrame) -> None:
+        """
+        Salva una riga di `risultati` per chiave come record binario (colonne numeriche
+        o booleane); con colonne di altro tipo ripiega sul formato JSON di `put_many`.
+        """
+        record = risultati.to_records(index=False)
+        if any(record.dtype[nome].kind not in 'biuf' for nome in record.dtype.names):
+            self.put_many(zip(chiavi, risultati.to_dict(orient='records')))
+            return
+        record = np.ascontiguousarray(record.view(np.ndarray))
+        dati = record.tobytes()
+        passo = record.dtype.itemsize
+        adesso = time.time()
+        righe = [(chiave, dati[i * passo:(i + 1) * passo], passo, adesso, None) for i, chiave in enumerate(chiavi)]
+        self._inserisci(righe, json.dumps(record.dtype.descr))
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Rimuove le voci usate meno di recente se un limite è superato (contatori da `statistiche`)."""
+        voci, byte = conn.execute("SELECT voci, byte FROM statistiche WHERE id = 0").fetchone()
+        oltre_byte = self.max_byte is not None and byte > self.max_byte
+        if voci <= self.max_voci and not oltre_byte:
+            return
+        da_togliere = voci - int(self.max_voci * FRAZIONE_DOPO_EVICTION) if voci > self.max_voci else 0
+        if oltre_byte:
+            # Quante voci, dalle più vecchie, servono a liberare i byte in eccesso (solo l'indice coprente)
+            da_liberare = byte - int(self.max_byte * FRAZIONE_DOPO_EVICTION)
+            cursore = conn.execute("SELECT dimensione FROM risultati ORDER BY ultimo_accesso, dimensione, rowid")
+            contate, liberati = 0, 0
+            while liberati < da_liberare:
+                lotto = np.array([d for (d,) in cursore.fetchmany(10_000)], dtype=np.int64)
+                if lotto.shape[0] == 0:
+                    break
+                cumulata = liberati + np.cumsum(lotto)
+                indice = int(np.searchsorted(cumulata, da_liberare))
+                if indice < lotto.shape[0]:
+                    contate += indice + 1
+                    break
+                contate += lotto.shape[0]
+                liberati = int(cumulata[-1])
+            cursore.close()
+            da_togliere = max(da_togliere, contate)
+        conn.execute(
+            "DELETE FROM risultati WHERE rowid IN"
+            " (SELECT rowid FROM risultati ORDER BY ultimo_accesso, dimensione, rowid LIMIT ?)", (da_togliere,)
+        )
+
+    def get_or_compute(self, chiave: str, calcola: Callable[[], Any]) -> Any:
+        """Come `LRUCache.get_or_compute`: il calcolo avviene fuori da ogni transazione."""
+        mancante = object()
+        valore = self.get(chiave, mancante)
+        if valore is mancante:
+            valore = calcola()
+            self.put(chiave, valore)
+        return valore
+
+    def clear(self) -> None:
+        with self._lock_accessi:
+            self._accessi = {}
+        with self._scrittura() as conn:
+            conn.execute("DELETE FROM risultati")
+
+
+def open_result_store(percorso: Optional[str] = None) -> Optional[ResultStore]:
+    """
+    Apre l'archivio indicato (o `AIJOSA_RESULT_STORE`, o quello di default).
+    Restituisce None se la variabile d'ambiente è vuota o il percorso non è
+    scrivibile: l'applicazione continua senza persistenza.
+    """
+    if percorso is None:
+        percorso = os.environ.get('AIJOSA_RESULT_STORE', PERCORSO_DEFAULT)
+    if not percorso:
+        return None
+    try:
+        return ResultStore(percorso)
+    except (OSError, sqlite3.Error):
+        return None
+
+
+@lru_cache(maxsize=None)
+def default_result_store() -> Optional[ResultStore]:
+    """Archivio condiviso dal processo (aperto una sola volta, come le cache di `ui_cache`)."""
+    return open_result_store()
@@ -0,0 +1,185 @@
+from typing import Dict, Any, Tuple, Union, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from catalog import ChargerCatalog, resolve_catalog
+from performance import (
+    PARAM_KEYS, _chiavi_parametri, _colonne_scenari, capacity_limits, compute_performance_arrays, hardware_arrays,
+)
+
+# ==============================================================================
+# ANALISI DI SENSITIVITÀ (TORNADO) CON DERIVATE ANALITICHE
+#    Il modello è lineare a tratti: l'energia erogata è il minimo tra domanda,
+#    capacità energetica e capacità di sessione. Noto il limite vincolante, la
+#    derivata del profitto rispetto a ogni parametro è in forma chiusa.
+# ==============================================================================
+
+# Parametri perturbati di default: tutti tranne il budget, che non entra nel profitto
+PARAMETRI_SENSITIVITA = tuple(k for k in PARAM_KEYS if k != 'budget')
+
+LIMITI = ('domanda', 'energia', 'sessioni')
+
+VARIAZIONE = 0.10 # ±10%
+
+
+def _parametri_sensitivita(catalogo: Optional[ChargerCatalog] = None) -> Tuple[str, ...]:
+    """`PARAMETRI_SENSITIVITA` con i tipi del catalogo al posto di quelli di default."""
+    return tuple(k for k in _chiavi_parametri(catalogo) if k != 'budget')
+
+
+def identify_binding_limit(colonne: Mapping[str, np.ndarray], catalogo: Optional[ChargerCatalog] = None) -> np.ndarray:
+    """
+    Indice del limite vincolante per ogni scenario: 0 = domanda, 1 = capacità
+    energetica, 2 = capacità di sessione (vedi `LIMITI`). A parità vince il primo,
+    come nel `min()` del modello.
+    """
+    c = capacity_limits(colonne, catalogo)
+    domanda, energia, sessioni = c['energia_richiesta_totale_giorno'], c['energia_massima_capacita'], c['energia_massima_sessioni']
+    return np.argmin(np.stack(np.broadcast_arrays(domanda, energia, sessioni)), axis=0)
+
+
+def profit_gradient(colonne: Mapping[str, np.ndarray], catalogo: Optional[ChargerCatalog] = None) -> Dict[str, np.ndarray]:
+    """
+    Derivate parziali esatte del profitto netto annuo rispetto a ogni parametro
+    di `PARAMETRI_SENSITIVITA` (con i tipi di `catalogo`), vettorizzate sugli
+    scenari. Nei punti di pareggio tra due limiti la derivata è quella del
+    limite scelto da `identify_binding_limit` (derivata unilaterale). Per i tipi con curva di
+    potenza la durata della sessione è trattata come costante rispetto a
+    `kwh_per_auto` e `tempo_ricarica_media` (derivate approssimate).
+    """
+    catalogo = resolve_catalog(catalogo)
+    p = {k: np.asarray(v, dtype=float) for k, v in colonne.items()}
+    c = capacity_limits(p, catalogo)
+    vincolo = identify_binding_limit(p, catalogo)
+    domanda, energia, sessioni = (vincolo == 0), (vincolo == 1), (vincolo == 2)
+
+    potenza_totale_kw = c['potenza_effettiva_kw']
+    num_totale_colonnine = c['colonnine_equivalenti']
+    slot = p['tempo_ricarica_media'] + p['tempo_turnover']
+    slot_sicuro = np.where(slot > 0, slot, 1.0)
+    sessioni_per_colonnina = np.where(slot > 0, p['ore_disponibili'] / slot_sicuro, 0.0) # sessioni/giorno per colonnina
+
+    margine = p['prezzo_vendita'] - p['costo_acquisto_energia_kwh'] # €/kWh
+    giorni = p['giorni_attivi']
+    energia_giorno = np.minimum(
+        np.minimum(c['energia_richiesta_totale_giorno'], c['energia_massima_capacita']), c['energia_massima_sessioni']
+    )
+    # dProfitto/dEnergia giornaliera
+    k = giorni * margine
+
+    vita = p['vita_utile_anni']
+    vita_valida = vita > 0
+    vita_sicura = np.where(vita_valida, vita, 1.0)
+    costo_totale_investimento = c['costo_totale_investimento']
+    # dAmmortamento/dCapEx
+    quota_ammortamento = np.where(vita_valida, 1 / vita_sicura, 1.0)
+
+    gradiente = {
+        'num_auto_giorno': np.where(domanda, k * p['kwh_per_auto'], 0.0),
+        'kwh_per_auto': k * np.select(
+            [domanda, sessioni], [p['num_auto_giorno'], num_totale_colonnine * sessioni_per_colonnina], 0.0
+        ),
+        'tempo_ricarica_media': np.where(
+            sessioni & (slot > 0), -k * num_totale_colonnine * p['ore_disponibili'] * p['kwh_per_auto'] / slot_sicuro ** 2, 0.0
+        ),
+        'ore_disponibili': k * np.select(
+            [energia, sessioni],
+            [potenza_totale_kw * (p['utilizzo_percentuale'] / 100), np.where(slot > 0, num_totale_colonnine / slot_sicuro, 0.0) * p['kwh_per_auto']],
+            0.0
+        ),
+        'giorni_attivi': energia_giorno * margine,
+        'prezzo_vendita': energia_giorno * giorni,
+        'costo_acquisto_energia_kwh': -energia_giorno * giorni,
+        'utilizzo_percentuale': np.where(energia, k * potenza_totale_kw * p['ore_disponibili'] / 100, 0.0),
+        'costo_manutenzione_annuale': np.full(np.shape(k), -1.0),
+        'costo_software_annuale': np.full(np.shape(k), -1.0),
+        'costo_assicurazione_annuale': np.full(np.shape(k), -1.0),
+        'costo_terreno_annuale': np.full(np.shape(k), -1.0),
+        'vita_utile_anni': np.where(vita_valida, costo_totale_investimento / vita_sicura ** 2, 0.0),
+    }
+    gradiente['tempo_turnover'] = gradiente['tempo_ricarica_media']
+    # Contributo marginale di una colonnina per tipo: potenza effettiva e colonnine equivalenti
+    unita = hardware_arrays(
+        dict(p, **{t: np.eye(len(catalogo))[i][:, None] for i, t in enumerate(catalogo.tipi)}), catalogo
+    )['colonnine_equivalenti']
+    for i, t in enumerate(catalogo.tipi):
+        gradiente[t] = k * np.select(
+            [energia, sessioni],
+            [catalogo.potenza_effettiva_kw[i] * p['ore_disponibili'] * (p['utilizzo_percentuale'] / 100), unita[i] * sessioni_per_colonnina * p['kwh_per_auto']],
+            0.0
+        ) - catalogo.capex_unitario[i] * quota_ammortamento
+    return gradiente
+
+
+def profit_elasticities(colonne: Mapping[str, np.ndarray], parametri: Optional[Sequence[str]] = None,
+                        catalogo: Optional[ChargerCatalog] = None) -> Dict[str, np.ndarray]:
+    """Elasticità analitiche del profitto: (dProfitto/dx) * x / Profitto; NaN se il profitto è nullo."""
+    parametri = list(parametri or _parametri_sensitivita(catalogo))
+    gradiente = profit_gradient(colonne, catalogo)
+    profitto = compute_performance_arrays(colonne, catalogo=catalogo)['profitto_netto_annuo']
+    profitto_sicuro = np.where(profitto != 0, profitto, 1.0)
+    return {
+        k: np.where(profitto != 0, gradiente[k] * np.asarray(colonne[k], dtype=float) / profitto_sicuro, np.nan)
+        for k in parametri
+    }
+
+
+def sensitivity_analysis(
+    params: Mapping[str, Union[int, float]],
+    variazione: float = VARIAZIONE,
+    metrica: str = 'profitto_netto_annuo',
+    parametri: Optional[Sequence[str]] = None,
+    catalogo: Optional[ChargerCatalog] = None,
+) -> pd.DataFrame:
+    """
+    Perturba ogni parametro di ±`variazione` (relativa) e valuta tutte le
+    perturbazioni in un'unica chiamata vettoriale. Restituisce una riga per
+    parametro, ordinata per ampiezza dell'effetto (dati del grafico tornado),
+    con l'elasticità da differenze finite e, per il profitto, quella analitica.
+    """
+    parametri = list(parametri or _parametri_sensitivita(catalogo))
+    n = 1 + 2 * len(parametri)
+    colonne = {k: np.repeat(np.asarray(params[k], dtype=float), n) for k in _chiavi_parametri(catalogo)}
+    for i, k in enumerate(parametri):
+        colonne[k][1 + 2 * i] *= 1 - variazione
+        colonne[k][2 + 2 * i] *= 1 + variazione
+    valori = compute_performance_arrays(colonne, catalogo=catalogo)[metrica].astype(float)
+
+    base = valori[0]
+    giu, su = valori[1::2], valori[2::2]
+    df = pd.DataFrame({
+        'parametro': parametri,
+        'valore_base': [params[k] for k in parametri],
+        'metrica_giu': giu,
+        'metrica_su': su,
+        'delta_giu': giu - base,
+        'delta_su': su - base,
+    })
+    df['ampiezza'] = np.abs(su - giu)
+    df['elasticita'] = (su - giu) / (2 * variazione * base) if base != 0 else np.nan
+
+    base_colonne = _colonne_scenari(params, catalogo)
+    df['limite_vincolante'] = LIMITI[int(identify_binding_limit(base_colonne, catalogo)[0])]
+    if metrica == 'profitto_netto_annuo':
+        elasticita = profit_elasticities(base_colonne, parametri, catalogo)
+        df['elasticita_analitica'] = [float(elasticita[k][0]) for k in parametri]
+    df.attrs['metrica_base'] = float(base)
+    return df.sort_values('ampiezza', ascending=False, ignore_index=True)
+
+
+def sensitivity_analysis_batch(
+    scenari: pd.DataFrame,
+    parametri: Optional[Sequence[str]] = None,
+    catalogo: Optional[ChargerCatalog] = None,
+) -> pd.DataFrame:
+    """
+    Elasticità analitiche del profitto e limite vincolante per molti siti, senza
+    alcuna valutazione aggiuntiva del modello: una colonna `elasticita_<parametro>`
+    per parametro più `limite_vincolante`.
+    """
+    colonne = _colonne_scenari(scenari, catalogo)
+    elasticita = profit_elasticities(colonne, parametri, catalogo)
+    df = pd.DataFrame({f"elasticita_{k}": v for k, v in elasticita.items()}, index=scenari.index)
+    df['limite_vincolante'] = np.asarray(LIMITI)[identify_binding_limit(colonne, catalogo)]
+    return df
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# I moduli del progetto sono file nella radice del repository (nessun pacchetto installabile)
+RADICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RADICE not in sys.path:
+    sys.path.insert(0, RADICE)
+
+# Nessun archivio persistente condiviso durante i test: ogni test apre il proprio
+os.environ['AIJOSA_RESULT_STORE'] = ''
+os.environ.setdefault('AIJOSA_METRICHE', '')
+
+
+@pytest.fixture
+def params():
+    """Scenario di riferimento con i default dell'interfaccia (una copia per test)."""
+    return {
+        'num_auto_giorno': 50, 'kwh_per_auto': 30, 'tempo_ricarica_media': 2.0, 'tempo_turnover': 0.25,
+        'ore_disponibili': 8, 'giorni_attivi': 260, 'prezzo_vendita': 0.25, 'costo_acquisto_energia_kwh': 0.15,
+        'utilizzo_percentuale': 85, 'budget': 20000,
+        'ac_22': 2, 'dc_20': 0, 'dc_30': 0, 'dc_40': 0, 'dc_60': 0, 'dc_90': 0,
+        'costo_manutenzione_annuale': 500, 'costo_software_annuale': 1000, 'costo_assicurazione_annuale': 200,
+        'costo_terreno_annuale': 0, 'vita_utile_anni': 10,
+    }
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from catalog import catalog_from_records
+from grid_sharing import calculate_charging_point_performance_grid, grid_cap_sweep
+from performance import TIPI_COLONNINE, calculate_charging_point_performance, compute_performance_arrays, _colonne_scenari
+from queue_simulation import calculate_charging_point_performance_simulated
+from sensitivity import profit_gradient, sensitivity_analysis, sensitivity_analysis_batch
+
+# Catalogo con un tipo assente dal default (e una curva di potenza): i motori
+# devono leggerlo dal catalogo ricevuto, non dalle costanti del default
+CATALOGO = catalog_from_records([
+    {'tipo': 'ac_11', 'potenza_kw': 11, 'prezzo_eur': 600},
+    {'tipo': 'dc_150', 'potenza_kw': 150, 'prezzo_eur': 40000, 'curva': [[0, 1], [0.6, 1], [1, 0.3]]},
+])
+
+
+@pytest.fixture
+def params_catalogo(params):
+    p = {k: v for k, v in params.items() if k not in TIPI_COLONNINE}
+    return dict(p, num_auto_giorno=80, ac_11=2, dc_150=1)
+
+
+def test_simulated_engine_uses_catalog(params_catalogo):
+    r = calculate_charging_point_performance_simulated(params_catalogo, giorni=30, catalogo=CATALOGO)
+    analitico = calculate_charging_point_performance(params_catalogo, CATALOGO)
+    assert set(r['sim_utilizzo_per_tipo']) == {'ac_11', 'dc_150'}
+    assert r['costo_totale_investimento'] == analitico['costo_totale_investimento']
+    assert 0 < r['auto_servite'] <= params_catalogo['num_auto_giorno']
+
+
+def test_grid_engine_uses_catalog(params_catalogo):
+    libera = calculate_charging_point_performance_grid(params_catalogo, catalogo=CATALOGO)
+    limitata = calculate_charging_point_performance_grid(params_catalogo, 50, 'priorita', ['dc_150'], catalogo=CATALOGO)
+    assert libera['costo_totale_investimento'] == calculate_charging_point_performance(params_catalogo, CATALOGO)['costo_totale_investimento']
+    assert libera['rete_potenza_richiesta_picco_kw'] > 2 * 11 # Anche la dc_150 assorbe potenza
+    assert limitata['rete_potenza_picco_kw'] <= 50 + 1e-9
+    with pytest.raises(ValueError):
+        calculate_charging_point_performance_grid(params_catalogo, 50, 'priorita', ['dc_90'], catalogo=CATALOGO)
+
+    sweep = grid_cap_sweep(params_catalogo, [30, 300], catalogo=CATALOGO)
+    assert list(sweep.columns[:3]) == ['ac_11', 'dc_150', 'potenza_connessione_kw']
+    assert sweep['energia_erogata_annuo'].is_monotonic_increasing
+
+
+def test_sensitivity_uses_catalog(params_catalogo):
+    df = sensitivity_analysis(params_catalogo, catalogo=CATALOGO)
+    assert {'ac_11', 'dc_150'} <= set(df['parametro'])
+    assert not set(TIPI_COLONNINE) & set(df['parametro'])
+
+    # Derivata rispetto al nuovo tipo: confronto con la differenza finita del modello
+    # (il profitto è lineare nel numero di colonnine finché il limite vincolante non cambia)
+    params_sessioni = dict(params_catalogo, num_auto_giorno=500)
+    colonne = _colonne_scenari(params_sessioni, CATALOGO)
+    gradiente = profit_gradient(colonne, CATALOGO)['dc_150'][0]
+    profitto = lambda n: compute_performance_arrays(_colonne_scenari(dict(params_sessioni, dc_150=n), CATALOGO), catalogo=CATALOGO)['profitto_netto_annuo'][0]
+    assert gradiente == pytest.approx((profitto(1.001) - profitto(1.0)) / 0.001, rel=1e-3)
+
+    batch = sensitivity_analysis_batch(pd.DataFrame([params_catalogo] * 3), catalogo=CATALOGO)
+    assert 'elasticita_dc_150' in batch and np.isfinite(batch['elasticita_dc_150']).all()
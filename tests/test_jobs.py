@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+
+from jobs import ANNULLATO, COMPLETATO, ERRORE, JobQueueFull, JobRunner, single_step
+
+
+def _attendi(job, timeout=10.0):
+    fine = time.monotonic() + timeout
+    while job.attivo and time.monotonic() < fine:
+        time.sleep(0.01)
+    assert not job.attivo
+
+
+def _bloccato(evento):
+    """Job che resta in esecuzione finché `evento` non è impostato."""
+    def passi():
+        evento.wait(10)
+        yield 1.0, 'fatto'
+    return passi
+
+
+def test_progress_and_result():
+    runner = JobRunner(max_concorrenti=1)
+    job = runner.submit('s', 'a', lambda: ((i / 4, i) for i in range(1, 5)))
+    _attendi(job)
+    assert job.stato == COMPLETATO and job.risultato == 4 and job.avanzamento == 1.0
+    job = runner.submit('s', 'b', single_step(lambda: 'unico'))
+    _attendi(job)
+    assert job.risultato == 'unico'
+
+
+def test_error_is_reported():
+    runner = JobRunner(max_concorrenti=1)
+    job = runner.submit('s', 'a', single_step(lambda: 1 / 0))
+    _attendi(job)
+    assert job.stato == ERRORE and isinstance(job.errore, ZeroDivisionError) and job.risultato is None
+
+
+def test_cancel_stops_at_next_step():
+    runner = JobRunner(max_concorrenti=1)
+    passo, chiuso = threading.Event(), threading.Event()
+
+    def passi():
+        try:
+            for i in range(1000):
+                passo.set()
+                time.sleep(0.01)
+                yield i / 1000, i
+        finally:
+            chiuso.set()
+
+    job = runner.submit('s', 'a', passi)
+    assert passo.wait(5)
+    job.cancel()
+    _attendi(job)
+    assert job.stato == ANNULLATO and job.risultato is None
+    assert chiuso.is_set() # Il generatore è stato chiuso
+
+
+def test_new_submission_replaces_previous():
+    runner = JobRunner(max_concorrenti=1)
+    libera = threading.Event()
+    primo = runner.submit('s', 'a', _bloccato(libera))
+    secondo = runner.submit('s', 'a', single_step(lambda: 2))
+    assert primo.annullato and runner.get('s', 'a') is secondo
+    libera.set()
+    _attendi(primo)
+    _attendi(secondo)
+    assert primo.stato == ANNULLATO and secondo.risultato == 2
+
+
+def test_quotas():
+    runner = JobRunner(max_concorrenti=1, max_in_attesa=1, max_per_sessione=2)
+    libera = threading.Event()
+    try:
+        primo = runner.submit('s1', 'a', _bloccato(libera))
+        runner.submit('s1', 'b', _bloccato(libera))
+        with pytest.raises(JobQueueFull):
+            runner.submit('s1', 'c', _bloccato(libera)) # Quota della sessione
+        with pytest.raises(JobQueueFull):
+            runner.submit('s2', 'a', _bloccato(libera)) # Server: 1 in corso + 1 in attesa
+        assert not primo.annullato # Una richiesta rifiutata non tocca i job attivi
+        # La sostituzione di un job attivo non conta nella quota
+        runner.submit('s1', 'a', _bloccato(libera))
+        assert primo.annullato
+        assert runner.stats()['in_coda'] + runner.stats()['in_corso'] == 2
+    finally:
+        libera.set()
@@ -0,0 +1,73 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from montecarlo import QuantileSketch, iter_monte_carlo, run_monte_carlo
+from performance import calculate_charging_point_performance
+
+DISTRIBUZIONI = {
+    'num_auto_giorno': ('normal', 50, 15),
+    'kwh_per_auto': ('uniform', 20, 40),
+    'prezzo_vendita': ('triangular', 0.20, 0.25, 0.35),
+}
+
+
+def _uguali(a, b):
+    pd.testing.assert_frame_equal(a['sintesi'], b['sintesi'])
+    assert a['probabilita_perdita'] == b['probabilita_perdita']
+    assert a['n_estrazioni'] == b['n_estrazioni']
+    for m, sketch in a['sketch'].items():
+        assert np.array_equal(sketch.positivi, b['sketch'][m].positivi)
+        assert np.array_equal(sketch.negativi, b['sketch'][m].negativi)
+
+
+def test_same_seed_same_result_for_any_n_jobs(params):
+    opzioni = dict(n_estrazioni=45_000, seed=7, dimensione_blocco=10_000)
+    seriale = run_monte_carlo(params, DISTRIBUZIONI, n_jobs=1, **opzioni)
+    _uguali(seriale, run_monte_carlo(params, DISTRIBUZIONI, n_jobs=2, **opzioni))
+    _uguali(seriale, run_monte_carlo(params, DISTRIBUZIONI, n_jobs=1, **opzioni))
+    assert not run_monte_carlo(params, DISTRIBUZIONI, n_jobs=1, **dict(opzioni, seed=8))['sintesi'].equals(seriale['sintesi'])
+
+
+def test_partial_results_end_with_the_full_run(params):
+    parziali = list(iter_monte_carlo(params, DISTRIBUZIONI, 30_000, seed=3, n_jobs=1, dimensione_blocco=10_000))
+    assert [p['n_estrazioni'] for p in parziali] == [10_000, 20_000, 30_000]
+    assert all(p['n_richieste'] == 30_000 for p in parziali)
+    _uguali(parziali[-1], run_monte_carlo(params, DISTRIBUZIONI, 30_000, seed=3, n_jobs=1, dimensione_blocco=10_000))
+
+
+def test_fixed_distributions_reproduce_the_deterministic_model(params):
+    # Variabilità nulla, anche come triangolare di ampiezza zero: tutte le estrazioni uguali al modello
+    fisse = {'num_auto_giorno': ('fixed', params['num_auto_giorno']), 'prezzo_vendita': ('triangular', 0.25, 0.25, 0.25)}
+    r = run_monte_carlo(params, fisse, 5_000, n_jobs=1)
+    atteso = calculate_charging_point_performance(params)['profitto_netto_annuo']
+    sintesi = r['sintesi'].loc['profitto_netto_annuo']
+    assert sintesi['min'] == sintesi['max'] == pytest.approx(atteso)
+    assert sintesi['P50'] == pytest.approx(atteso, rel=0.005)
+    assert r['probabilita_perdita'] == (1.0 if atteso <= 0 else 0.0)
+
+
+@pytest.mark.parametrize('distribuzioni', [
+    {'budget': ('fixed', 1)},
+    {'kwh_per_auto': ('lognormal', 1, 2)},
+    {'kwh_per_auto': ('uniform', 1)},
+])
+def test_invalid_distributions(params, distribuzioni):
+    with pytest.raises(ValueError):
+        run_monte_carlo(params, distribuzioni, 10, n_jobs=1)
+
+
+def test_quantile_sketch_relative_error():
+    rng = np.random.default_rng(0)
+    valori = np.concatenate([rng.lognormal(8, 1.5, 50_000), -rng.lognormal(6, 1, 10_000), np.zeros(100), [np.inf] * 10])
+    sketch = QuantileSketch()
+    for blocco in np.array_split(rng.permutation(valori), 7):
+        sketch.add(blocco)
+    ordinati = np.sort(valori)
+    for q in (0.01, 0.1, 0.5, 0.9, 0.99):
+        esatto = ordinati[int(q * (len(valori) - 1))]
+        assert sketch.quantile(q) == pytest.approx(esatto, rel=2 * sketch.accuratezza)
+    assert sketch.quantile(1.0) == math.inf
+    assert sketch.conteggio == len(valori)
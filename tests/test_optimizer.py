@@ -0,0 +1,62 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from optimizer import OBIETTIVI, enumerate_charger_mixes, optimize_charger_mix
+from performance import TIPI_COLONNINE, calculate_charging_point_performance_batch
+
+# Limiti ridotti: l'enumerazione esaustiva resta di poche centinaia di mix
+LIMITI = {'ac_22': 3, 'dc_20': 2, 'dc_30': 2, 'dc_40': 2, 'dc_60': 2, 'dc_90': 2}
+
+
+def _forza_bruta(params, obiettivo, top_k):
+    """Valori dell'obiettivo dei primi `top_k` mix, valutando tutti i mix entro il budget."""
+    colonna, massimizza = OBIETTIVI[obiettivo]
+    mix = pd.DataFrame(list(itertools.product(*(range(LIMITI[t] + 1) for t in TIPI_COLONNINE))), columns=list(TIPI_COLONNINE))
+    scenari = mix.assign(**{k: v for k, v in params.items() if k not in TIPI_COLONNINE})
+    risultati = calculate_charging_point_performance_batch(scenari)
+    risultati = risultati[risultati['costo_totale_investimento'] <= params['budget']]
+    valore = risultati[colonna].to_numpy(dtype=float)
+    ordine = np.lexsort((risultati['costo_totale_investimento'].to_numpy(), -valore if massimizza else valore))
+    return valore[ordine[:top_k]]
+
+
+def _scenari_casuali(n, seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(n):
+        yield {
+            'num_auto_giorno': int(rng.integers(1, 40)),
+            'kwh_per_auto': float(rng.choice([20, 40, 60])),
+            'budget': float(rng.choice([20_000, 60_000, 150_000])),
+            'prezzo_vendita': float(rng.choice([0.12, 0.2, 0.5, 0.8])),
+        }
+
+
+@pytest.mark.parametrize('obiettivo', list(OBIETTIVI))
+@pytest.mark.parametrize('top_k', [1, 5])
+def test_optimizer_matches_brute_force(params, obiettivo, top_k):
+    for variazione in _scenari_casuali(25):
+        p = dict(params, **variazione)
+        trovati = optimize_charger_mix(p, obiettivo, top_k, limiti=LIMITI)
+        colonna = OBIETTIVI[obiettivo][0]
+        np.testing.assert_array_equal(trovati[colonna].to_numpy(dtype=float), _forza_bruta(p, obiettivo, top_k), err_msg=str(p))
+
+
+def test_low_demand_top_k_keeps_saturated_extensions(params):
+    # 2 auto/giorno: i mix oltre la saturazione servono ancora 2 auto e devono restare in classifica
+    p = dict(params, num_auto_giorno=2, kwh_per_auto=60, budget=20_000)
+    trovati = optimize_charger_mix(p, 'auto_servite', 5, limiti=LIMITI)
+    assert trovati['auto_servite'].tolist() == [2, 2, 2, 2, 2]
+
+
+def test_enumeration_respects_budget_and_limits(params):
+    p = dict(params, budget=60_000)
+    conteggi = enumerate_charger_mixes(p, LIMITI, potatura_saturazione=False)
+    risultati = calculate_charging_point_performance_batch(
+        pd.DataFrame(conteggi.astype(np.int64), columns=list(TIPI_COLONNINE)).assign(**{k: v for k, v in p.items() if k not in TIPI_COLONNINE})
+    )
+    assert (risultati['costo_totale_investimento'] <= p['budget']).all()
+    assert (conteggi <= np.array([LIMITI[t] for t in TIPI_COLONNINE])).all()
+    assert len({tuple(r) for r in conteggi}) == conteggi.shape[0]
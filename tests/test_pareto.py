@@ -0,0 +1,79 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pareto import CAMPIONE_SKYLINE, HARDWARE_CACHE, OBIETTIVI_PARETO, pareto_frontier, skyline
+from performance import TIPI_COLONNINE, calculate_charging_point_performance_batch
+
+LIMITI = {'ac_22': 3, 'dc_20': 1, 'dc_30': 1, 'dc_40': 1, 'dc_60': 2, 'dc_90': 2}
+
+
+def _skyline_forza_bruta(valori, massimizza=None):
+    """Confronto di ogni riga con tutte le altre; tra righe identiche resta la prima."""
+    v = np.asarray(valori, dtype=float)
+    if massimizza is not None:
+        v = v * np.where(massimizza, -1.0, 1.0)
+    v = np.where(np.isnan(v), np.inf, v)
+    tenuti, visti = [], set()
+    for i in range(v.shape[0]):
+        dominata = ((v <= v[i]).all(axis=1) & (v < v[i]).any(axis=1)).any()
+        if not dominata and tuple(v[i]) not in visti:
+            tenuti.append(i)
+            visti.add(tuple(v[i]))
+    return np.array(tenuti, dtype=np.int64)
+
+
+@pytest.mark.parametrize('d', [1, 2, 3, 4])
+def test_skyline_matches_brute_force(d):
+    rng = np.random.default_rng(d)
+    for prova in range(20):
+        n = int(rng.integers(1, 600))
+        valori = rng.integers(0, 10, (n, d)).astype(float)
+        valori[rng.random((n, d)) < 0.02] = np.inf
+        valori[rng.random((n, d)) < 0.02] = np.nan
+        massimizza = rng.random(d) < 0.5
+        assert np.array_equal(skyline(valori, massimizza), _skyline_forza_bruta(valori, massimizza)), prova
+
+
+def test_skyline_with_elimination_filter():
+    rng = np.random.default_rng(0)
+    n = 4 * CAMPIONE_SKYLINE + 500 # Oltre la soglia del filtro di eliminazione
+    valori = np.round(rng.random((n, 3)) * 40)
+    assert np.array_equal(skyline(valori), _skyline_forza_bruta(valori))
+    valori[:, 0] = valori[:, 1] + valori[:, 2] # Obiettivi correlati: frontiera piccola
+    assert np.array_equal(skyline(valori), _skyline_forza_bruta(valori))
+
+
+@pytest.mark.parametrize('obiettivi', [
+    ('costo_totale_investimento', 'auto_servite'),
+    ('costo_totale_investimento', 'auto_servite', 'ROI'),
+    ('auto_servite', 'tasso_utilizzo_plug', 'payback_period'),
+    tuple(OBIETTIVI_PARETO),
+])
+@pytest.mark.parametrize('num_auto_giorno', [5, 50, 400])
+def test_pareto_frontier_matches_brute_force(params, obiettivi, num_auto_giorno):
+    p = dict(params, num_auto_giorno=num_auto_giorno, budget=120_000)
+    HARDWARE_CACHE.clear()
+    df = pareto_frontier(p, obiettivi, LIMITI)
+
+    mix = pd.DataFrame(list(itertools.product(*(range(LIMITI[t] + 1) for t in TIPI_COLONNINE))), columns=list(TIPI_COLONNINE))
+    tutti = calculate_charging_point_performance_batch(mix.assign(**{k: v for k, v in p.items() if k not in TIPI_COLONNINE}))
+    tutti = pd.concat([mix, tutti], axis=1)[lambda d: d['entro_budget']].reset_index(drop=True)
+    valori = tutti[[OBIETTIVI_PARETO[o][0] for o in obiettivi]].to_numpy(dtype=float)
+    atteso = tutti.iloc[_skyline_forza_bruta(valori, [OBIETTIVI_PARETO[o][1] for o in obiettivi])]
+
+    # Tra mix con gli stessi obiettivi la frontiera ne tiene uno qualsiasi: si confrontano i valori
+    colonne = [OBIETTIVI_PARETO[o][0] for o in obiettivi]
+    chiavi = lambda d: sorted(map(tuple, d[colonne].to_numpy(dtype=float).round(9).tolist()))
+    assert chiavi(df) == chiavi(atteso)
+    assert df['costo_totale_investimento'].is_monotonic_increasing
+
+    # Ogni riga riporta i risultati del proprio mix
+    righe = pd.merge(df[list(TIPI_COLONNINE)], tutti, on=list(TIPI_COLONNINE), how='left')
+    pd.testing.assert_frame_equal(
+        df.drop(columns=list(TIPI_COLONNINE)).reset_index(drop=True),
+        righe[df.columns.drop(list(TIPI_COLONNINE))].reset_index(drop=True),
+        check_dtype=False,
+    )
@@ -0,0 +1,167 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from catalog import catalog_from_records
+from performance import (
+    RESULT_KEYS, TIPI_COLONNINE, calculate_charging_point_performance, calculate_charging_point_performance_batch,
+)
+
+# Catalogo con curve di potenza: attiva il ramo delle colonnine equivalenti
+CATALOGO_CURVE = catalog_from_records([
+    {'tipo': 'ac_22', 'potenza_kw': 22, 'prezzo_eur': 1000},
+    {'tipo': 'dc_50', 'potenza_kw': 50, 'prezzo_eur': 14000, 'curva': [[0, 1], [0.8, 1], [1, 0.4]]},
+    {'tipo': 'dc_150', 'potenza_kw': 150, 'prezzo_eur': 40000, 'curva': [[0, 0.9], [0.5, 1], [1, 0.2]]},
+])
+
+# Casi limite dei rami condizionali del modello (divisioni per zero, payback, budget)
+CASI_LIMITE = {
+    'nessuna_colonnina': {t: 0 for t in TIPI_COLONNINE},
+    'slot_nullo': {'tempo_ricarica_media': 0, 'tempo_turnover': 0},
+    'kwh_nulli': {'kwh_per_auto': 0},
+    'nessuna_auto': {'num_auto_giorno': 0},
+    'vita_nulla': {'vita_utile_anni': 0},
+    'profitto_negativo': {'prezzo_vendita': 0.10},
+    'payback_oltre_vita': {'vita_utile_anni': 1, 'dc_90': 2},
+    # Nessuna energia e costi fissi negativi: profitto 860 €, payback esattamente pari alla vita (10 anni)
+    'payback_pari_vita': {'num_auto_giorno': 0, 'costo_manutenzione_annuale': -2920},
+    'utilizzo_nullo': {'utilizzo_percentuale': 0},
+    'ore_nulle': {'ore_disponibili': 0},
+    'budget_esatto': {'budget': 2 * (1000 + 22 * 150)},
+    'limite_energia': {'num_auto_giorno': 500, 'utilizzo_percentuale': 10},
+    'limite_sessioni': {'num_auto_giorno': 500, 'tempo_ricarica_media': 4.0},
+    'decimali': {'ac_22': 1.5, 'num_auto_giorno': 37.5, 'kwh_per_auto': 17.3},
+}
+
+
+def _confronta(scalare, vettoriale):
+    assert set(scalare) == set(RESULT_KEYS)
+    for k in RESULT_KEYS:
+        atteso = vettoriale[k]
+        if isinstance(atteso, (float, np.floating)) and math.isnan(atteso):
+            assert math.isnan(scalare[k]), k
+        else:
+            assert scalare[k] == atteso, k
+
+
+@pytest.mark.parametrize('catalogo', [None, CATALOGO_CURVE], ids=['default', 'curve'])
+@pytest.mark.parametrize('caso', list(CASI_LIMITE))
+def test_scalar_matches_vector_on_edge_cases(params, caso, catalogo):
+    p = dict(params, **CASI_LIMITE[caso])
+    if catalogo is not None:
+        # Stesso caso sul catalogo con curve: le DC del default diventano una dc_50 e una dc_150
+        dc = 0 if caso == 'nessuna_colonnina' else 1
+        p = dict({k: v for k, v in p.items() if not k.startswith('dc_')}, dc_50=dc, dc_150=dc)
+    vettoriale = calculate_charging_point_performance_batch(pd.DataFrame([p]), catalogo).iloc[0]
+    _confronta(calculate_charging_point_performance(p, catalogo), vettoriale)
+
+
+def test_scalar_keeps_native_types(params):
+    r = calculate_charging_point_performance(params)
+    assert all(type(v) in (int, float, bool) for v in r.values())
+    # Ingressi interi: CapEx e potenza restano int come nel modello originale
+    assert type(r['costo_totale_investimento']) is int and type(r['potenza_totale_kw']) is int
+
+    # Una riga di DataFrame porta scalari NumPy: stesso risultato, tipi nativi
+    riga = pd.DataFrame([params]).iloc[0].to_dict()
+    assert calculate_charging_point_performance(riga) == r
+    assert all(type(v) in (int, float, bool) for v in calculate_charging_point_performance(riga).values())
+
+
+def test_scalar_reports_missing_keys(params):
+    with pytest.raises(KeyError, match='dc_90'):
+        calculate_charging_point_performance({k: v for k, v in params.items() if k != 'dc_90'})
+
+
+def _modello_originale(p):
+    """Modello del baseline (prima del motore vettoriale), sul catalogo di default: riferimento dei test."""
+    potenza = {'ac_22': 22, 'dc_20': 20, 'dc_30': 30, 'dc_40': 40, 'dc_60': 60, 'dc_90': 90}
+    prezzo = {'ac_22': 1000, 'dc_20': 8000, 'dc_30': 12000, 'dc_40': 15000, 'dc_60': 18000, 'dc_90': 25000}
+    potenza_totale_kw = sum(p[t] * potenza[t] for t in potenza)
+    costo_colonnine = sum(p[t] * prezzo[t] for t in prezzo)
+    costo_installazione = potenza_totale_kw * 150
+    costo_totale_investimento = costo_colonnine + costo_installazione
+
+    energia_massima_capacita = potenza_totale_kw * p['ore_disponibili'] * (p['utilizzo_percentuale'] / 100)
+    tempo_totale_slot = p['tempo_ricarica_media'] + p['tempo_turnover']
+    num_totale_colonnine = sum(p[t] for t in potenza)
+    if tempo_totale_slot > 0 and num_totale_colonnine > 0:
+        sessioni_massime_giorno = (num_totale_colonnine * p['ore_disponibili']) / tempo_totale_slot
+        energia_massima_sessioni = sessioni_massime_giorno * p['kwh_per_auto']
+    else:
+        sessioni_massime_giorno = energia_massima_sessioni = 0
+
+    energia_erogata_giorno = min(p['num_auto_giorno'] * p['kwh_per_auto'], energia_massima_capacita, energia_massima_sessioni)
+    energia_erogata_annuo = energia_erogata_giorno * p['giorni_attivi']
+    auto_servite = math.floor(energia_erogata_giorno / p['kwh_per_auto']) if p['kwh_per_auto'] > 0 else 0
+
+    guadagno_annuo = energia_erogata_annuo * p['prezzo_vendita']
+    costo_operativo_energia_annuo = energia_erogata_annuo * p['costo_acquisto_energia_kwh']
+    costo_ammortamento_annuo = costo_totale_investimento / p['vita_utile_anni'] if p['vita_utile_anni'] > 0 else costo_totale_investimento
+    costo_operativo_totale_annuo = (
+        costo_operativo_energia_annuo + p['costo_manutenzione_annuale'] + p['costo_software_annuale'] +
+        p['costo_assicurazione_annuale'] + p['costo_terreno_annuale'] + costo_ammortamento_annuo
+    )
+    profitto_netto_annuo = guadagno_annuo - costo_operativo_totale_annuo
+    payback_period = costo_totale_investimento / profitto_netto_annuo if profitto_netto_annuo > 0 else float('inf')
+    return {
+        'potenza_totale_kw': potenza_totale_kw,
+        'energia_erogata_annuo': energia_erogata_annuo,
+        'auto_servite': auto_servite,
+        'auto_non_servite': max(0, p['num_auto_giorno'] - auto_servite),
+        'guadagno_annuo': guadagno_annuo,
+        'costo_totale_investimento': costo_totale_investimento,
+        'costo_operativo_totale_annuo': costo_operativo_totale_annuo,
+        'profitto_netto_annuo': profitto_netto_annuo,
+        'ROI': (profitto_netto_annuo / costo_totale_investimento) * 100 if costo_totale_investimento > 0 else 0,
+        'payback_period': float('inf') if payback_period > p['vita_utile_anni'] else payback_period,
+        'entro_budget': costo_totale_investimento <= p['budget'],
+        'tasso_utilizzo_energetico': (energia_erogata_giorno / energia_massima_capacita) * 100 if energia_massima_capacita > 0 else 0,
+        'tasso_utilizzo_plug': (auto_servite / sessioni_massime_giorno) * 100 if sessioni_massime_giorno > 0 else 0,
+        'costo_operativo_energia_annuo': costo_operativo_energia_annuo,
+        'costo_ammortamento_annuo': costo_ammortamento_annuo,
+        'costo_colonnine': costo_colonnine,
+        'costo_installazione': costo_installazione,
+    }
+
+
+def _scenari_casuali(n, seed=0):
+    """Scenari con conteggi interi e valori nulli frequenti, per coprire tutti i rami del modello."""
+    rng = np.random.default_rng(seed)
+    nulli = lambda valori: np.where(rng.random(n) < 0.05, 0, valori)
+    scenari = pd.DataFrame({
+        'num_auto_giorno': nulli(rng.integers(1, 400, n)),
+        'kwh_per_auto': nulli(rng.uniform(5, 80, n).round(1)),
+        'tempo_ricarica_media': nulli(rng.uniform(0.25, 6, n).round(2)),
+        'tempo_turnover': nulli(rng.uniform(0, 1, n).round(2)),
+        'ore_disponibili': nulli(rng.integers(1, 25, n)),
+        'giorni_attivi': rng.integers(0, 366, n),
+        'prezzo_vendita': rng.uniform(0.1, 0.8, n).round(3),
+        'costo_acquisto_energia_kwh': rng.uniform(0.05, 0.4, n).round(3),
+        'utilizzo_percentuale': nulli(rng.integers(1, 101, n)),
+        'budget': rng.integers(0, 300_000, n),
+        **{t: rng.integers(0, 6, n) * (rng.random(n) < 0.6) for t in TIPI_COLONNINE},
+        'costo_manutenzione_annuale': rng.integers(0, 5000, n),
+        'costo_software_annuale': rng.integers(0, 3000, n),
+        'costo_assicurazione_annuale': rng.integers(0, 1000, n),
+        'costo_terreno_annuale': rng.integers(0, 10_000, n),
+        'vita_utile_anni': nulli(rng.integers(1, 21, n)),
+    })
+    return scenari
+
+
+def test_batch_and_scalar_match_the_original_model_on_20k_scenarios():
+    scenari = _scenari_casuali(20_000)
+    batch = calculate_charging_point_performance_batch(scenari)
+    righe = scenari.to_dict(orient='records')
+    atteso = pd.DataFrame([_modello_originale(r) for r in righe])
+    pd.testing.assert_frame_equal(batch[list(RESULT_KEYS)], atteso[list(RESULT_KEYS)], check_dtype=False, rtol=1e-12)
+
+    # Il percorso scalare conserva anche i tipi del modello originale (int per CapEx e potenza)
+    for r in righe[:2000]:
+        r = {k: v.item() if isinstance(v, np.generic) else v for k, v in r.items()}
+        scalare, originale = calculate_charging_point_performance(r), _modello_originale(r)
+        assert scalare == originale
+        assert {k: type(v) for k, v in scalare.items()} == {k: type(v) for k, v in originale.items()}
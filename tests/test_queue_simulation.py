@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from performance import calculate_charging_point_performance
+from queue_simulation import _durate_sessione, simulate_plug_queue
+
+
+def test_session_duration_ignores_availability(params):
+    # Disponibilità dei posti, non potenza ridotta: la durata della sessione non cambia
+    potenze = np.array([22.0, 90.0])
+    lunghe = dict(params, kwh_per_auto=60)
+    assert np.array_equal(_durate_sessione(dict(lunghe, utilizzo_percentuale=50), potenze),
+                          _durate_sessione(dict(lunghe, utilizzo_percentuale=100), potenze))
+    assert _durate_sessione(lunghe, potenze).tolist() == [60 / 22 + 0.25, 2.0 + 0.25]
+
+
+def test_availability_scales_plug_hours_like_the_analytic_engine(params):
+    # Domanda ben oltre la capacità e pazienza ampia: i posti restano sempre occupati, quindi le
+    # ore di servizio seguono la disponibilità come la capacità energetica del motore analitico
+    satura = dict(params, num_auto_giorno=400, kwh_per_auto=60, ac_22=6)
+    completa = simulate_plug_queue(dict(satura, utilizzo_percentuale=100), giorni=400, pazienza_ore=8)
+    ridotta = simulate_plug_queue(dict(satura, utilizzo_percentuale=70), giorni=400, pazienza_ore=8)
+    assert ridotta['auto_servite_media'] / completa['auto_servite_media'] == pytest.approx(0.7, abs=0.03)
+
+    analitico = [calculate_charging_point_performance(dict(satura, utilizzo_percentuale=u))['energia_erogata_annuo'] for u in (100, 70)]
+    assert analitico[1] / analitico[0] == pytest.approx(0.7)
+
+
+def test_same_arrivals_for_any_availability(params):
+    a = simulate_plug_queue(dict(params, utilizzo_percentuale=100), giorni=50, seed=3)
+    b = simulate_plug_queue(dict(params, utilizzo_percentuale=60), giorni=50, seed=3)
+    assert np.array_equal(a['arrivi_giorno'], b['arrivi_giorno'])
+    assert simulate_plug_queue(dict(params, utilizzo_percentuale=0), giorni=50)['auto_servite_media'] == 0
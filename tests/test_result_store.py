@@ -0,0 +1,110 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import result_store
+from grid_sharing import calculate_charging_point_performance_grid
+from hourly import calculate_charging_point_performance_hourly
+from performance import calculate_charging_point_performance, calculate_charging_point_performance_batch
+from queue_simulation import calculate_charging_point_performance_simulated
+from result_store import ResultStore, scenario_key, scenario_keys
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResultStore(str(tmp_path / 'risultati.sqlite'))
+
+
+def _motori(params):
+    """Motori dell'interfaccia i cui risultati passano dall'archivio (JSON)."""
+    domanda = 1 + np.sin(np.arange(8760) / 24 * 2 * np.pi) ** 2
+    return {
+        'analitico': lambda: calculate_charging_point_performance(params),
+        'simulazione': lambda: calculate_charging_point_performance_simulated(params, giorni=20),
+        'orario': lambda: calculate_charging_point_performance_hourly(params, domanda),
+        'rete': lambda: calculate_charging_point_performance_grid(params, 30),
+    }
+
+
+@pytest.mark.parametrize('motore', ['analitico', 'simulazione', 'orario', 'rete'])
+def test_hit_equals_miss(store, params, motore):
+    calcola = _motori(params)[motore]
+    chiave = scenario_key(params, motore)
+    mancato = store.get_or_compute(chiave, calcola)
+    trovato = store.get_or_compute(chiave, lambda: pytest.fail("risultato non letto dall'archivio"))
+    assert trovato == mancato
+    assert {k: type(v) for k, v in trovato.items()} == {k: type(v) for k, v in mancato.items()}
+
+
+def test_simulated_histogram_survives_store(store, params):
+    chiave = scenario_key(params, 'simulazione')
+    store.put(chiave, calculate_charging_point_performance_simulated(params, giorni=20))
+    conteggi, bordi = store.get(chiave)['sim_istogramma_attese']
+    # Come nel grafico delle attese di main.py
+    df = pd.DataFrame({'Attesa': np.asarray(bordi[:-1]) * 60, 'Auto': conteggi})
+    assert len(df) == len(bordi) - 1
+    assert df['Attesa'].iloc[1] == pytest.approx(bordi[1] * 60)
+
+
+def test_keys_are_normalized(params):
+    chiave = scenario_key(params)
+    assert scenario_key(dict(reversed(list(params.items())))) == chiave
+    assert scenario_key({k: float(v) for k, v in params.items()}) == chiave
+    assert scenario_key(params, 'simulazione') != chiave
+    assert scenario_keys(pd.DataFrame([params, params])) == [chiave, chiave]
+
+
+def test_frame_round_trip_and_mixed_formats(store, params):
+    scenari = pd.DataFrame([dict(params, num_auto_giorno=n) for n in range(1, 6)])
+    risultati = calculate_charging_point_performance_batch(scenari)
+    chiavi = scenario_keys(scenari)
+    store.put_frame(chiavi[:3], risultati.iloc[:3])
+    store.put(chiavi[3], calculate_charging_point_performance(scenari.iloc[3].to_dict()))
+
+    trovate, letti = store.get_frame(chiavi)
+    assert trovate.tolist() == [True, True, True, True, False]
+    pd.testing.assert_frame_equal(letti.reset_index(drop=True), risultati.iloc[:4].reset_index(drop=True), check_dtype=False)
+    # Le righe binarie si leggono anche come dict
+    assert store.get(chiavi[0]) == pytest.approx(risultati.iloc[0].to_dict())
+
+
+def test_counters_follow_inserts_replacements_and_eviction(tmp_path):
+    store = ResultStore(str(tmp_path / 'limitato.sqlite'), max_voci=100, max_byte=None)
+    store.put_many((f'k{i}', {'x': i}) for i in range(80))
+    store.put('k0', {'x': 'un valore più lungo'})
+    conn = sqlite3.connect(store.percorso)
+    assert store.stats() == dict(zip(('voci', 'byte'), conn.execute("SELECT COUNT(*), SUM(dimensione) FROM risultati").fetchone()))
+
+    store.put_many((f'n{i}', {'x': i}) for i in range(40))
+    assert len(store) == 90 # Oltre 100 voci: si scende al 90% del limite
+    assert store.stats()['byte'] == conn.execute("SELECT SUM(dimensione) FROM risultati").fetchone()[0]
+
+
+def test_eviction_keeps_recently_read_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store, 'RISOLUZIONE_ACCESSI', 0)
+    store = ResultStore(str(tmp_path / 'lru.sqlite'), max_voci=10, max_byte=None)
+    store.put_many((f'k{i}', i) for i in range(10))
+    store.get_many(['k0', 'k1'])
+    store.put('nuova', 0)
+    presenti = store.get_many(['k0', 'k1', 'k2', 'nuova'])
+    assert set(presenti) == {'k0', 'k1', 'nuova'}
+
+
+def test_byte_limit(tmp_path):
+    store = ResultStore(str(tmp_path / 'byte.sqlite'), max_voci=10**6, max_byte=10_000)
+    store.put_many((f'k{i}', 'x' * 100) for i in range(200))
+    assert store.stats()['byte'] <= 10_000
+
+
+def test_old_schema_is_migrated(tmp_path):
+    percorso = str(tmp_path / 'vecchio.sqlite')
+    conn = sqlite3.connect(percorso)
+    conn.execute("CREATE TABLE risultati (chiave TEXT PRIMARY KEY, valore TEXT NOT NULL, dimensione INTEGER NOT NULL, ultimo_accesso REAL NOT NULL)")
+    conn.execute("INSERT INTO risultati VALUES ('a', '{\"y\": 2}', 7, 0)")
+    conn.commit()
+    conn.close()
+    store = ResultStore(percorso)
+    assert store.get('a') == {'y': 2}
+    assert store.stats() == {'voci': 1, 'byte': 7}
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# ==============================================================================
+# CACHE DEI RISULTATI E DELLE FIGURE (CONDIVISA TRA SESSIONI STREAMLIT)
+#    Il modulo è importato una volta per processo server: le istanze qui sotto
+#    sopravvivono ai rerun e sono condivise da tutti gli utenti del server.
+# ==============================================================================
+
+MAX_RISULTATI = 256
+MAX_FIGURE = 1024
+
+
+def canonical_hash(oggetto: Any) -> str:
+    """
+    Hash stabile di una struttura JSON-serializzabile (dict, liste, numeri, stringhe):
+    chiavi ordinate e separatori compatti, così dizionari uguali con ordine di
+    inserimento diverso producono la stessa chiave.
+    """
+    testo = json.dumps(oggetto, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(testo.encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """
+    Cache LRU thread-safe con numero massimo di voci (eviction della meno recente).
+    Con `max_byte` e `dimensione` (byte occupati da un valore) limita anche la
+    memoria: un valore più grande del limite non viene conservato.
+    """
+
+    def __init__(self, max_voci: int, max_byte: Optional[int] = None, dimensione: Optional[Callable[[Any], int]] = None):
+        self.max_voci = max_voci
+        self.max_byte = max_byte
+        self.dimensione = dimensione
+        self._voci: 'OrderedDict[Hashable, Any]' = OrderedDict()
+        self._byte_voci: Dict[Hashable, int] = {}
+        self.byte = 0
+        self._lock = threading.Lock()
+        self.hit = 0
+        self.miss = 0
+
+    def __len__(self) -> int:
+        return len(self._voci)
+
+    def __contains__(self, chiave: Hashable) -> bool:
+        with self._lock:
+            return chiave in self._voci
+
+    def get(self, chiave: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if chiave in self._voci:
+                self._voci.move_to_end(chiave)
+                self.hit += 1
+                return self._voci[chiave]
+            self.miss += 1
+            return default
+
+    def put(self, chiave: Hashable, valore: Any) -> None:
+        byte = self.dimensione(valore) if self.dimensione is not None else 0
+        if self.max_byte is not None and byte > self.max_byte:
+            return
+        with self._lock:
+            self.byte += byte - self._byte_voci.pop(chiave, 0)
+            self._voci[chiave] = valore
+            self._voci.move_to_end(chiave)
+            self._byte_voci[chiave] = byte
+            while self._voci and (len(self._voci) > self.max_voci or (self.max_byte is not None and self.byte > self.max_byte)):
+                vecchia, _ = self._voci.popitem(last=False)
+                self.byte -= self._byte_voci.pop(vecchia)
+
+    def get_or_compute(self, chiave: Hashable, calcola: Callable[[], Any]) -> Any:
+        """
+        Restituisce il valore in cache o lo calcola e lo memorizza. Il calcolo
+        avviene fuori dal lock: due sessioni concorrenti possono calcolare la
+        stessa chiave, ma nessuna blocca le altre.
+        """
+        mancante = object()
+        valore = self.get(chiave, mancante)
+        if valore is mancante:
+            valore = calcola()
+            self.put(chiave, valore)
+        return valore
+
+    def clear(self) -> None:
+        with self._lock:
+            self._voci.clear()
+            self._byte_voci.clear()
+            self.byte = 0
+
+
+# Risultati del calcolo (dict o DataFrame, da non modificare) e figure Plotly serializzate in JSON
+RESULTS_CACHE = LRUCache(MAX_RISULTATI)
+FIGURE_CACHE = LRUCache(MAX_FIGURE)